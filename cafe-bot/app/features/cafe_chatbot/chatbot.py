@@ -1,17 +1,233 @@
-from typing import List, Dict, Generator
+import os
+import re
+import time
+import asyncio
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncGenerator, List, Dict, Generator, Optional, Tuple
+
+import numpy as np
+
+from .conversation import CONTEXT_TURNS, as_turns, new_turn, shown_item_ids
+from .loading import load_in_parallel
 from .query_understanding.constraint_extractor import LLMConstraintExtractor
 from .retrieval.retriever import CafeRAGRetriever
-from .llm.generator import GeminiLLMResponseGenerator
+from .retrieval.speculation import SpeculativeCandidates
+from .llm.generator import CONNECTION_ERROR_PREFIX, GeminiLLMResponseGenerator
+from .llm.response_cache import ResponseCache
+from .llm.semantic_cache import SemanticAnswerCache
+
+# Per-request diagnostics (constraints, retrieved count, token usage);
+# enable with logging.getLogger("app.features.cafe_chatbot").setLevel(logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Canned queries used to pay lazy model / index initialization before traffic
+WARM_UP_QUERIES = [
+    "vegan drinks",
+    "something cold under 200",
+    "hot coffee",
+]
+
+# "List everything under 200", "all vegan options": a complete attribute listing
+LISTING_PATTERN = re.compile(
+    r"\b(list|all|everything|every|anything|options|what can i (get|have))\b", re.IGNORECASE
+)
+
+# Extracted constraints the structured (no-embedding) path can answer exactly
+STRUCTURED_CONSTRAINTS = ("max_price", "min_price", "diet", "temperature", "milk")
+
+# Embedding + FAISS/BM25 are CPU-bound: they run on this many threads,
+# whatever the number of open chat streams
+RETRIEVAL_THREADS = int(os.environ.get("CAFE_RETRIEVAL_THREADS", 4))
+
+
+def is_structured_listing(user_message: str, constraints: Dict) -> bool:
+    """Budget / diet listing with no semantic part (no category hint)."""
+    if constraints.get("category_hint"):
+        return False
+    if not any(constraints.get(key) for key in STRUCTURED_CONSTRAINTS):
+        return False
+    return bool(LISTING_PATTERN.search(user_message))
+
+
+def search_filters(constraints: Dict) -> Dict:
+    """Filters of the (speculative or direct) hybrid search for these constraints."""
+    return {
+        "max_price": constraints.get("max_price"),
+        "min_price": constraints.get("min_price"),
+        "diet": constraints.get("diet"),
+        "temperature": constraints.get("temperature"),
+        "milk": constraints.get("milk"),
+    }
+
 
 class CafeChatbot:
-    def __init__(self, storage_dir: str = "storage/cafe_faiss"):
+    def __init__(self, storage_dir: str = "storage/cafe_faiss", mmap: bool = False):
         print("Initializing Cafe Chatbot...")
-        self.extractor = LLMConstraintExtractor()
-        self.retriever = CafeRAGRetriever(storage_dir)
-        self.generator = GeminiLLMResponseGenerator(model_name="gemini-3-flash-preview")
+        # Gemini clients and the retriever (model + index + metadata) are
+        # independent, so they load concurrently.
+        loaded, timings = load_in_parallel({
+            "extractor": LLMConstraintExtractor,
+            "retriever": lambda: CafeRAGRetriever(storage_dir, mmap=mmap),
+            "generator": lambda: GeminiLLMResponseGenerator(model_name="gemini-3-flash-preview"),
+        })
+        self.extractor = loaded["extractor"]
+        self.retriever = loaded["retriever"]
+        self.generator = loaded["generator"]
+
+        # Per-phase load times (seconds), reported by /health
+        self.load_timings: Dict[str, float] = dict(timings)
+        for name, seconds in self.retriever.load_timings.items():
+            self.load_timings[f"retriever.{name}"] = seconds
         
         # Internal memory for local testing (so test_sota.py works)
-        self.internal_memory: List[Dict[str, str]] = []
+        self.internal_memory: List[Dict] = []
+
+        # Retrieval (speculative and final) runs here, off the event loop,
+        # while the extractor call is out
+        self._retrieval_pool = ThreadPoolExecutor(
+            max_workers=RETRIEVAL_THREADS, thread_name_prefix="retrieval"
+        )
+        self._paths_lock = threading.Lock()
+        self.retrieval_paths: Counter = Counter()
+
+        # Same question + constraints + items + menu: replay the stored answer
+        self.response_cache = ResponseCache()
+        # Exact miss: a past answer to a paraphrase with the same constraints
+        self.semantic_cache = SemanticAnswerCache()
+
+    def _count_path(self, path: str):
+        with self._paths_lock:
+            self.retrieval_paths[path] += 1
+
+    # -----------------------------
+    # Retrieval (shared by the sync and async pipelines)
+    # -----------------------------
+
+    @staticmethod
+    def _plan(user_message: str, constraints: Dict) -> str:
+        if is_structured_listing(user_message, constraints):
+            return "structured"
+        if constraints.get("category_hint"):
+            # Routed to the hint's category/group shards; the speculative
+            # pool was searched before the hint was known, over every shard
+            return "hint_search"
+        return "speculative"
+
+    def _retrieve(
+        self,
+        user_message: str,
+        constraints: Dict,
+        path: str,
+        candidates: Optional[SpeculativeCandidates] = None,
+    ) -> List[Dict]:
+        items = None
+        if path == "structured":
+            # Exact, complete set from the price/attribute index (no embedding, no top_k)
+            items = self.retriever.list_items(
+                max_price=constraints.get("max_price"),
+                min_price=constraints.get("min_price"),
+                diet=constraints.get("diet"),
+                temperature=constraints.get("temperature"),
+                milk=constraints.get("milk"),
+            )
+            self._count_path("structured")
+        elif path == "speculative":
+            # Re-filter / re-rank the speculative candidates; None if the pool
+            # is too small for these filters
+            if candidates is not None:
+                try:
+                    items = candidates.resolve(top_k=50, **search_filters(constraints))
+                except Exception:
+                    logger.warning("Speculative candidates could not be resolved", exc_info=True)
+            self._count_path("speculative" if items is not None else "speculation_miss")
+        else:
+            self._count_path("hint_search")
+
+        if items is None:
+            # Use category_hint if available, otherwise fallback to raw user message
+            search_query = constraints.get("category_hint") or user_message
+
+            items = self.retriever.search(
+                query=search_query,
+                top_k=50,
+                **search_filters(constraints),
+                # A category hint is routed to the matching category/group shard
+                route=bool(constraints.get("category_hint")),
+            )
+        logger.debug("Retrieved %d items", len(items))
+        return items
+
+    @staticmethod
+    def _scenario(path: str, constraints: Dict) -> str:
+        """
+        The prompt's scenario A ("listing": hard constraints, every match is
+        listed) or B ("suggestion": the model curates a few).
+        """
+        if path == "structured" or any(constraints.get(key) for key in STRUCTURED_CONSTRAINTS):
+            return "listing"
+        return "suggestion"
+
+    def _start_speculation(self, user_message: str) -> Future:
+        return self._retrieval_pool.submit(self.retriever.speculate, user_message)
+
+    def _context_turns(self, earlier: List[Dict]) -> List[Dict]:
+        """The earlier turns quoted in the prompt, with the items they showed resolved."""
+        return [
+            dict(turn, items=self.retriever.items_by_id(turn["item_ids"]))
+            for turn in earlier[-CONTEXT_TURNS:]
+        ]
+
+    # -----------------------------
+    # Response cache
+    # -----------------------------
+
+    def _response_key(
+        self, user_message: str, constraints: Dict, items: List[Dict], menu_version, earlier: List[Dict]
+    ) -> Optional[tuple]:
+        """None when there is no LLM call to save (no items)."""
+        if not items:
+            return None
+        context = earlier[-CONTEXT_TURNS:]
+        return self.response_cache.key(user_message, constraints, items, menu_version, context)
+
+    def _semantic_lookup(
+        self, user_message: str, key: Optional[tuple], generation: int
+    ) -> Tuple[Optional[tuple], Optional[np.ndarray]]:
+        """
+        (cached chunks or None, query embedding). The embedding is usually
+        in the embedder's cache already (speculative retrieval computed it).
+        """
+        if key is None or not self.semantic_cache.enabled:
+            return None, None
+        vector = self.retriever.embedder.embed(user_message)
+        cached = self.semantic_cache.lookup(
+            user_message, vector, ResponseCache.scope(key), ResponseCache.item_ids(key), generation
+        )
+        return cached, vector
+
+    def _store_response(
+        self,
+        key: Optional[tuple],
+        generation: int,
+        chunks: List[str],
+        user_message: str,
+        vector: Optional[np.ndarray],
+    ):
+        # Failed generations are not kept (they would pin the error)
+        if key is None or not chunks or chunks[-1].startswith(CONNECTION_ERROR_PREFIX):
+            return
+        self.response_cache.put(key, generation, chunks)
+        if vector is not None:
+            self.semantic_cache.add(
+                user_message, vector, ResponseCache.scope(key), ResponseCache.item_ids(key), generation, chunks
+            )
+
+    # -----------------------------
+    # Pipelines
+    # -----------------------------
 
     def chat_stream(self, user_message: str, chat_history: List[Dict] = None) -> Generator[str, None, None]:
         """
@@ -20,52 +236,137 @@ class CafeChatbot:
         active_history = chat_history if chat_history is not None else self.internal_memory
         # 🔥 Immediate flush token (perceived latency fix)
         yield "…\n"
-        # 1. Extract Constraints (Context Aware)
-        constraints = self.extractor.extract(user_message, chat_history=active_history)
-        print(f"\n[DEBUG] Constraints: {constraints}")
+        # Items below come from this bundle (a reload mid-turn is not cached)
+        generation, menu_version = self.retriever.bundle_version
+        # 1. Extract Constraints (Context Aware), while the raw message is
+        # already embedded and searched speculatively
+        speculation = self._start_speculation(user_message)
+        earlier = as_turns(active_history)
+        constraints = self.extractor.extract(user_message, chat_history=earlier)
+        logger.debug("Constraints: %s", constraints)
 
         # 2. Retrieve Items
-        # Use category_hint if available, otherwise fallback to raw user message
-        search_query = constraints.get("category_hint") or user_message
-        
-        items = self.retriever.search(
-            query=search_query,
-            max_price=constraints.get("max_price"),
-            diet=constraints.get("diet"),
-            top_k=50 
-        )
-        print(f"[DEBUG] Retrieved {len(items)} items")
-        print(items)
-        # 3. Prepare history safely
-        active_history.append({"role": "user", "content": user_message})
-        assistant_msg = {"role": "assistant", "content": ""}
-        active_history.append(assistant_msg)
+        path = self._plan(user_message, constraints)
+        candidates = None
+        if path == "speculative":
+            try:
+                candidates = speculation.result()
+            except Exception:
+                logger.warning("Speculative search failed", exc_info=True)
+        else:
+            speculation.cancel()
+        items = self._retrieve(user_message, constraints, path, candidates)
 
-        # 3. Generate & Stream Response
-        # full_response = ""
+        # 3. Record this turn (its shown items are filled in once answered)
+        turn = new_turn(user_message, constraints)
+        active_history.append(turn)
 
+        # 4. Generate & Stream Response (or replay the cached one)
+        cache_key = self._response_key(user_message, constraints, items, menu_version, earlier)
+        cached = self.response_cache.get(cache_key, generation) if cache_key else None
+        vector = None
+        if cached is None:
+            cached, vector = self._semantic_lookup(user_message, cache_key, generation)
         chunks: list[str] = []
-        # Pass history to generator so LLM knows what we are talking about
-        stream_gen = self.generator.generate_stream(
-            user_query=user_message,
-            items=items,
-            chat_history=active_history
+        try:
+            if cached is not None:
+                for chunk in cached:
+                    chunks.append(chunk)
+                    yield chunk
+            else:
+                # Earlier turns as records so the LLM knows what we are talking about
+                usage: Dict = {}
+                for chunk in self.generator.generate_stream(
+                    user_query=user_message,
+                    items=items,
+                    chat_history=self._context_turns(earlier),
+                    scenario=self._scenario(path, constraints),
+                    usage=usage,
+                ):
+                    chunks.append(chunk)
+                    yield chunk
+                logger.debug("Generation: %s", usage)
+                self._store_response(cache_key, generation, chunks, user_message, vector)
+        finally:
+            # Also records a partial answer if the client went away
+            turn["item_ids"] = shown_item_ids("".join(chunks), items)
+
+    async def chat_stream_async(self, user_message: str, chat_history: List[Dict] = None) -> AsyncGenerator[str, None]:
+        """
+        chat_stream() for the event loop: Gemini calls go through client.aio
+        and only retrieval takes a thread (from the bounded retrieval pool),
+        so an open stream costs a coroutine instead of a worker thread.
+        """
+        active_history = chat_history if chat_history is not None else self.internal_memory
+        yield "…\n"
+        loop = asyncio.get_running_loop()
+        generation, menu_version = self.retriever.bundle_version
+
+        speculation = self._start_speculation(user_message)
+        earlier = as_turns(active_history)
+        constraints = await self.extractor.extract_async(user_message, chat_history=earlier)
+        logger.debug("Constraints: %s", constraints)
+
+        path = self._plan(user_message, constraints)
+        candidates = None
+        if path == "speculative":
+            # Awaited here, never from inside the pool (a pool thread blocked
+            # on a queued speculation could deadlock a saturated pool)
+            try:
+                candidates = await asyncio.wrap_future(speculation)
+            except Exception:
+                logger.warning("Speculative search failed", exc_info=True)
+        else:
+            speculation.cancel()
+        items = await loop.run_in_executor(
+            self._retrieval_pool, self._retrieve, user_message, constraints, path, candidates
         )
-        
-        for chunk in stream_gen:
-            # full_response += chunk
-            # yield chunk
-            chunks.append(chunk)
-            yield chunk
-        final_text = "".join(chunks)
 
-        # Fix broken currency and word splits
-        # Remove zero-width spaces
-        assistant_msg["content"] = "".join(chunk)
+        turn = new_turn(user_message, constraints)
+        active_history.append(turn)
+
+        cache_key = self._response_key(user_message, constraints, items, menu_version, earlier)
+        cached = self.response_cache.get(cache_key, generation) if cache_key else None
+        vector = None
+        if cached is None:
+            # May embed the message: CPU work, so off the event loop
+            cached, vector = await loop.run_in_executor(
+                self._retrieval_pool, self._semantic_lookup, user_message, cache_key, generation
+            )
+        chunks: list[str] = []
+        try:
+            if cached is not None:
+                for chunk in cached:
+                    chunks.append(chunk)
+                    yield chunk
+            else:
+                context = await loop.run_in_executor(self._retrieval_pool, self._context_turns, earlier)
+                usage: Dict = {}
+                async for chunk in self.generator.generate_stream_async(
+                    user_query=user_message,
+                    items=items,
+                    chat_history=context,
+                    scenario=self._scenario(path, constraints),
+                    usage=usage,
+                ):
+                    chunks.append(chunk)
+                    yield chunk
+                logger.debug("Generation: %s", usage)
+                self._store_response(cache_key, generation, chunks, user_message, vector)
+        finally:
+            turn["item_ids"] = shown_item_ids("".join(chunks), items)
 
-        # 4. Update History (After full generation is complete)
-        # active_history.append({"role": "user", "content": user_message})
-        # active_history.append({"role": "assistant", "content": full_response})
+    def warm_up(self, queries: Optional[List[str]] = None) -> float:
+        """
+        Embed and search a few canned queries so the first real request does
+        not pay for lazy initialization. Returns the time taken in seconds.
+        """
+        start = time.perf_counter()
+        for query in queries or WARM_UP_QUERIES:
+            self.retriever.search(query=query, top_k=5)
+            self.retriever.search(query=query, max_price=200, diet=["vegan"], top_k=5)
+        return round(time.perf_counter() - start, 3)
 
     def clear_memory(self):
-        self.history = []
\ No newline at end of file
+        """Forget the turn records kept when no chat_history is passed in."""
+        self.internal_memory.clear()
\ No newline at end of file
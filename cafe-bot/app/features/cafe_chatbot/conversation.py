@@ -0,0 +1,84 @@
+# app/features/cafe_chatbot/conversation.py
+
+"""
+Conversation memory as compact turn records.
+
+A session's history is a list of finished turns:
+
+    {"user": "vegan drinks under 200",
+     "constraints": {...the resolved constraints of that turn...},
+     "item_ids": ["itm_...", ...]}      # items the answer showed
+
+instead of the raw user / assistant messages. The answers themselves (long
+markdown menus) are never sent again: prompts are rebuilt from the user
+texts, the constraints in force and the names of the items shown.
+"""
+
+import re
+import json
+from typing import Dict, List, Optional
+
+
+# Earlier turns quoted in the extractor and generator prompts
+CONTEXT_TURNS = 3
+# Item ids kept per turn (in the order the answer showed them)
+SHOWN_ITEMS_PER_TURN = 20
+
+
+def new_turn(user_text: str, constraints: Optional[Dict]) -> Dict:
+    return {"user": user_text, "constraints": constraints, "item_ids": []}
+
+
+def as_turns(history: Optional[List[Dict]]) -> List[Dict]:
+    """
+    Turn records of a history. Sessions saved as role / content messages
+    (before this format) still load: their user messages become turns
+    with unknown constraints, their answers are dropped.
+    """
+    turns = []
+    for record in history or ():
+        if "user" in record:
+            turns.append(record)
+        elif record.get("role") == "user":
+            turns.append(new_turn(record.get("content", ""), None))
+    return turns
+
+
+def inherited_constraints(turns: List[Dict]) -> Optional[Dict]:
+    """Constraints in force after these turns (the last resolved ones), or None."""
+    for turn in reversed(turns):
+        if turn.get("constraints") is not None:
+            return turn["constraints"]
+    return None
+
+
+def format_constraints(constraints: Dict) -> str:
+    """Only the set values, as compact JSON."""
+    return json.dumps({k: v for k, v in constraints.items() if v not in (None, [])}, ensure_ascii=False)
+
+
+def shown_item_ids(answer: str, items: List[Dict], limit: int = SHOWN_ITEMS_PER_TURN) -> List[str]:
+    """
+    Ids of the retrieved items the answer names, in answer order. Longer
+    names are matched first and their text consumed, so "Mocha" does not
+    also match inside "Robusta Mocha".
+    """
+    # Price variants share a name: one match shows all of them
+    ids_by_name: Dict[str, List[str]] = {}
+    for item in items:
+        name = " ".join(item["name"].lower().split())
+        if name:
+            ids_by_name.setdefault(name, []).append(item["item_id"])
+
+    text = answer.lower()
+    found = []
+    for name in sorted(ids_by_name, key=len, reverse=True):
+        pattern = re.compile(rf"(?<!\w){re.escape(name)}(?!\w)")
+        match = pattern.search(text)
+        if match is None:
+            continue
+        found.extend((match.start(), item_id) for item_id in ids_by_name[name])
+        text = pattern.sub(lambda m: " " * len(m.group(0)), text)
+
+    found.sort(key=lambda hit: hit[0])
+    return list(dict.fromkeys(item_id for _, item_id in found))[:limit]
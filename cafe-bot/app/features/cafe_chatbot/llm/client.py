@@ -0,0 +1,70 @@
+# app/features/cafe_chatbot/llm/client.py
+
+import os
+import itertools
+from typing import List, Optional
+
+import httpx
+from google import genai
+from google.genai import types
+
+
+# httpx clients default to 100 connections: every stream past that waits
+# for a free one (with the sync pipeline, paused streams keep their
+# connections while every thread waits for one: a deadlock). Gemini streams
+# are long-lived, so size the pools for the concurrent chats of one worker.
+MAX_CONNECTIONS = int(os.environ.get("GEMINI_MAX_CONNECTIONS", 4096))
+MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("GEMINI_MAX_KEEPALIVE_CONNECTIONS", 256))
+POOL_SHARDS = int(os.environ.get("GEMINI_POOL_SHARDS", 16))
+
+
+class ShardedAsyncTransport(httpx.AsyncBaseTransport):
+    """
+    Round-robins requests over several httpcore connection pools.
+
+    A pool re-scans all of its connections whenever a request starts or
+    finishes (and once more per idle connection), so a single pool holding
+    thousands of open streams spends most of the worker's CPU on
+    bookkeeping. Smaller pools keep that cost flat as concurrency grows.
+    """
+
+    def __init__(self, shards: int, max_connections: int, max_keepalive_connections: int):
+        shards = max(shards, 1)
+        limits = httpx.Limits(
+            max_connections=-(-max_connections // shards),
+            max_keepalive_connections=-(-max_keepalive_connections // shards),
+        )
+        self._transports: List[httpx.AsyncHTTPTransport] = [
+            httpx.AsyncHTTPTransport(limits=limits) for _ in range(shards)
+        ]
+        self._next = itertools.count()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        transport = self._transports[next(self._next) % len(self._transports)]
+        return await transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        for transport in self._transports:
+            await transport.aclose()
+
+
+def create_gemini_client(api_key: str, base_url: Optional[str] = None) -> genai.Client:
+    """
+    genai.Client whose async transport (client.aio) can hold thousands of
+    concurrent requests. GEMINI_BASE_URL (or base_url) points both the sync
+    and async transports at another endpoint, e.g. a local fake server.
+    """
+    base_url = base_url or os.environ.get("GEMINI_BASE_URL") or None
+    limits = httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+    )
+    transport = ShardedAsyncTransport(POOL_SHARDS, MAX_CONNECTIONS, MAX_KEEPALIVE_CONNECTIONS)
+    return genai.Client(
+        api_key=api_key,
+        http_options=types.HttpOptions(
+            base_url=base_url,
+            client_args={"limits": limits},
+            async_client_args={"transport": transport},
+        ),
+    )
@@ -298,58 +298,52 @@ To make this Production-Ready and fix the silence, we should use the official Go
 # ABOVE USED DEPRECATED GOOGLE MODULE
 # BELOW IS USING THE LATEST ONE
 import os
-from typing import List, Dict, Generator, Optional
+import threading
+from typing import AsyncGenerator, List, Dict, Generator, Optional
 from dotenv import load_dotenv
 
-# NEW SDK IMPORT
-from google import genai
+# NEW SDK IMPORTS
 from google.genai import types
 
-from .prompt import SYSTEM_PROMPT, build_user_prompt
+from .client import create_gemini_client
+from .prompt_builder import PROMPT_TOKEN_BUDGET, PromptBuilder, estimate_tokens
 
 load_dotenv()
 
+NO_ITEMS_MESSAGE = "Sorry, I couldn't find any matching items on the menu."
+# Failed generations end with a chunk starting with this
+CONNECTION_ERROR_PREFIX = "[Connection Error"
+
 class GeminiLLMResponseGenerator:
     def __init__(
         self,
         api_key: Optional[str] = None,
         # You can use "gemini-1.5-flash" or "gemini-2.0-flash"
-        model_name: str = "gemini-3-flash-preview" 
+        model_name: str = "gemini-3-flash-preview",
+        prompt_token_budget: int = PROMPT_TOKEN_BUDGET,
     ):
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
         if not self.api_key:
             raise RuntimeError("GEMINI_API_KEY not set")
         
-        # NEW: Initialize the Client
-        self.client = genai.Client(api_key=self.api_key)
+        # NEW: Initialize the Client (sync + client.aio share its options)
+        self.client = create_gemini_client(self.api_key)
         self.model_name = model_name
 
-    def generate_stream(
-        self,
-        user_query: str,
-        items: list[dict],
-        chat_history: Optional[List[Dict]] = None,
-        temperature: float = 0.2,
-        timeout: int = 20
-    ) -> Generator[str, None, None]:
-        
-        if not items:
-            yield "Sorry, I couldn't find any matching items on the menu."
-            return
-
-        # 1. Build Prompt
-        full_prompt = SYSTEM_PROMPT.strip() + "\n\n"
-        
-        if chat_history:
-            full_prompt += "--- CONVERSATION HISTORY ---\n"
-            for msg in chat_history[-6:]: 
-                role = "User" if msg["role"] == "user" else "Assistant"
-                full_prompt += f"{role}: {msg['content']}\n"
-            full_prompt += "---------------------------\n\n"
-
-        full_prompt += build_user_prompt(user_query, items)
-
-        # 2. Safety Settings (NEW SYNTAX)
+        # Menu data + history fitted to a token budget, output cap per scenario
+        self.prompt_builder = PromptBuilder(prompt_token_budget)
+        self._stats_lock = threading.Lock()
+        self.token_totals = {
+            "requests": 0,
+            "estimated_requests": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "thoughts_tokens": 0,
+            "max_prompt_tokens": 0,
+        }
+
+    def _config(self, temperature: float, max_output_tokens: int) -> types.GenerateContentConfig:
+        # Safety Settings (NEW SYNTAX)
         # We explicitly disable blocks to prevent menu items like "Killer Brownie" triggering filters
         safety_settings = [
             types.SafetySetting(
@@ -369,29 +363,129 @@ class GeminiLLMResponseGenerator:
                 threshold="BLOCK_NONE"
             ),
         ]
+        return types.GenerateContentConfig(
+            temperature=temperature,
+            max_output_tokens=max_output_tokens,
+            safety_settings=safety_settings,
+            # No tools: without this the SDK still runs its function-calling
+            # loop, re-converting the whole prompt on every streamed chunk
+            automatic_function_calling=types.AutomaticFunctionCallingConfig(disable=True),
+        )
+
+    def _record_usage(self, usage: Dict, metadata, completion: List[str]):
+        """
+        Token counts of one request into `usage` and the totals: Gemini's
+        own (usage_metadata of the last chunk), or estimates if it sent none
+        (stream cut short, or a server that does not report usage).
+        """
+        if metadata is not None and metadata.prompt_token_count is not None:
+            usage["prompt_tokens"] = metadata.prompt_token_count
+            usage["completion_tokens"] = metadata.candidates_token_count or 0
+            usage["thoughts_tokens"] = metadata.thoughts_token_count or 0
+            usage["counted_by"] = "gemini"
+        else:
+            usage["prompt_tokens"] = usage["estimated_prompt_tokens"]
+            usage["completion_tokens"] = estimate_tokens("".join(completion))
+            usage["thoughts_tokens"] = 0
+            usage["counted_by"] = "estimate"
+
+        with self._stats_lock:
+            totals = self.token_totals
+            totals["requests"] += 1
+            totals["estimated_requests"] += usage["counted_by"] == "estimate"
+            totals["prompt_tokens"] += usage["prompt_tokens"]
+            totals["completion_tokens"] += usage["completion_tokens"]
+            totals["thoughts_tokens"] += usage["thoughts_tokens"]
+            totals["max_prompt_tokens"] = max(totals["max_prompt_tokens"], usage["prompt_tokens"])
+
+    def generate_stream(
+        self,
+        user_query: str,
+        items: list[dict],
+        chat_history: Optional[List[Dict]] = None,
+        temperature: float = 0.2,
+        timeout: int = 20,
+        scenario: str = "suggestion",
+        usage: Optional[Dict] = None,
+    ) -> Generator[str, None, None]:
+        """
+        usage: optional dict, filled with what the prompt kept and the
+        request's prompt / completion token counts.
+        """
+        
+        if not items:
+            yield NO_ITEMS_MESSAGE
+            return
+
+        built = self.prompt_builder.build(user_query, items, chat_history, scenario)
+        usage = usage if usage is not None else {}
+        usage.update(built["usage"])
+        completion: List[str] = []
+        metadata = None
 
-        # 3. Generate Stream (NEW SYNTAX)
         try:
             # The method is now on the 'client.models' accessor
             response_stream = self.client.models.generate_content_stream(
                 model=self.model_name,
-                contents=full_prompt,
-                config=types.GenerateContentConfig(
-                    temperature=temperature,
-                    max_output_tokens=2048,
-                    safety_settings=safety_settings
-                )
+                contents=built["prompt"],
+                config=self._config(temperature, built["max_output_tokens"])
             )
 
-            # 4. Iteration
             for chunk in response_stream:
+                metadata = chunk.usage_metadata or metadata
                 # The new SDK chunk object has a .text property that is robust
                 if chunk.text:
+                    completion.append(chunk.text)
                     yield chunk.text
 
         except Exception as e:
             print(f"Streaming Error: {e}")
-            yield f"[Connection Error: {str(e)}]"
+            yield f"{CONNECTION_ERROR_PREFIX}: {str(e)}]"
+        finally:
+            self._record_usage(usage, metadata, completion)
+
+    async def generate_stream_async(
+        self,
+        user_query: str,
+        items: list[dict],
+        chat_history: Optional[List[Dict]] = None,
+        temperature: float = 0.2,
+        scenario: str = "suggestion",
+        usage: Optional[Dict] = None,
+    ) -> AsyncGenerator[str, None]:
+        """
+        Same stream on client.aio: waiting for Gemini holds no thread, so
+        one event loop serves thousands of open responses.
+        """
+        if not items:
+            yield NO_ITEMS_MESSAGE
+            return
+
+        built = self.prompt_builder.build(user_query, items, chat_history, scenario)
+        usage = usage if usage is not None else {}
+        usage.update(built["usage"])
+        completion: List[str] = []
+        metadata = None
+
+        try:
+            response_stream = await self.client.aio.models.generate_content_stream(
+                model=self.model_name,
+                contents=built["prompt"],
+                config=self._config(temperature, built["max_output_tokens"])
+            )
+
+            async for chunk in response_stream:
+                metadata = chunk.usage_metadata or metadata
+                text = chunk.text
+                if text:
+                    completion.append(text)
+                    yield text
+
+        except Exception as e:
+            print(f"Streaming Error: {e}")
+            yield f"{CONNECTION_ERROR_PREFIX}: {str(e)}]"
+        finally:
+            self._record_usage(usage, metadata, completion)
 
     def generate(self, user_query: str, items: list[dict], chat_history: Optional[List[Dict]] = None) -> str:
         """
@@ -400,4 +494,13 @@ class GeminiLLMResponseGenerator:
         full_response = ""
         for chunk in self.generate_stream(user_query, items, chat_history):
             full_response += chunk
-        return full_response
\ No newline at end of file
+        return full_response
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            totals = dict(self.token_totals)
+        requests = totals["requests"]
+        totals["avg_prompt_tokens"] = (totals["prompt_tokens"] / requests) if requests else 0.0
+        totals["avg_completion_tokens"] = (totals["completion_tokens"] / requests) if requests else 0.0
+        totals["prompt_token_budget"] = self.prompt_builder.token_budget
+        return totals
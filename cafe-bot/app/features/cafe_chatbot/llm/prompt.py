@@ -60,7 +60,13 @@ DON'T MAKE GENERAL CLAIMS ABOUT THE MENU; JUST LIST THE MATCHING ITEMS.
 # Group items by category (e.g., '## Cold Brews', '## Teas') and merge price variants (e.g., 'Cranberry Tonic: ₹250 / ₹270') to avoid long, cluttered lists.
 
 
-def build_user_prompt(user_query: str, items: list[dict]) -> str:
+def format_prices(item: dict) -> str:
+    """Price column: ₹250, or ₹250 / ₹270 for an entry with merged price variants."""
+    prices = item.get("prices") or [item["price"]]
+    return " / ".join(f"₹{price}" for price in prices)
+
+
+def build_user_prompt(user_query: str, items: list[dict], not_shown: int = 0) -> str:
     lines = [
         "YOU MUST USE ONLY THE FOLLOWING MENU DATA.",
         "YOU MUST LIST ITEM NAMES AND PRICES.",
@@ -71,7 +77,13 @@ def build_user_prompt(user_query: str, items: list[dict]) -> str:
 
     for idx, item in enumerate(items, start=1):
         lines.append(
-            f"{idx}. {item['name']} — ₹{item['price']}"
+            f"{idx}. {item['name']} — {format_prices(item)}"
+        )
+    if not_shown:
+        # A listing cut to fit the prompt: the model must not present it as complete
+        lines.append(
+            f"... {not_shown} more matching items not shown. Say the list continues "
+            "and offer to narrow it down (price, hot/cold, milk)."
         )
 
     lines.extend([
@@ -0,0 +1,180 @@
+# app/features/cafe_chatbot/llm/prompt_builder.py
+
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from ..conversation import CONTEXT_TURNS, format_constraints, inherited_constraints
+from .prompt import SYSTEM_PROMPT, build_user_prompt
+
+
+# Whole prompt (system + menu data + history + question), in estimated tokens
+PROMPT_TOKEN_BUDGET = int(os.environ.get("CAFE_PROMPT_TOKEN_BUDGET", 3000))
+# Gemini tokenizes English at roughly 4 characters per token
+CHARS_PER_TOKEN = 4
+
+# Suggestions are curated down to 5-7 items: the far tail is never used.
+# Cut by rank, not score: fused hits carry RRF scores (~0.016-0.033) while
+# exact-name and structured hits carry 1.0, so scores are not comparable
+SUGGESTION_MAX_ENTRIES = 15
+
+# Items an earlier answer showed, quoted by name only (the answer itself and
+# the prices are not needed to resolve "those" / "the second one")
+SHOWN_LINE_CHARS = 200
+
+# Output cap: fixed part + per listed entry, plus the model's thinking
+OUTPUT_TOKENS_BASE = 256
+OUTPUT_TOKENS_PER_ENTRY = 32
+SUGGESTION_ENTRIES = 7
+THINKING_TOKEN_ALLOWANCE = int(os.environ.get("CAFE_THINKING_TOKEN_ALLOWANCE", 1024))
+MAX_OUTPUT_TOKENS = 8192
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def merge_variants(items: List[Dict]) -> List[Dict]:
+    """
+    One entry per item name: "Cranberry Tonic" at ₹250 and ₹270 becomes one
+    line with both prices. Entries keep the rank of their best variant;
+    prices are listed cheapest first.
+    """
+    entries: "OrderedDict[str, Dict]" = OrderedDict()
+    for item in items:
+        key = " ".join(item["name"].lower().split())
+        entry = entries.get(key)
+        if entry is None:
+            entries[key] = {
+                "name": item["name"],
+                "prices": [item["price"]],
+                "item_ids": [item.get("item_id")],
+            }
+            continue
+        if item["price"] not in entry["prices"]:
+            entry["prices"].append(item["price"])
+        entry["item_ids"].append(item.get("item_id"))
+
+    for entry in entries.values():
+        entry["prices"].sort(key=lambda price: (price is None, price or 0))
+    return list(entries.values())
+
+
+def drop_tail(entries: List[Dict]) -> List[Dict]:
+    """Suggestions only: the SUGGESTION_MAX_ENTRIES best-ranked entries."""
+    return entries[:SUGGESTION_MAX_ENTRIES]
+
+
+def clip(text: str, max_chars: int) -> str:
+    return text if len(text) <= max_chars else text[:max_chars].rstrip() + " …"
+
+
+class PromptBuilder:
+    """
+    Builds the generation prompt within a token budget.
+
+    Priority: system prompt and question, then the menu data (variants
+    merged; for suggestions the low-ranked tail dropped; then trimmed from
+    the bottom if still over budget, a listing noting how many entries it
+    no longer shows), then as much recent conversation as
+    the rest of the budget holds, newest first. Earlier turns are quoted as
+    records (the request, the items shown, the constraints in force), never
+    as the full earlier answers.
+
+    scenario: "listing" (hard constraints: every matching item is listed)
+    or "suggestion" (the model curates a few). It also sizes the output cap.
+    """
+
+    def __init__(self, token_budget: int = PROMPT_TOKEN_BUDGET):
+        self.token_budget = token_budget
+
+    def build(
+        self,
+        user_query: str,
+        items: List[Dict],
+        chat_history: Optional[List[Dict]] = None,
+        scenario: str = "suggestion",
+    ) -> Dict:
+        """Returns {"prompt", "max_output_tokens", "usage"} (usage: what was kept and dropped)."""
+        entries = merge_variants(items)
+        merged = len(items) - len(entries)
+        if scenario != "listing":
+            entries = drop_tail(entries)
+        kept_by_rank = len(entries)
+
+        system = SYSTEM_PROMPT.strip() + "\n\n"
+        menu = build_user_prompt(user_query, entries)
+        # Over budget with the menu alone: the lowest-ranked entries go
+        # (keep at least one, the model needs something to answer from).
+        # A trimmed listing says how many matches it leaves out
+        while len(entries) > 1 and estimate_tokens(system + menu) > self.token_budget:
+            entries = entries[:max(1, len(entries) - max(1, len(entries) // 8))]
+            not_shown = kept_by_rank - len(entries) if scenario == "listing" else 0
+            menu = build_user_prompt(user_query, entries, not_shown)
+
+        remaining = self.token_budget - estimate_tokens(system + menu)
+        history_lines = self._history_lines(chat_history, remaining)
+
+        prompt = system
+        if history_lines:
+            prompt += "--- CONVERSATION SO FAR ---\n"
+            prompt += "".join(history_lines)
+            prompt += "---------------------------\n\n"
+        prompt += menu
+
+        max_output_tokens = self._output_cap(len(entries), scenario)
+        return {
+            "prompt": prompt,
+            "max_output_tokens": max_output_tokens,
+            "usage": {
+                "scenario": scenario,
+                "items": len(items),
+                "entries": len(entries),
+                "variants_merged": merged,
+                "tail_dropped": len(items) - merged - kept_by_rank,
+                "budget_dropped": kept_by_rank - len(entries),
+                "history_lines": len(history_lines),
+                "estimated_prompt_tokens": estimate_tokens(prompt),
+                "max_output_tokens": max_output_tokens,
+            },
+        }
+
+    @staticmethod
+    def history_window(chat_history: Optional[List[Dict]]) -> List[Dict]:
+        """The earlier turn records quoted in the prompt."""
+        return list(chat_history[-CONTEXT_TURNS:]) if chat_history else []
+
+    def _history_lines(self, chat_history: Optional[List[Dict]], token_budget: int) -> List[str]:
+        """
+        chat_history: turn records (see conversation.py), each with "items",
+        the records of the item ids it showed.
+        """
+        turns = self.history_window(chat_history)
+        state = inherited_constraints(turns)
+        lines: List[str] = []
+        if state:
+            line = f"Constraints in force: {format_constraints(state)}\n"
+            if estimate_tokens(line) > token_budget:
+                return lines
+            token_budget -= estimate_tokens(line)
+            lines.append(line)
+
+        for turn in reversed(turns):
+            block = f"User: {turn['user']}\n"
+            shown = merge_variants(turn.get("items") or [])
+            if shown:
+                listed = ", ".join(entry["name"] for entry in shown)
+                block += f"Shown: {clip(listed, SHOWN_LINE_CHARS)}\n"
+            cost = estimate_tokens(block)
+            if cost > token_budget:
+                break
+            token_budget -= cost
+            lines.append(block)
+        lines.reverse()
+        return lines
+
+    @staticmethod
+    def _output_cap(entries: int, scenario: str) -> int:
+        listed = entries if scenario == "listing" else min(entries, SUGGESTION_ENTRIES)
+        cap = OUTPUT_TOKENS_BASE + OUTPUT_TOKENS_PER_ENTRY * listed + THINKING_TOKEN_ALLOWANCE
+        return min(cap, MAX_OUTPUT_TOKENS)
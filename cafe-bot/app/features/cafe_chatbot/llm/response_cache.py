@@ -0,0 +1,111 @@
+# app/features/cafe_chatbot/llm/response_cache.py
+
+import os
+import json
+import hashlib
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from ..cache import LRUTTLCache
+from ..retrieval.embedder import normalize_query
+
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("CAFE_RESPONSE_CACHE_ENTRIES", 2048))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("CAFE_RESPONSE_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+# Answers quote prices and stock: keep them for minutes, not hours
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get("CAFE_RESPONSE_CACHE_TTL_SECONDS", 600))
+
+
+def chunks_bytes(chunks: Sequence[str]) -> int:
+    return sum(len(chunk.encode("utf-8")) for chunk in chunks)
+
+
+class ResponseCache:
+    """
+    Complete generated answers, keyed on everything that goes into the
+    generation prompt: the normalized query, the resolved constraints, the
+    retrieved item ids in prompt order, the menu version and the earlier
+    conversation the prompt quotes. Two users asking the same first question
+    (or following the same cached answers) get the stored chunks replayed.
+
+    Entries belong to one retriever generation: the first lookup after a
+    bundle reload drops them all.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        max_bytes: Optional[int] = RESPONSE_CACHE_MAX_BYTES,
+        ttl_seconds: Optional[float] = RESPONSE_CACHE_TTL_SECONDS,
+    ):
+        self.cache = LRUTTLCache(
+            max_entries=max_entries,
+            max_bytes=max_bytes,
+            ttl_seconds=ttl_seconds,
+            sizeof=chunks_bytes,
+        )
+        self._lock = threading.Lock()
+        self.generation: Optional[int] = None
+        self.invalidations = 0
+        self.stores = 0
+
+    @staticmethod
+    def key(
+        user_query: str,
+        constraints: Dict,
+        items: List[Dict],
+        menu_version,
+        context: List[Dict],
+    ) -> tuple:
+        """context: the earlier turn records the generation prompt quotes."""
+        context_str = json.dumps(
+            [(normalize_query(turn["user"]), turn["constraints"], turn["item_ids"]) for turn in context],
+            sort_keys=True,
+        )
+        return (
+            normalize_query(user_query),
+            json.dumps(constraints, sort_keys=True),
+            tuple(item["item_id"] for item in items),
+            menu_version,
+            hashlib.sha256(context_str.encode("utf-8")).hexdigest(),
+        )
+
+    @staticmethod
+    def scope(key: tuple) -> tuple:
+        """The key minus query and items: what a paraphrase has to share."""
+        _, constraints, _, menu_version, context = key
+        return constraints, menu_version, context
+
+    @staticmethod
+    def item_ids(key: tuple) -> tuple:
+        return key[2]
+
+    def _current(self, generation: int) -> bool:
+        """False for a lookup from before the last reload; clears on a newer one."""
+        with self._lock:
+            if self.generation is None or generation > self.generation:
+                if self.generation is not None:
+                    self.cache.clear()
+                    self.invalidations += 1
+                self.generation = generation
+            return generation == self.generation
+
+    def get(self, key: tuple, generation: int) -> Optional[Tuple[str, ...]]:
+        if not self._current(generation):
+            return None
+        return self.cache.get(key)
+
+    def put(self, key: tuple, generation: int, chunks: Sequence[str]):
+        # Items retrieved from a bundle that has since been replaced
+        if not chunks or not self._current(generation):
+            return
+        self.cache.put(key, tuple(chunks))
+        self.stores += 1
+
+    def stats(self) -> Dict:
+        return {
+            **self.cache.stats(),
+            "stores": self.stores,
+            "generation": self.generation,
+            "invalidations": self.invalidations,
+        }
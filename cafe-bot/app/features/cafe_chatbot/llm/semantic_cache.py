@@ -0,0 +1,189 @@
+# app/features/cafe_chatbot/llm/semantic_cache.py
+
+import os
+import random
+import itertools
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("CAFE_SEMANTIC_CACHE_ENTRIES", 1024))
+# Cosine similarity of the query embeddings needed to reuse an answer
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("CAFE_SEMANTIC_CACHE_THRESHOLD", 0.92))
+# Share of served hits recorded for review (stats()["samples"]); rejected
+# suspect hits are always recorded
+SEMANTIC_CACHE_SAMPLE_RATE = float(os.environ.get("CAFE_SEMANTIC_CACHE_SAMPLE_RATE", 0.1))
+
+# Hit rates are also reported for these thresholds, to tune the real one
+THRESHOLD_GRID = (0.80, 0.85, 0.90, 0.92, 0.95, 0.98)
+# Nearest queries checked for one with the same constraints
+NEIGHBOURS = 8
+# A hit whose cached items share less than this with the items retrieved
+# for the new query probably answers a different question: it is not served
+SUSPECT_ITEM_OVERLAP = 0.5
+MAX_SAMPLES = 50
+
+
+def item_overlap(a: Sequence[str], b: Sequence[str]) -> float:
+    a, b = set(a), set(b)
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class SemanticAnswerCache:
+    """
+    Second tier behind ResponseCache: reuses the answer of an earlier query
+    that means the same thing ("cheap vegan drinks" / "vegan beverages under
+    budget"). Past answered queries live in a small exact FAISS index of
+    their query embeddings (the vectors QueryEmbedder already computed for
+    retrieval); the nearest one with the same scope (constraints, menu
+    version and conversation context) is served when it is at least
+    `threshold` similar. LRU over entries; a bundle reload drops them all.
+
+    False hits cannot be seen directly, so every hit is compared with the
+    items retrieved for the new query: a low overlap counts as suspect and
+    is treated as a miss. Suspect hits and a sample of served ones
+    (queries, similarity, overlap) are kept for review.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        sample_rate: float = SEMANTIC_CACHE_SAMPLE_RATE,
+    ):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+
+        self.index: Optional[faiss.Index] = None
+        # id -> (query, scope, item_ids, chunks), least recently used first
+        self.entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.generation: Optional[int] = None
+
+        self.lookups = 0
+        self.hits = 0
+        self.suspect_hits = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # Lookups whose best in-scope neighbour reached each threshold
+        self.would_hit = {t: 0 for t in sorted({*THRESHOLD_GRID, threshold})}
+        self.samples: Deque[Dict] = deque(maxlen=MAX_SAMPLES)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _current(self, generation: int, dimension: int) -> bool:
+        """Like ResponseCache: False for a stale generation, reset on a newer one."""
+        if self.generation is None or generation > self.generation:
+            if self.generation is not None:
+                self.invalidations += 1
+            self.generation = generation
+            self.entries.clear()
+            self.index = None
+        if generation != self.generation:
+            return False
+        if self.index is None or self.index.d != dimension:
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+            self.entries.clear()
+        return True
+
+    def lookup(
+        self,
+        query: str,
+        vector: np.ndarray,
+        scope: tuple,
+        item_ids: Sequence[str],
+        generation: int,
+    ) -> Optional[Tuple[str, ...]]:
+        """vector: (1, dim) normalized query embedding. Returns the cached chunks or None."""
+        with self._lock:
+            if not self._current(generation, vector.shape[1]):
+                return None
+            self.lookups += 1
+            if not self.entries:
+                return None
+
+            similarities, ids = self.index.search(vector, min(NEIGHBOURS, len(self.entries)))
+            match = None
+            for similarity, entry_id in zip(similarities[0], ids[0]):
+                # Sorted by similarity: the first one in scope is the best
+                if entry_id >= 0 and self.entries[entry_id][1] == scope:
+                    match = (float(similarity), int(entry_id))
+                    break
+            if match is None:
+                return None
+
+            similarity, entry_id = match
+            for t in self.would_hit:
+                if similarity >= t:
+                    self.would_hit[t] += 1
+            if similarity < self.threshold:
+                return None
+
+            cached_query, _, cached_items, chunks = self.entries[entry_id]
+            overlap = item_overlap(item_ids, cached_items)
+            suspect = overlap < SUSPECT_ITEM_OVERLAP
+            if suspect or random.random() < self.sample_rate:
+                self.samples.append({
+                    "query": query,
+                    "cached_query": cached_query,
+                    "similarity": round(similarity, 4),
+                    "item_overlap": round(overlap, 3),
+                    "served": not suspect,
+                })
+            if suspect:
+                self.suspect_hits += 1
+                return None
+
+            self.entries.move_to_end(entry_id)
+            self.hits += 1
+            return chunks
+
+    def add(
+        self,
+        query: str,
+        vector: np.ndarray,
+        scope: tuple,
+        item_ids: Sequence[str],
+        generation: int,
+        chunks: Sequence[str],
+    ):
+        with self._lock:
+            if not self._current(generation, vector.shape[1]):
+                return
+            entry_id = next(self._ids)
+            self.index.add_with_ids(vector, np.array([entry_id], dtype=np.int64))
+            self.entries[entry_id] = (query, scope, tuple(item_ids), tuple(chunks))
+
+            while len(self.entries) > self.max_entries:
+                evicted_id, _ = self.entries.popitem(last=False)
+                self.index.remove_ids(np.array([evicted_id], dtype=np.int64))
+                self.evictions += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.lookups
+            return {
+                "entries": len(self.entries),
+                "threshold": self.threshold,
+                "lookups": lookups,
+                "hits": self.hits,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "hit_rate_by_threshold": {
+                    str(t): (n / lookups) if lookups else 0.0 for t, n in self.would_hit.items()
+                },
+                "suspect_hits": self.suspect_hits,
+                "evictions": self.evictions,
+                "generation": self.generation,
+                "invalidations": self.invalidations,
+                "samples": list(self.samples),
+            }
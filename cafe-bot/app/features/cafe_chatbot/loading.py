@@ -0,0 +1,27 @@
+# app/features/cafe_chatbot/loading.py
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+
+
+def load_in_parallel(tasks: Dict[str, Callable[[], Any]]) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """
+    Run independent loaders (model, index, API clients...) concurrently.
+    Returns (results by name, seconds by name). The first failure is re-raised
+    once every loader has finished.
+    """
+    timings: Dict[str, float] = {}
+
+    def _timed(name: str, fn: Callable[[], Any]):
+        start = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            timings[name] = round(time.perf_counter() - start, 3)
+
+    with ThreadPoolExecutor(max_workers=len(tasks) or 1, thread_name_prefix="loader") as pool:
+        futures = {name: pool.submit(_timed, name, fn) for name, fn in tasks.items()}
+
+    results = {name: future.result() for name, future in futures.items()}
+    return results, timings
@@ -398,13 +398,20 @@ To fix this, the Extractor must see the Chat History to inherit the budget from
 import re
 import os
 import json
-from typing import Optional, Dict, List
+import hashlib
+import threading
+from typing import Optional, Dict, List, Tuple
 from dotenv import load_dotenv
 
 # NEW SDK IMPORT
-from google import genai
 from google.genai import types
 
+from ..cache import LRUTTLCache
+from ..conversation import CONTEXT_TURNS, as_turns, format_constraints, inherited_constraints
+from ..llm.client import create_gemini_client
+from ..retrieval.embedder import normalize_query
+from .rule_parser import RuleBasedConstraintParser, empty_constraints
+
 load_dotenv()
 
 class LLMConstraintExtractor:
@@ -412,16 +419,37 @@ class LLMConstraintExtractor:
         self,
         api_key: Optional[str] = None,
         model_name: str = "gemini-3-flash-preview", # 2.0 is excellent for JSON extraction
-        timeout: int = 20
+        timeout: int = 20,
+        fast_path_min_confidence: float = 0.9,
+        cache_max_entries: int = 4096,
+        cache_max_bytes: Optional[int] = 2 * 1024 * 1024,
+        cache_ttl_seconds: Optional[float] = 3600,
     ):
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
         if not self.api_key:
             raise RuntimeError("GEMINI_API_KEY not set")
 
-        # NEW: Initialize Client
-        self.client = genai.Client(api_key=self.api_key)
+        # NEW: Initialize Client (sync + client.aio share its options)
+        self.client = create_gemini_client(self.api_key)
         self.model_name = model_name
 
+        # Local rules answer budget / diet / hot-cold / milk queries without
+        # a Gemini round trip; the LLM only sees the low-confidence rest
+        self.rule_parser = RuleBasedConstraintParser()
+        self.fast_path_min_confidence = fast_path_min_confidence
+        self._stats_lock = threading.Lock()
+        self.fast_path_hits = 0
+        self.llm_calls = 0
+
+        # Extraction runs at temperature 0.0: the validated output for the
+        # same prompt inputs (query + last-4-turn context) is reused
+        self.cache = LRUTTLCache(
+            max_entries=cache_max_entries,
+            max_bytes=cache_max_bytes,
+            ttl_seconds=cache_ttl_seconds,
+            sizeof=lambda value: len(json.dumps(value)),
+        )
+
     def _safe_json_parse(self, text: str) -> dict:
         text = re.sub(r"```(?:json)?", "", text, flags=re.IGNORECASE).strip()
         try:
@@ -439,6 +467,9 @@ class LLMConstraintExtractor:
         return {}
 
     def extract(self, user_query: str, chat_history: Optional[List[Dict]] = None) -> Dict:
+        constraints, key = self._extract_locally(user_query, chat_history)
+        if constraints is not None:
+            return constraints
         prompt = self._build_prompt(user_query, chat_history)
 
         try:
@@ -446,27 +477,98 @@ class LLMConstraintExtractor:
             response = self.client.models.generate_content(
                 model=self.model_name,
                 contents=prompt,
-                config=types.GenerateContentConfig(
-                    temperature=0.0,
-                    max_output_tokens=1000
-                )
+                config=self._config()
+            )
+            return self._from_llm_output(response.text, key)
+
+        except Exception as e:
+            print(f"[Extractor Error] {e}")
+            return self._empty_constraints()
+
+    async def extract_async(self, user_query: str, chat_history: Optional[List[Dict]] = None) -> Dict:
+        """extract() on client.aio: the Gemini round trip does not hold a thread."""
+        constraints, key = self._extract_locally(user_query, chat_history)
+        if constraints is not None:
+            return constraints
+        prompt = self._build_prompt(user_query, chat_history)
+
+        try:
+            response = await self.client.aio.models.generate_content(
+                model=self.model_name,
+                contents=prompt,
+                config=self._config()
             )
-            
-            # The new SDK response object has a .text property
-            return self._validate(self._safe_json_parse(response.text))
+            return self._from_llm_output(response.text, key)
 
         except Exception as e:
             print(f"[Extractor Error] {e}")
             return self._empty_constraints()
 
+    def _extract_locally(self, user_query: str, chat_history: Optional[List[Dict]]) -> Tuple[Optional[Dict], tuple]:
+        """
+        Rule fast path, then the cache. Returns (constraints, cache key);
+        constraints is None when the LLM has to be asked.
+        """
+        constraints, confidence = self.rule_parser.parse(user_query, chat_history)
+        if confidence >= self.fast_path_min_confidence:
+            with self._stats_lock:
+                self.fast_path_hits += 1
+            return self._validate(constraints), None
+
+        key = self._cache_key(user_query, chat_history)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return self._copy(cached), key
+
+        with self._stats_lock:
+            self.llm_calls += 1
+        return None, key
+
+    @staticmethod
+    def _config() -> types.GenerateContentConfig:
+        return types.GenerateContentConfig(
+            temperature=0.0,
+            max_output_tokens=1000,
+            # Plain JSON answer, no tools: skip the SDK's function-calling loop
+            automatic_function_calling=types.AutomaticFunctionCallingConfig(disable=True),
+        )
+
+    def _from_llm_output(self, text: str, key: tuple) -> Dict:
+        # The new SDK response object has a .text property
+        parsed = self._safe_json_parse(text)
+        constraints = self._validate(parsed)
+        # Unparseable output is not cached (it would pin the fallback)
+        if parsed:
+            self.cache.put(key, self._copy(constraints))
+        return constraints
+
+    def _cache_key(self, user_query: str, chat_history: Optional[List[Dict]]) -> tuple:
+        context = self._context_str(chat_history)
+        context_hash = hashlib.sha256(context.encode("utf-8")).hexdigest()
+        return (self.model_name, normalize_query(user_query), context_hash)
+
+    @staticmethod
+    def _copy(constraints: Dict) -> Dict:
+        # Cached dicts are shared: callers get their own lists
+        return {k: list(v) if isinstance(v, list) else v for k, v in constraints.items()}
+
+    def _context_str(self, chat_history: Optional[List[Dict]] = None) -> str:
+        """
+        The conversation part of the prompt: the last few requests and the
+        constraints in force after them (earlier answers are not needed to
+        inherit budget / diet / category).
+        """
+        turns = as_turns(chat_history)[-CONTEXT_TURNS:]
+        if not turns:
+            return "No previous conversation."
+        context_str = "".join(f"User: {turn['user']}\n" for turn in turns)
+        state = inherited_constraints(turns)
+        if state:
+            context_str += f"Constraints in force: {format_constraints(state)}\n"
+        return context_str
+
     def _build_prompt(self, user_query: str, chat_history: Optional[List[Dict]] = None) -> str:
-        context_str = "No previous conversation."
-        if chat_history:
-            last_turns = chat_history[-4:]
-            context_str = ""
-            for msg in last_turns:
-                role = "User" if msg["role"] == "user" else "Assistant"
-                context_str += f"{role}: {msg['content']}\n"
+        context_str = self._context_str(chat_history)
 
         return f"""
 You are a query planner. Extract search constraints from the LATEST query.
@@ -514,7 +616,14 @@ Output: {{ "max_price": 200, "diet": ["vegan"], "category_hint": "drinks" }}
         return safe
 
     def _empty_constraints(self) -> Dict:
-        return {
-            "max_price": None, "min_price": None, "diet": [], 
-            "temperature": [], "milk": None, "category_hint": None
-        }
\ No newline at end of file
+        return empty_constraints()
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            total = self.fast_path_hits + self.llm_calls
+            return {
+                "fast_path_hits": self.fast_path_hits,
+                "llm_calls": self.llm_calls,
+                "fast_path_rate": (self.fast_path_hits / total) if total else 0.0,
+                "cache": self.cache.stats(),
+            }
\ No newline at end of file
@@ -0,0 +1,200 @@
+# app/features/cafe_chatbot/query_understanding/rule_parser.py
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+from ..conversation import CONTEXT_TURNS, as_turns
+
+
+CURRENCY = r"(?:₹|rs\.?|inr|rupees?)"
+AMOUNT = rf"{CURRENCY}?\s*(\d{{1,4}})\s*(?:/-)?\s*{CURRENCY}?"
+
+# (pattern, constraint) in match order; a matched span is consumed so the
+# later, looser patterns cannot read the same words again
+PRICE_PATTERNS = [
+    (re.compile(rf"\bbetween\s+{AMOUNT}\s+and\s+{AMOUNT}"), "range"),
+    (re.compile(rf"\bfrom\s+{AMOUNT}\s+to\s+{AMOUNT}"), "range"),
+    (re.compile(rf"{AMOUNT}\s*(?:-|–|to)\s*{AMOUNT}"), "range"),
+    (re.compile(
+        rf"\b(?:under|below|less\s+than|lesser\s+than|cheaper\s+than|up\s*to|within|"
+        rf"max(?:imum)?|at\s+most|not\s+more\s+than|no\s+more\s+than|budget(?:\s+is|\s+of)?)"
+        rf"\s*:?\s*{AMOUNT}"
+    ), "max"),
+    (re.compile(rf"{AMOUNT}\s+(?:or|and)\s+(?:less|below|under)\b"), "max"),
+    (re.compile(
+        rf"\b(?:above|over|more\s+than|at\s+least|min(?:imum)?|starting\s+(?:from|at))\s*{AMOUNT}"
+    ), "min"),
+    (re.compile(rf"{AMOUNT}\s+(?:or|and)\s+(?:more|above|over)\b"), "min"),
+]
+
+# (pattern, constraint key, value)
+ATTRIBUTE_PATTERNS = [
+    (re.compile(r"\b(?:vegan|plant[\s-]*based)\b"), "diet", "vegan"),
+    (re.compile(r"\b(?:vegetarian|veg)\b"), "diet", "vegetarian"),
+    (re.compile(r"\b(?:without\s+milk|no\s+milk|non[\s-]*milk|milk[\s-]*free|dairy[\s-]*free|lactose[\s-]*free)\b"), "milk", "non-milk"),
+    (re.compile(r"\b(?:with\s+milk|milky|milk[\s-]*based|milk)\b"), "milk", "milk"),
+    (re.compile(r"\b(?:hot|warm)\b"), "temperature", "hot"),
+    (re.compile(r"\b(?:cold|iced|chilled|cool)\b"), "temperature", "cold"),
+]
+
+# Not expressible as a constraint: kept as one unexplained word (-> LLM)
+NON_VEG_PATTERN = re.compile(r"\bnon[\s-]*veg(?:etarian)?\b")
+
+# Words that carry no constraint of their own ("show me all the ... please")
+FILLER_WORDS = {
+    "i", "im", "me", "my", "we", "us", "you", "your", "please", "pls", "plz",
+    "show", "list", "give", "get", "got", "find", "suggest", "recommend", "want",
+    "need", "like", "would", "could", "can", "have", "has", "do", "does", "is",
+    "are", "am", "be", "there", "what", "whats", "which", "any", "anything",
+    "something", "some", "all", "everything", "every", "items", "item", "options",
+    "option", "stuff", "things", "the", "a", "an", "of", "for", "to", "in", "on",
+    "at", "with", "and", "or", "only", "just", "ones", "one", "those", "these",
+    "them", "that", "it", "more", "also", "too", "instead", "about", "how", "but",
+    "available", "menu", "price", "priced", "cost", "costs", "costing", "now",
+    "right", "today", "ok", "okay", "then", "else",
+}
+
+# With history, every turn refines the constraints in force ("show me vegan
+# options" after "cold coffee under 200" keeps the budget). Only an explicit
+# reset starts over; request verbs alone ("show", "list") do not
+RESET_PATTERN = re.compile(
+    r"\b(?:forget\s+(?:that|it|this|all\s+that|everything|about\s+(?:that|it))|"
+    r"never\s*mind|scratch\s+that|start\s+(?:over|again|fresh)|from\s+scratch|"
+    r"new\s+(?:order|search|request)|something\s+(?:else|different)|reset|clear\s+(?:that|it|filters?))\b"
+)
+TOKEN_PATTERN = re.compile(r"₹|[a-z]+|\d+")
+
+MAX_VALID_PRICE = 5000
+
+
+def empty_constraints() -> Dict:
+    return {
+        "max_price": None, "min_price": None, "diet": [],
+        "temperature": [], "milk": None, "category_hint": None
+    }
+
+
+class RuleBasedConstraintParser:
+    """
+    Deterministic parser for the constraints that do not need an LLM:
+    budgets (₹, "under", "below", ranges, minimums), diet words, hot/cold
+    and milk / non-milk. With history, a turn inherits the earlier
+    constraints unless it is an explicit reset ("forget that, ...").
+
+    Returns the LLMConstraintExtractor dict shape plus a confidence:
+    1.0 when every word of the query (and of the turns it inherits from) is
+    either a recognized constraint or filler. Any leftover word may be a
+    category or mood the rules cannot map, so confidence drops below 0.5
+    and the caller should ask the LLM.
+    """
+
+    def parse(self, user_query: str, chat_history: Optional[List[Dict]] = None) -> Tuple[Dict, float]:
+        reset = self._is_reset(user_query)
+        if reset:
+            # The reset words themselves are not leftover words for the LLM
+            user_query = RESET_PATTERN.sub(" ", user_query.lower())
+        constraints, confidence = self._parse_turn(user_query)
+
+        if chat_history and not reset:
+            base, base_confidence = self._fold_history(chat_history)
+            if base is not None:
+                constraints = self._inherit(base, constraints)
+                confidence = min(confidence, base_confidence)
+
+        min_price, max_price = constraints["min_price"], constraints["max_price"]
+        if min_price is not None and max_price is not None and min_price > max_price:
+            return constraints, 0.0
+        return constraints, confidence
+
+    # -----------------------------
+    # One turn
+    # -----------------------------
+
+    def _parse_turn(self, text: str) -> Tuple[Dict, float]:
+        text = " " + text.lower().replace("₹", " ₹ ") + " "
+        total = len(TOKEN_PATTERN.findall(text))
+        if total == 0:
+            return empty_constraints(), 0.0
+
+        constraints = empty_constraints()
+
+        def consume_price(kind: str):
+            def handler(match):
+                values = [int(v) for v in match.groups() if v is not None]
+                if not all(0 < v < MAX_VALID_PRICE for v in values):
+                    return match.group(0)
+                if kind == "range":
+                    constraints["min_price"], constraints["max_price"] = min(values), max(values)
+                elif kind == "max":
+                    constraints["max_price"] = values[0]
+                else:
+                    constraints["min_price"] = values[0]
+                return " "
+            return handler
+
+        for pattern, kind in PRICE_PATTERNS:
+            text = pattern.sub(consume_price(kind), text)
+
+        def consume_attribute(key: str, value: str):
+            def handler(match):
+                if key == "milk":
+                    constraints["milk"] = constraints["milk"] or value
+                elif value not in constraints[key]:
+                    constraints[key].append(value)
+                return " "
+            return handler
+
+        text = NON_VEG_PATTERN.sub(" nonveg ", text)
+        for pattern, key, value in ATTRIBUTE_PATTERNS:
+            text = pattern.sub(consume_attribute(key, value), text)
+
+        leftover = [t for t in TOKEN_PATTERN.findall(text) if t not in FILLER_WORDS]
+        if not leftover:
+            return constraints, 1.0
+        return constraints, 0.5 * (1 - len(leftover) / total)
+
+    # -----------------------------
+    # Follow-up inheritance
+    # -----------------------------
+
+    @staticmethod
+    def _is_reset(text: str) -> bool:
+        return bool(RESET_PATTERN.search(text.lower()))
+
+    def _fold_history(self, chat_history: List[Dict]) -> Tuple[Optional[Dict], float]:
+        """
+        Constraints in force after the recent turns: the last turn's resolved
+        constraints when it has them, else folded from the user texts (same
+        window as the LLM prompt).
+        """
+        turns = as_turns(chat_history)[-CONTEXT_TURNS:]
+        if turns and turns[-1].get("constraints") is not None:
+            return dict(turns[-1]["constraints"]), 1.0
+
+        state, confidence = None, 1.0
+        for record in turns:
+            text = record["user"]
+            reset = self._is_reset(text)
+            turn, turn_confidence = self._parse_turn(RESET_PATTERN.sub(" ", text.lower()) if reset else text)
+            if state is not None and not reset:
+                state = self._inherit(state, turn)
+                confidence = min(confidence, turn_confidence)
+            else:
+                state, confidence = turn, turn_confidence
+        return state, confidence
+
+    @staticmethod
+    def _inherit(base: Dict, current: Dict) -> Dict:
+        """Explicit values in the current turn overwrite, the rest carries over."""
+        merged = dict(base)
+        for key, value in current.items():
+            if value not in (None, []):
+                merged[key] = value
+        # A restated bound that contradicts the inherited one replaces the range
+        if current["min_price"] is not None and current["max_price"] is None:
+            if merged["max_price"] is not None and merged["max_price"] < current["min_price"]:
+                merged["max_price"] = None
+        if current["max_price"] is not None and current["min_price"] is None:
+            if merged["min_price"] is not None and merged["min_price"] > current["max_price"]:
+                merged["min_price"] = None
+        return merged
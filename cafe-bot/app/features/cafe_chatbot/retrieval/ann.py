@@ -0,0 +1,275 @@
+# app/features/cafe_chatbot/retrieval/ann.py
+
+"""
+Vector index types ("index_type" in config.json).
+
+  numpy     exact, one NumPy matmul (tiny menus: no FAISS call overhead)
+  flat      exact, IndexFlatIP
+  sq_fp16   exhaustive scan over fp16 codes (1/2 the memory of flat)
+  sq_int8   exhaustive scan over int8 codes (1/4 the memory of flat)
+  hnsw      graph search, IndexHNSWFlat                  ("efSearch")
+  ivf_flat  inverted lists, IndexIVFFlat                 ("nprobe")
+  ivf_pq    inverted lists + product quantization        ("nprobe")
+
+Every variant is addressed by the stable vector_ids and accepts the
+metadata filters (FAISS ID selector, or an id mask for the NumPy path).
+"""
+
+import math
+from pathlib import Path
+from typing import Dict, Optional
+
+import faiss
+import numpy as np
+
+
+INDEX_TYPES = ("numpy", "flat", "sq_fp16", "sq_int8", "hnsw", "ivf_flat", "ivf_pq")
+
+# Values written by older builders
+LEGACY_INDEX_TYPES = {"IndexFlatIP": "flat", "IndexIDMap2,IndexFlatIP": "flat"}
+
+# Query-time knobs, overridable per bundle with config.json "search_params"
+DEFAULT_SEARCH_PARAMS = {
+    "hnsw": {"efSearch": 64},
+    "ivf_flat": {"nprobe": 16},
+    "ivf_pq": {"nprobe": 16},
+}
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+PQ_BITS = 8
+
+# Auto-selection thresholds (item counts)
+NUMPY_MAX_ITEMS = 2_000
+EXACT_MAX_ITEMS = 50_000
+EXHAUSTIVE_MAX_ITEMS = 200_000
+
+# Vectors used to train IVF / SQ quantizers
+MAX_TRAIN_VECTORS = 100_000
+ADD_CHUNK = 65_536
+
+
+def index_kind(config: Dict) -> str:
+    kind = config.get("index_type", "flat")
+    kind = LEGACY_INDEX_TYPES.get(kind, kind)
+    if kind not in INDEX_TYPES:
+        raise RuntimeError(f"Unknown index_type in config.json: {kind}")
+    return kind
+
+
+def index_file(kind: str) -> str:
+    return "vectors.npy" if kind == "numpy" else "index.faiss"
+
+
+def ivf_nlist(n: int) -> int:
+    # ~4*sqrt(n) lists, but FAISS wants >= 39 training points per list
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def min_train_vectors(kind: str, n: int) -> int:
+    """
+    Vectors needed to train `kind` over n items: 39 per inverted list for
+    IVF, and for PQ also one per centroid of each 2**PQ_BITS codebook
+    (FAISS refuses to train with fewer).
+    """
+    if kind == "ivf_pq":
+        return max(2 ** PQ_BITS, 39 * ivf_nlist(n))
+    if kind == "ivf_flat":
+        return 39 * ivf_nlist(n)
+    return 1
+
+
+def can_build(kind: str, n: int) -> bool:
+    return n >= min_train_vectors(kind, n)
+
+
+def pq_subquantizers(dimension: int) -> int:
+    """8 dims per 1-byte code (384 -> 48 bytes per vector)."""
+    for dims_per_code in (8, 4, 2, 1):
+        if dimension % dims_per_code == 0:
+            return dimension // dims_per_code
+    return dimension
+
+
+def bytes_per_vector(kind: str, dimension: int) -> int:
+    """Approximate resident bytes per item, including its 8-byte id."""
+    code = {
+        "numpy": 4 * dimension,
+        "flat": 4 * dimension,
+        "sq_fp16": 2 * dimension,
+        "sq_int8": dimension,
+        "hnsw": 4 * dimension + 2 * HNSW_M * 4,
+        "ivf_flat": 4 * dimension,
+        "ivf_pq": pq_subquantizers(dimension) * PQ_BITS // 8,
+    }[kind]
+    return code + 8
+
+
+def choose_index_type(n: int, dimension: int, memory_budget_bytes: int) -> str:
+    """
+    Smallest-latency index that fits the memory budget for n items:
+    exact search while it is cheap, then graph / inverted-list indexes.
+    IVF / PQ types are only considered once there are enough vectors to
+    train them; over budget, the smallest trainable type is used.
+    """
+    if n <= NUMPY_MAX_ITEMS:
+        candidates = ("numpy", "flat")
+    elif n <= EXACT_MAX_ITEMS:
+        candidates = ("flat", "sq_fp16", "sq_int8", "hnsw", "ivf_pq")
+    elif n <= EXHAUSTIVE_MAX_ITEMS:
+        candidates = ("hnsw", "flat", "sq_fp16", "sq_int8", "ivf_pq")
+    else:
+        # Exhaustive scans are too slow per query at this size
+        candidates = ("hnsw", "ivf_flat", "ivf_pq")
+
+    for kind in candidates:
+        if can_build(kind, n) and n * bytes_per_vector(kind, dimension) <= memory_budget_bytes:
+            return kind
+    return "ivf_pq" if can_build("ivf_pq", n) else "sq_int8"
+
+
+class NumpyIndex:
+    """
+    Exact inner-product search with a single matmul. Mirrors the parts of
+    the FAISS index API the retriever uses (d, ntotal, search).
+    """
+
+    class SearchParams:
+        def __init__(self, id_mask: Optional[np.ndarray] = None):
+            # Bool array over vector ids (True = allowed)
+            self.id_mask = id_mask
+
+    def __init__(self, vectors: np.ndarray, ids: np.ndarray):
+        self.vectors = vectors
+        self.ids = ids
+        self.d = vectors.shape[1]
+        self.ntotal = vectors.shape[0]
+
+    def search(self, x: np.ndarray, k: int, params=None):
+        # float64 queries would make the matmul convert the whole matrix
+        x = np.asarray(x, dtype=np.float32)
+        scores = x @ self.vectors.T
+        if params is not None and params.id_mask is not None:
+            scores = np.where(params.id_mask[self.ids], scores, -np.inf)
+
+        k = min(k, self.ntotal)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        rows = np.take_along_axis(top, order, axis=1)
+
+        out_scores = np.take_along_axis(top_scores, order, axis=1).astype(np.float32)
+        out_ids = self.ids[rows]
+        out_ids[~np.isfinite(out_scores)] = -1
+        return out_scores, out_ids
+
+
+def _train_sample(vectors: np.ndarray) -> np.ndarray:
+    n = vectors.shape[0]
+    if n <= MAX_TRAIN_VECTORS:
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+    rows = np.sort(np.random.default_rng(0).choice(n, MAX_TRAIN_VECTORS, replace=False))
+    return np.ascontiguousarray(vectors[rows], dtype=np.float32)
+
+
+def build_index(kind: str, vectors: np.ndarray, ids: np.ndarray):
+    """
+    Build an index of `kind` over (n, d) normalized float32 vectors (a memmap
+    is fine: rows are added in chunks) addressed by int64 `ids`.
+    """
+    n, d = vectors.shape
+    ids = np.ascontiguousarray(ids, dtype=np.int64)
+    if kind in INDEX_TYPES and not can_build(kind, n):
+        raise RuntimeError(
+            f"{kind} needs at least {min_train_vectors(kind, n)} vectors to train, got {n}"
+        )
+
+    if kind == "numpy":
+        return NumpyIndex(np.array(vectors, dtype=np.float32), ids)
+
+    ip = faiss.METRIC_INNER_PRODUCT
+    if kind == "flat":
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(d))
+    elif kind in ("sq_fp16", "sq_int8"):
+        qtype = faiss.ScalarQuantizer.QT_fp16 if kind == "sq_fp16" else faiss.ScalarQuantizer.QT_8bit
+        index = faiss.IndexIDMap2(faiss.IndexScalarQuantizer(d, qtype, ip))
+    elif kind == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(d, HNSW_M, ip)
+        hnsw.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index = faiss.IndexIDMap2(hnsw)
+    elif kind == "ivf_flat":
+        index = faiss.IndexIVFFlat(faiss.IndexFlatIP(d), d, ivf_nlist(n), ip)
+    elif kind == "ivf_pq":
+        index = faiss.IndexIVFPQ(faiss.IndexFlatIP(d), d, ivf_nlist(n), pq_subquantizers(d), PQ_BITS, ip)
+    else:
+        raise RuntimeError(f"Unknown index type: {kind}")
+
+    if not index.is_trained:
+        index.train(_train_sample(vectors))
+
+    for start in range(0, n, ADD_CHUNK):
+        index.add_with_ids(
+            np.ascontiguousarray(vectors[start:start + ADD_CHUNK], dtype=np.float32),
+            ids[start:start + ADD_CHUNK],
+        )
+    return index
+
+
+def write_index(index, bundle_dir: Path):
+    if isinstance(index, NumpyIndex):
+        np.save(bundle_dir / "vectors.npy", index.vectors)
+        np.save(bundle_dir / "vector_ids.npy", index.ids)
+    else:
+        faiss.write_index(index, str(bundle_dir / "index.faiss"))
+
+
+def read_faiss_index(index_path: Path, mmap: bool = False):
+    if not mmap:
+        return faiss.read_index(str(index_path))
+
+    # IO_FLAG_MMAP_IFC maps flat codes zero-copy (newer FAISS); older
+    # builds only know IO_FLAG_MMAP
+    flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    try:
+        return faiss.read_index(str(index_path), flags)
+    except RuntimeError as e:
+        print(f"[Retriever] mmap read failed ({e}), loading index into memory")
+        return faiss.read_index(str(index_path))
+
+
+def load_index(bundle_dir: Path, config: Dict, mmap: bool = False):
+    kind = index_kind(config)
+    path = bundle_dir / index_file(kind)
+    if not path.exists():
+        raise RuntimeError(f"{path.name} not found in {bundle_dir}")
+
+    if kind == "numpy":
+        mode = "r" if mmap else None
+        return NumpyIndex(
+            np.load(path, mmap_mode=mode),
+            np.load(bundle_dir / "vector_ids.npy"),
+        )
+
+    return read_faiss_index(path, mmap)
+
+
+def search_parameters(
+    kind: str,
+    params: Dict,
+    selector=None,
+    id_mask: Optional[np.ndarray] = None,
+):
+    """
+    Per-type search parameters (+ filter). Returns None when the defaults
+    of an unfiltered exact search apply.
+    """
+    if kind == "numpy":
+        return None if id_mask is None else NumpyIndex.SearchParams(id_mask)
+
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=params.get("efSearch", 64))
+
+    if kind in ("ivf_flat", "ivf_pq"):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=params.get("nprobe", 16))
+
+    return None if selector is None else faiss.SearchParameters(sel=selector)
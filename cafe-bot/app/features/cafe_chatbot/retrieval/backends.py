@@ -0,0 +1,161 @@
+# app/features/cafe_chatbot/retrieval/backends.py
+
+"""
+Embedding backends for QueryEmbedder.
+
+Both model backends produce the same thing: L2-normalized, mean-pooled
+float32 sentence embeddings for all-MiniLM-L6-v2. Imports are done lazily so
+the ONNX backend never pulls torch into the process.
+
+The "hash" backend needs no model at all (offline benchmarks and smoke tests).
+"""
+
+import os
+import re
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+def embed_threads() -> Optional[int]:
+    """
+    CAFE_EMBED_THREADS pins the intra-op thread count of either backend.
+    The pre-fork server sets it to 1 so N workers do not oversubscribe cores
+    (and no thread pool is created before fork()).
+    """
+    value = os.getenv("CAFE_EMBED_THREADS")
+    return int(value) if value else None
+
+
+class SentenceTransformerBackend:
+    name = "sentence-transformers"
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+
+        threads = embed_threads()
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+
+        self.model = SentenceTransformer(model_name)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=max(len(texts), 1),
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+
+
+class OnnxEmbeddingBackend:
+    """
+    ONNX Runtime copy of the sentence-transformer (optionally int8 quantized).
+    Needs only `onnxruntime` + `tokenizers`; see scripts/export_onnx_embedder.py.
+    """
+
+    name = "onnx"
+
+    def __init__(
+        self,
+        model_dir: str,
+        model_file: str = "model_int8.onnx",
+        max_seq_length: int = 256,
+        intra_op_threads: Optional[int] = None,
+    ):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_dir = Path(model_dir)
+        model_path = model_dir / model_file
+        tokenizer_path = model_dir / "tokenizer.json"
+
+        if not model_path.exists():
+            raise RuntimeError(f"ONNX model not found: {model_path}")
+        if not tokenizer_path.exists():
+            raise RuntimeError(f"tokenizer.json not found in {model_dir}")
+
+        self.tokenizer = Tokenizer.from_file(str(tokenizer_path))
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+
+        self.session = ort.InferenceSession(
+            str(model_path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.dimension = self.session.get_outputs()[0].shape[-1]
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array(
+                [e.type_ids for e in encodings], dtype=np.int64
+            )
+
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real tokens, then L2 normalize (same as the
+        # Pooling + Normalize modules of the sentence-transformer)
+        mask = attention_mask[:, :, None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        counts = np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled = summed / counts
+        norms = np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return (pooled / norms).astype(np.float32)
+
+
+class HashingEmbeddingBackend:
+    """
+    Deterministic feature hashing of word tokens into `dimension` signed
+    buckets, L2-normalized. Only token overlap is captured, no semantics:
+    meant for benchmarks that must run without a model or network.
+    """
+
+    name = "hash"
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in re.findall(r"[a-z0-9]+", text.lower()):
+                # crc32 is stable across processes (hash() is salted)
+                h = zlib.crc32(token.encode("utf-8"))
+                out[row, h % self.dimension] += 1.0 if h & 0x80000000 else -1.0
+        norms = np.clip(np.linalg.norm(out, axis=1, keepdims=True), 1e-12, None)
+        return out / norms
+
+
+def create_backend(model_name: str, backend: str = "sentence-transformers", options: Optional[Dict] = None):
+    """Build the embedding backend named in config.json ("embedding_backend")."""
+    options = options or {}
+
+    if backend == SentenceTransformerBackend.name:
+        return SentenceTransformerBackend(model_name)
+
+    if backend == OnnxEmbeddingBackend.name:
+        return OnnxEmbeddingBackend(
+            model_dir=options["model_dir"],
+            model_file=options.get("model_file", "model_int8.onnx"),
+            max_seq_length=options.get("max_seq_length", 256),
+            intra_op_threads=options.get("intra_op_threads") or embed_threads(),
+        )
+
+    if backend == HashingEmbeddingBackend.name:
+        return HashingEmbeddingBackend(dimension=options.get("dimension", 384))
+
+    raise RuntimeError(f"Unknown embedding backend: {backend}")
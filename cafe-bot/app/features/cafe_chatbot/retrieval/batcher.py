@@ -0,0 +1,136 @@
+# app/features/cafe_chatbot/retrieval/batcher.py
+
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List
+
+import numpy as np
+
+
+class EmbeddingBatcher:
+    """
+    Dynamic micro-batching for query embeddings.
+
+    Request threads submit single texts; one background worker collects
+    whatever arrives within `max_wait_ms` (or until `max_batch_size` texts are
+    queued), encodes them in a single forward pass and hands every caller its
+    own row.
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], np.ndarray],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 3.0,
+    ):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._closed = False
+        self._start_lock = threading.Lock()
+        self._pid = None
+
+        self.batches = 0
+        self.items = 0
+        self.max_seen_batch = 0
+
+    def _ensure_worker(self):
+        """
+        Start the worker lazily, once per process. Threads do not survive
+        fork(), so a pre-forked worker gets its own queue + thread here.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue: "queue.Queue" = queue.Queue()
+            self._worker = threading.Thread(
+                target=self._run, name="embedding-batcher", daemon=True
+            )
+            self._worker.start()
+            self._pid = os.getpid()
+
+    def submit(self, text: str) -> Future:
+        if self._closed:
+            raise RuntimeError("EmbeddingBatcher is closed")
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def embed(self, text: str) -> np.ndarray:
+        """Blocking helper: returns a (1, dim) float32 array."""
+        return self.submit(text).result()
+
+    def close(self):
+        self._closed = True
+        if self._pid == os.getpid():
+            self._queue.put(None)
+            self._worker.join(timeout=1.0)
+
+    # -----------------------------
+    # Worker loop
+    # -----------------------------
+
+    def _collect(self) -> list:
+        first = self._queue.get()
+        if first is None:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is None:
+                self._closed = True
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                return
+
+            # Identical concurrent queries share one row
+            unique_texts = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                vectors = np.ascontiguousarray(
+                    self.encode_fn(unique_texts), dtype=np.float32
+                )
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            row_of = {text: i for i, text in enumerate(unique_texts)}
+            for text, future in batch:
+                row = vectors[row_of[text]:row_of[text] + 1].copy()
+                future.set_result(row)
+
+            self.batches += 1
+            self.items += len(batch)
+            self.max_seen_batch = max(self.max_seen_batch, len(batch))
+
+            if self._closed and self._queue.empty():
+                return
+
+    def stats(self) -> Dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": (self.items / self.batches) if self.batches else 0.0,
+            "max_batch_size_seen": self.max_seen_batch,
+        }
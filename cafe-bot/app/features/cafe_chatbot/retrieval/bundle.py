@@ -0,0 +1,230 @@
+# app/features/cafe_chatbot/retrieval/bundle.py
+
+import json
+import time
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .ann import DEFAULT_SEARCH_PARAMS, index_kind, search_parameters
+from .embedder import QueryEmbedder
+from .lexical_index import LexicalIndex, reciprocal_rank_fusion
+from .metadata_store import MenuMetadataStore
+from .shard_router import ShardRouter
+from .structured_index import StructuredIndex
+
+
+# Versioned layout written by the builder:
+#   storage/cafe_faiss/CURRENT              -> "versions/20260101T000000Z"
+#   storage/cafe_faiss/versions/<id>/...    -> index.faiss (or vectors.npy), metadata.jsonl, config.json, ...
+# A storage dir without CURRENT is a legacy flat bundle.
+CURRENT_POINTER = "CURRENT"
+VERSIONS_DIR = "versions"
+
+FILTER_KEYS = {
+    "max_price", "min_price", "require_in_stock", "diet", "temperature", "milk",
+    "category_ids", "subcategory_ids", "group_ids",
+}
+
+# Structured listings take the same filters as the hybrid search
+STRUCTURED_FILTER_KEYS = FILTER_KEYS
+
+
+def resolve_bundle_dir(storage_dir: Path) -> Path:
+    pointer = storage_dir / CURRENT_POINTER
+    if pointer.exists():
+        return storage_dir / pointer.read_text(encoding="utf-8").strip()
+    return storage_dir
+
+
+def publish_bundle(storage_dir: Path, bundle_dir: Path):
+    """Atomically point CURRENT at a fully written bundle directory."""
+    tmp = storage_dir / (CURRENT_POINTER + ".tmp")
+    tmp.write_text(str(bundle_dir.relative_to(storage_dir)), encoding="utf-8")
+    tmp.replace(storage_dir / CURRENT_POINTER)
+
+
+def bundle_signature(bundle_dir: Path) -> Tuple:
+    """Changes whenever a different (or rewritten) bundle becomes current."""
+    config_path = bundle_dir / "config.json"
+    try:
+        stat = config_path.stat()
+    except FileNotFoundError:
+        return (str(bundle_dir), None)
+    return (str(bundle_dir.resolve()), stat.st_mtime_ns, stat.st_size)
+
+
+class RetrievalBundle:
+    """
+    One generation of retrieval state: config, vector index (any ann.py
+    type), metadata columns, BM25 index, price/attribute index, shards and
+    the embedder matching that index.
+
+    A bundle is never mutated after construction. The retriever swaps whole
+    bundles, so a search that grabbed the old one finishes on it consistently.
+    """
+
+    def __init__(
+        self,
+        bundle_dir: Path,
+        config: Dict,
+        index,
+        store: MenuMetadataStore,
+        embedder: QueryEmbedder,
+        generation: int = 0,
+    ):
+        self.bundle_dir = bundle_dir
+        self.config = config
+        self.index = index
+        self.store = store
+        self.embedder = embedder
+        self.generation = generation
+        self.signature = bundle_signature(bundle_dir)
+        self.load_timings: Dict[str, float] = {}
+
+        self.dimension = config["dimension"]
+        self.menu_version = config.get("menu_version")
+        self.index_kind = index_kind(config)
+        self.ann_params = {
+            **DEFAULT_SEARCH_PARAMS.get(self.index_kind, {}),
+            **config.get("search_params", {}),
+        }
+
+        self.validate()
+
+        # BM25 over names + category/group labels ("hybrid": {"enabled", "rrf_k"})
+        self.lexical: Optional[LexicalIndex] = None
+        self.rrf_k = 60
+        hybrid_cfg = config.get("hybrid", {})
+        if hybrid_cfg.get("enabled", True):
+            start = time.perf_counter()
+            self.lexical = LexicalIndex(list(store.iter_records()))
+            self.rrf_k = hybrid_cfg.get("rrf_k", 60)
+            self.load_timings["lexical"] = round(time.perf_counter() - start, 3)
+
+        # Price-sorted cells for exact listings (no embedding)
+        start = time.perf_counter()
+        self.structured = StructuredIndex(store)
+        self.load_timings["structured"] = round(time.perf_counter() - start, 3)
+
+        # Category/group routing, if the builder emitted shards
+        self.router: Optional[ShardRouter] = None
+        routing_cfg = dict(config.get("routing", {}))
+        if routing_cfg.pop("enabled", True):
+            start = time.perf_counter()
+            self.router = ShardRouter.load(bundle_dir, routing_cfg)
+            if self.router is not None:
+                self.load_timings["shards"] = round(time.perf_counter() - start, 3)
+
+    def validate(self):
+        if self.index.d != self.dimension:
+            raise RuntimeError("Embedding dimension mismatch")
+        if self.embedder.dimension != self.dimension:
+            raise RuntimeError("Embedder / index dimension mismatch")
+        if self.index.ntotal != len(self.store):
+            raise RuntimeError("Index / metadata size mismatch")
+        expected = self.config.get("num_items")
+        if expected is not None and expected != self.index.ntotal:
+            raise RuntimeError(
+                f"config.json num_items={expected} but index holds {self.index.ntotal}"
+            )
+
+    @staticmethod
+    def read_config(bundle_dir: Path) -> Dict:
+        # The vector index file depends on index_type (see ann.load_index)
+        for name in ("metadata.jsonl", "config.json"):
+            if not (bundle_dir / name).exists():
+                raise RuntimeError(f"{name} not found in {bundle_dir}")
+        with open(bundle_dir / "config.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    # -----------------------------
+    # Search helpers
+    # -----------------------------
+
+    def search_params(self, top_k: int, filters: Dict):
+        """
+        Resolve a filter dict into (k, row mask | None, search params | None).
+        The params carry the filter and the index type's knobs (efSearch,
+        nprobe). k is capped by the number of items that can pass the filters.
+        """
+        unknown = set(filters) - FILTER_KEYS
+        if unknown:
+            raise ValueError(f"Unknown search filters: {sorted(unknown)}")
+
+        mask = self.store.build_mask(**filters)
+
+        k = min(top_k, self.index.ntotal)
+        if mask is not None:
+            k = min(k, int(mask.sum()))
+        return k, mask, self.mask_params(mask)
+
+    def mask_params(self, mask: Optional[np.ndarray]):
+        """Search params of the index type, restricted to the rows of `mask`."""
+        if mask is None:
+            return search_parameters(self.index_kind, self.ann_params)
+        if self.index_kind == "numpy":
+            return search_parameters(
+                self.index_kind, self.ann_params, id_mask=self.store.id_bitmap(mask)
+            )
+        return search_parameters(
+            self.index_kind, self.ann_params, selector=self.store.id_selector(mask)
+        )
+
+    def exact_match(self, query: str, mask: Optional[np.ndarray], k: int) -> Optional[List[Dict]]:
+        """High-confidence lexical hit: the query is an item name."""
+        if self.lexical is None:
+            return None
+
+        rows = self.lexical.exact_rows(query)
+        if rows is None:
+            return None
+        if mask is not None:
+            rows = rows[mask[rows]]
+        if not len(rows):
+            return None
+
+        rows = rows[:k]
+        return self.store.rows_to_results(rows, np.ones(len(rows), dtype=np.float32))
+
+    def fuse(
+        self,
+        query: str,
+        vector_ids: np.ndarray,
+        scores: np.ndarray,
+        mask: Optional[np.ndarray],
+        k: int,
+    ) -> List[Dict]:
+        """Reciprocal rank fusion of the dense hits with BM25 hits."""
+        if self.lexical is None:
+            return self.store.to_results(vector_ids, scores)
+
+        dense_rows = self.store.row_of_id[vector_ids[vector_ids >= 0]]
+        lexical_rows, _ = self.lexical.search(query, k, mask)
+        rows, fused = reciprocal_rank_fusion([dense_rows, lexical_rows], k, self.rrf_k)
+        return self.store.rows_to_results(rows, fused)
+
+    def routed_search(self, query, query_vec, k, mask) -> Optional[List[Dict]]:
+        """Search only the shard(s) whose label centroid best matches the hint."""
+        if self.router is None:
+            return None
+
+        shard_ids = self.router.route(query_vec)
+        if not shard_ids:
+            return None
+
+        # Shard rows come from the category/group columns (built per query,
+        # nothing per shard is held between searches)
+        shard_mask = np.logical_or.reduce([
+            self.store.build_mask(require_in_stock=False, **self.router.shard_filter(i))
+            for i in shard_ids
+        ])
+        routed_mask = shard_mask if mask is None else (shard_mask & mask)
+        routed_k = min(k, int(routed_mask.sum()))
+        if routed_k <= 0:
+            # Nothing in the routed shards passes the filters: use the full index
+            return None
+
+        # The main index, whatever its type, with the shard rows as selector
+        scores, indices = self.index.search(query_vec, routed_k, params=self.mask_params(routed_mask))
+        return self.fuse(query, indices[0], scores[0], routed_mask, routed_k)
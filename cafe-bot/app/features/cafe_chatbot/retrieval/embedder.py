@@ -1,21 +1,103 @@
 # app/features/cafe_chatbot/retrieval/embedder.py
 
-from sentence_transformers import SentenceTransformer
 import numpy as np
+from typing import Dict, List, Optional
+
+from ..cache import LRUTTLCache
+from .backends import create_backend
+from .batcher import EmbeddingBatcher
+
+
+def normalize_query(text: str) -> str:
+    """
+    Canonical cache key for a query.
+    all-MiniLM-L6-v2 is uncased, so case and extra whitespace do not change the vector.
+    """
+    return " ".join(text.lower().split())
 
 
 class QueryEmbedder:
-    def __init__(self, model_name: str):
-        self.model = SentenceTransformer(model_name)
+    def __init__(
+        self,
+        model_name: str,
+        backend: str = "sentence-transformers",
+        backend_options: Optional[Dict] = None,
+        cache_max_entries: int = 2048,
+        cache_max_bytes: Optional[int] = 16 * 1024 * 1024,
+        cache_ttl_seconds: Optional[float] = 3600,
+        batching: bool = True,
+        batch_max_size: int = 32,
+        batch_max_wait_ms: float = 3.0,
+    ):
+        self.model_name = model_name
+        self.backend = create_backend(model_name, backend, backend_options)
+        self.dimension = self.backend.dimension
+
+        # Cached vectors are only valid for the model (and backend, since
+        # int8 ONNX vectors differ slightly) that produced them, so both are
+        # part of every key.
+        self.cache_namespace = f"{model_name}@{self.backend.name}"
+        self.cache = LRUTTLCache(
+            max_entries=cache_max_entries,
+            max_bytes=cache_max_bytes,
+            ttl_seconds=cache_ttl_seconds,
+            sizeof=lambda vec: vec.nbytes,
+        )
+
+        # Concurrent cache misses from request threads are coalesced into
+        # one batched encode call instead of many single-row forward passes.
+        self.batcher = None
+        if batching:
+            self.batcher = EmbeddingBatcher(
+                self._encode,
+                max_batch_size=batch_max_size,
+                max_wait_ms=batch_max_wait_ms,
+            )
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        return self.backend.encode(texts)
 
     def embed(self, text: str) -> np.ndarray:
         """
         Embed a single user query.
         Returns a normalized vector suitable for cosine similarity.
         """
-        vec = self.model.encode(
-            [text],
-            convert_to_numpy=True,
-            normalize_embeddings=True
-        )
+        key = (self.cache_namespace, normalize_query(text))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        if self.batcher is not None:
+            vec = self.batcher.embed(text)
+        else:
+            vec = self._encode([text])
+        vec = np.ascontiguousarray(vec, dtype=np.float32)
+        # Shared between callers: make it read-only
+        vec.setflags(write=False)
+        self.cache.put(key, vec)
         return vec
+
+    def embed_many(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed a batch of queries in one encode call (cache misses only).
+        Returns an (n, dim) normalized float32 matrix.
+        """
+        keys = [(self.cache_namespace, normalize_query(t)) for t in texts]
+        rows: List[Optional[np.ndarray]] = [self.cache.get(k) for k in keys]
+
+        missing = list(dict.fromkeys(
+            texts[i] for i, row in enumerate(rows) if row is None
+        ))
+        if missing:
+            encoded = np.ascontiguousarray(self._encode(missing), dtype=np.float32)
+            fresh = {}
+            for text, vec in zip(missing, encoded):
+                vec = vec[None, :].copy()
+                vec.setflags(write=False)
+                fresh[text] = vec
+                self.cache.put((self.cache_namespace, normalize_query(text)), vec)
+            rows = [row if row is not None else fresh[texts[i]] for i, row in enumerate(rows)]
+
+        if not rows:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return np.vstack(rows)
@@ -0,0 +1,146 @@
+# app/features/cafe_chatbot/retrieval/lexical_index.py
+
+import re
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+TOKEN_RE = re.compile(r"\w+")
+
+# Metadata ids look like "grp_robusta_cold_nonmilk"; the prefix carries no meaning
+ID_PREFIXES = {"cat", "sub", "grp", "itm"}
+
+# (id column, optional human-readable name column written by the builder)
+LABEL_COLUMNS = (
+    ("categoryId", "categoryName"),
+    ("subCategoryId", "subCategoryName"),
+    ("groupId", "groupName"),
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, strip accents ("Café" -> "cafe") and split into word tokens."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return TOKEN_RE.findall(text.lower())
+
+
+def label_tokens(value: str) -> List[str]:
+    parts = [p for p in (value or "").lower().split("_") if p]
+    if parts and parts[0] in ID_PREFIXES:
+        parts = parts[1:]
+    return parts
+
+
+class LexicalIndex:
+    """
+    In-memory BM25 inverted index over item names and category/group labels.
+
+    Postings are stored CSR-style with their BM25 weight precomputed, so a
+    query is a handful of vectorized scatter-adds into an (n,) score array.
+    """
+
+    def __init__(self, records: List[Dict], k1: float = 1.2, b: float = 0.75):
+        self.num_docs = len(records)
+
+        docs: List[List[str]] = []
+        self.exact_names: Dict[str, List[int]] = {}
+        for row, record in enumerate(records):
+            name_tokens = tokenize(record.get("name") or "")
+            self.exact_names.setdefault(" ".join(name_tokens), []).append(row)
+
+            tokens = list(name_tokens)
+            for id_key, name_key in LABEL_COLUMNS:
+                if record.get(name_key):
+                    tokens += tokenize(record[name_key])
+                else:
+                    tokens += label_tokens(record.get(id_key) or "")
+            docs.append(tokens)
+
+        self.exact_names = {
+            k: np.array(v, dtype=np.int64) for k, v in self.exact_names.items() if k
+        }
+
+        # term -> {row: tf}
+        postings: Dict[str, Dict[int, int]] = {}
+        for row, tokens in enumerate(docs):
+            for token in tokens:
+                bucket = postings.setdefault(token, {})
+                bucket[row] = bucket.get(row, 0) + 1
+
+        doc_len = np.array([len(d) for d in docs], dtype=np.float32)
+        avg_len = float(doc_len.mean()) if self.num_docs else 0.0
+
+        self.term_ids: Dict[str, int] = {}
+        ptr = [0]
+        rows: List[int] = []
+        weights: List[float] = []
+        for term_id, (term, bucket) in enumerate(postings.items()):
+            self.term_ids[term] = term_id
+            df = len(bucket)
+            idf = np.log(1.0 + (self.num_docs - df + 0.5) / (df + 0.5))
+            for row, tf in bucket.items():
+                norm = k1 * (1.0 - b + b * doc_len[row] / avg_len)
+                rows.append(row)
+                weights.append(idf * tf * (k1 + 1.0) / (tf + norm))
+            ptr.append(len(rows))
+
+        self.term_ptr = np.array(ptr, dtype=np.int64)
+        self.post_rows = np.array(rows, dtype=np.int64)
+        self.post_weights = np.array(weights, dtype=np.float32)
+
+    def exact_rows(self, query: str) -> Optional[np.ndarray]:
+        """Rows whose item name equals the query (ignoring case/punctuation)."""
+        return self.exact_names.get(" ".join(tokenize(query)))
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        for token in set(tokenize(query)):
+            term_id = self.term_ids.get(token)
+            if term_id is None:
+                continue
+            start, end = self.term_ptr[term_id], self.term_ptr[term_id + 1]
+            np.add.at(scores, self.post_rows[start:end], self.post_weights[start:end])
+        return scores
+
+    def search(
+        self, query: str, k: int, mask: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k (rows, scores) with a positive BM25 score, optionally masked."""
+        scores = self.scores(query)
+        if mask is not None:
+            scores = np.where(mask, scores, 0.0)
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            # Keep every tie of the k-th score, so ties always break by row
+            # and the top-k is a prefix of the top-(k+n) (speculation relies on it)
+            kth = np.partition(scores[candidates], len(candidates) - k)[len(candidates) - k]
+            candidates = candidates[scores[candidates] >= kth]
+        order = np.argsort(-scores[candidates], kind="stable")[:k]
+        rows = candidates[order]
+        return rows, scores[rows]
+
+
+def reciprocal_rank_fusion(
+    ranked_lists: List[np.ndarray], k: int, rrf_k: int = 60
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fuse ranked row lists: score(row) = sum 1 / (rrf_k + rank).
+    Returns the top-k (rows, fused scores).
+    """
+    ranked_lists = [r for r in ranked_lists if len(r)]
+    if not ranked_lists:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+    all_rows = np.concatenate(ranked_lists)
+    contrib = np.concatenate([
+        1.0 / (rrf_k + np.arange(1, len(r) + 1, dtype=np.float32)) for r in ranked_lists
+    ])
+    unique_rows, inverse = np.unique(all_rows, return_inverse=True)
+    fused = np.bincount(inverse, weights=contrib).astype(np.float32)
+
+    order = np.argsort(-fused, kind="stable")[:k]
+    return unique_rows[order], fused[order]
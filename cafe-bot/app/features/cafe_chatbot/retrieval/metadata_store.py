@@ -0,0 +1,437 @@
+# app/features/cafe_chatbot/retrieval/metadata_store.py
+
+import json
+import shutil
+import faiss
+import numpy as np
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+# groupId fragments that mark a section as vegan (no milk / plant based)
+VEGAN_GROUP_MARKERS = ("nonmilk", "tea", "black", "manual")
+
+# groupId fragments behind the temperature / milk attributes
+GROUP_FLAG_MARKERS = {
+    "vegan": VEGAN_GROUP_MARKERS,
+    "hot": ("_hot",),
+    "cold": ("_cold", "shake"),
+    "milk": ("_milk", "shake"),
+    "non-milk": ("nonmilk", "black", "manual"),
+}
+
+# Directory (next to metadata.jsonl) holding the mmap-able column files
+COLUMNS_DIR = "metadata_columns"
+
+# (column prefix, id key, name key) for the dictionary-encoded label columns
+LABEL_COLUMNS = (
+    ("category", "categoryId", "categoryName"),
+    ("subcategory", "subCategoryId", "subCategoryName"),
+    ("group", "groupId", "groupName"),
+)
+
+NUMERIC_COLUMNS = (
+    "vector_ids", "price", "in_stock",
+    "category_codes", "subcategory_codes", "group_codes",
+)
+STRING_COLUMNS = ("item_ids", "names")
+
+COLUMN_DTYPES = {
+    "vector_ids": np.int64,
+    # float64: float32 turns 199.99 into 199.99000549 in results and prompts
+    "price": np.float64,
+    "in_stock": np.bool_,
+    "category_codes": np.int32,
+    "subcategory_codes": np.int32,
+    "group_codes": np.int32,
+}
+
+# Rows copied per step when spilled columns are turned into .npy files
+COPY_CHUNK = 65536
+
+
+def row_columns(records: List[Dict]) -> Dict[str, np.ndarray]:
+    """The per-row (not dictionary-encoded) columns of a batch of records."""
+    n = len(records)
+    return {
+        "vector_ids": np.fromiter(
+            (r["vector_id"] for r in records), dtype=COLUMN_DTYPES["vector_ids"], count=n
+        ),
+        # Missing prices are NaN so they never pass a price filter
+        "price": np.fromiter(
+            (np.nan if r.get("price") is None else r["price"] for r in records),
+            dtype=COLUMN_DTYPES["price"],
+            count=n,
+        ),
+        "in_stock": np.fromiter(
+            (bool(r.get("inStock", False)) for r in records), dtype=bool, count=n
+        ),
+        # Fixed-width unicode keeps strings mmap-able
+        "item_ids": np.array([str(r["item_id"]) for r in records], dtype=np.str_),
+        "names": np.array([r.get("name") or "" for r in records], dtype=np.str_),
+    }
+
+
+def spill_to_npy(spill_path: Path, npy_path: Path, dtype, n: int):
+    """Turn n raw rows appended to spill_path into an .npy file (no full read)."""
+    header = {
+        "descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+        "fortran_order": False,
+        "shape": (n,),
+    }
+    with open(npy_path, "wb") as out, open(spill_path, "rb") as src:
+        np.lib.format.write_array_header_1_0(out, header)
+        shutil.copyfileobj(src, out, 1 << 20)
+    spill_path.unlink()
+
+
+class MenuMetadataStore:
+    """
+    Columnar view of metadata.jsonl.
+    Every attribute lives in a NumPy column indexed by row, so filters are
+    evaluated as boolean masks instead of per-item dict lookups.
+
+    Columns can be saved as plain .npy files and opened with mmap, which keeps
+    the data out of the Python heap: pre-forked workers then share the pages
+    instead of copying them when reference counts change.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], vocab: Dict[str, List[str]]):
+        self.vector_ids = columns["vector_ids"]
+        self.price = columns["price"]
+        self.in_stock = columns["in_stock"]
+        self.item_ids = columns["item_ids"]
+        self.names = columns["names"]
+
+        self.category_codes = columns["category_codes"]
+        self.subcategory_codes = columns["subcategory_codes"]
+        self.group_codes = columns["group_codes"]
+
+        self.vocab = vocab
+        self.category_vocab = vocab["category"]
+        self.subcategory_vocab = vocab["subcategory"]
+        self.group_vocab = vocab["group"]
+
+        n = len(self.vector_ids)
+
+        # Attribute flags are derived once per group (indexed by group code),
+        # then broadcast to rows where a row mask is needed
+        self.group_flags = {
+            flag: np.array(
+                [any(m in g.lower() for m in markers) for g in self.group_vocab],
+                dtype=bool,
+            )
+            for flag, markers in GROUP_FLAG_MARKERS.items()
+        }
+        self.diet_flags = {
+            "vegan": self.group_flags["vegan"][self.group_codes] if n else np.zeros(0, dtype=bool),
+        }
+
+        # vector_id -> row lookup (ids need not be contiguous)
+        self.id_space = int(self.vector_ids.max()) + 1 if n else 0
+        self.row_of_id = np.full(self.id_space, -1, dtype=np.int64)
+        self.row_of_id[self.vector_ids] = np.arange(n, dtype=np.int64)
+
+        # item_id -> row: (row order, item ids in that order), sorted once on
+        # first use (only conversation memory and the builder's diff need it)
+        self._item_index: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    # -----------------------------
+    # Loading / saving
+    # -----------------------------
+
+    @classmethod
+    def from_records(cls, records: List[Dict]) -> "MenuMetadataStore":
+        columns = row_columns(records)
+
+        vocab: Dict[str, List[str]] = {}
+        for prefix, id_key, name_key in LABEL_COLUMNS:
+            values, codes = cls._encode_column(records, id_key)
+            columns[f"{prefix}_codes"] = codes
+            vocab[prefix] = values
+
+            names = {r.get(id_key) or "": r.get(name_key) or "" for r in records}
+            vocab[f"{prefix}_names"] = [names.get(v, "") for v in values]
+
+        return cls(columns, vocab)
+
+    @classmethod
+    def from_jsonl(cls, metadata_path: Path) -> "MenuMetadataStore":
+        records = []
+        with open(metadata_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    records.append(json.loads(line))
+        return cls.from_records(records)
+
+    @classmethod
+    def from_columns(cls, columns_dir: Path, mmap: bool = True) -> "MenuMetadataStore":
+        mode = "r" if mmap else None
+        names = NUMERIC_COLUMNS + STRING_COLUMNS
+        columns = {
+            name: np.load(columns_dir / f"{name}.npy", mmap_mode=mode) for name in names
+        }
+        with open(columns_dir / "vocab.json", "r", encoding="utf-8") as f:
+            vocab = json.load(f)
+        return cls(columns, vocab)
+
+    @classmethod
+    def load(cls, storage_dir: Path, mmap: bool = True) -> "MenuMetadataStore":
+        """Prefer the binary columns, fall back to metadata.jsonl."""
+        columns_dir = storage_dir / COLUMNS_DIR
+        if (columns_dir / "vocab.json").exists():
+            return cls.from_columns(columns_dir, mmap=mmap)
+        return cls.from_jsonl(storage_dir / "metadata.jsonl")
+
+    def save_columns(self, columns_dir: Path):
+        columns_dir.mkdir(parents=True, exist_ok=True)
+        for name in NUMERIC_COLUMNS + STRING_COLUMNS:
+            np.save(columns_dir / f"{name}.npy", np.ascontiguousarray(getattr(self, name)))
+        # vocab.json is written last: its presence marks a complete column set
+        with open(columns_dir / "vocab.json", "w", encoding="utf-8") as f:
+            json.dump(self.vocab, f, ensure_ascii=False)
+
+    def __len__(self) -> int:
+        return len(self.vector_ids)
+
+    @staticmethod
+    def _encode_column(records: List[Dict], key: str):
+        """Dictionary-encode a string column into (vocab, int32 codes)."""
+        values = [r.get(key) or "" for r in records]
+        vocab, codes = np.unique(np.array(values, dtype=object), return_inverse=True)
+        return [str(v) for v in vocab], codes.astype(np.int32)
+
+    @staticmethod
+    def _codes_for(vocab: List[str], wanted: List[str]) -> np.ndarray:
+        lookup = {v: i for i, v in enumerate(vocab)}
+        return np.array([lookup[w] for w in wanted if w in lookup], dtype=np.int32)
+
+    # -----------------------------
+    # Filters
+    # -----------------------------
+
+    def build_mask(
+        self,
+        max_price: Optional[float] = None,
+        require_in_stock: bool = True,
+        diet: Optional[List[str]] = None,
+        category_ids: Optional[List[str]] = None,
+        subcategory_ids: Optional[List[str]] = None,
+        group_ids: Optional[List[str]] = None,
+        min_price: Optional[float] = None,
+        temperature: Optional[List[str]] = None,
+        milk: Optional[str] = None,
+    ) -> Optional[np.ndarray]:
+        """
+        Combine all filters into one boolean row mask.
+        Returns None when no filter applies (search the whole index).
+        """
+        mask = None
+
+        def _and(m):
+            nonlocal mask
+            mask = m if mask is None else (mask & m)
+
+        if require_in_stock:
+            _and(np.asarray(self.in_stock))
+        if max_price is not None:
+            # NaN compares False, so missing prices are dropped
+            _and(self.price <= max_price)
+        if min_price is not None:
+            _and(self.price >= min_price)
+        for d in diet or []:
+            flag = self.diet_flags.get(d)
+            if flag is not None:
+                _and(flag)
+        # Temperature / milk are group attributes: OR the wanted group
+        # flags, then broadcast to rows once
+        wanted = [t for t in temperature or [] if t in self.group_flags]
+        if wanted:
+            _and(np.logical_or.reduce([self.group_flags[t] for t in wanted])[self.group_codes])
+        if milk in self.group_flags:
+            _and(self.group_flags[milk][self.group_codes])
+        if category_ids:
+            _and(np.isin(self.category_codes, self._codes_for(self.category_vocab, category_ids)))
+        if subcategory_ids:
+            _and(np.isin(self.subcategory_codes, self._codes_for(self.subcategory_vocab, subcategory_ids)))
+        if group_ids:
+            _and(np.isin(self.group_codes, self._codes_for(self.group_vocab, group_ids)))
+
+        return mask
+
+    def id_bitmap(self, mask: np.ndarray) -> np.ndarray:
+        """Row mask -> bool array indexed by vector id."""
+        bits = np.zeros(self.id_space, dtype=bool)
+        bits[self.vector_ids[mask]] = True
+        return bits
+
+    def id_selector(self, mask: np.ndarray):
+        """
+        Turn a row mask into a FAISS IDSelectorBitmap over vector ids.
+        The packed bitmap is attached to the selector so it outlives the call.
+        """
+        bitmap = np.packbits(self.id_bitmap(mask), bitorder="little")
+        selector = faiss.IDSelectorBitmap(self.id_space, faiss.swig_ptr(bitmap))
+        selector.bitmap_ref = bitmap
+        return selector
+
+    # -----------------------------
+    # Result materialization
+    # -----------------------------
+
+    def record(self, row: int) -> Dict:
+        """One metadata.jsonl-shaped record rebuilt from the columns."""
+        price = float(self.price[row])
+        return {
+            "vector_id": int(self.vector_ids[row]),
+            "item_id": str(self.item_ids[row]),
+            "name": str(self.names[row]),
+            "price": None if np.isnan(price) else (int(price) if price.is_integer() else price),
+            "inStock": bool(self.in_stock[row]),
+            "categoryId": self.category_vocab[self.category_codes[row]] or None,
+            "subCategoryId": self.subcategory_vocab[self.subcategory_codes[row]] or None,
+            "groupId": self.group_vocab[self.group_codes[row]] or None,
+            "categoryName": self.vocab["category_names"][self.category_codes[row]],
+            "subCategoryName": self.vocab["subcategory_names"][self.subcategory_codes[row]],
+            "groupName": self.vocab["group_names"][self.group_codes[row]],
+        }
+
+    def rows_of_item_ids(self, item_ids: List[str]) -> np.ndarray:
+        """Row of each item id, -1 for ids no longer on the menu."""
+        if self._item_index is None:
+            order = np.argsort(self.item_ids, kind="stable")
+            self._item_index = (order, self.item_ids[order])
+        order, sorted_ids = self._item_index
+        if not len(order) or not len(item_ids):
+            return np.full(len(item_ids), -1, dtype=np.int64)
+        # Own width, not the column's: casting would truncate longer ids
+        # into a prefix that may be another item's id
+        wanted = np.asarray(item_ids, dtype=np.str_)
+        pos = np.minimum(np.searchsorted(sorted_ids, wanted), len(order) - 1)
+        return np.where(sorted_ids[pos] == wanted, order[pos], -1)
+
+    def iter_records(self) -> Iterator[Dict]:
+        for row in range(len(self)):
+            yield self.record(row)
+
+    def to_results(self, vector_ids: np.ndarray, scores: np.ndarray) -> List[Dict]:
+        """Materialize FAISS output (vector ids, -1 = empty slot)."""
+        valid = vector_ids >= 0
+        return self.rows_to_results(self.row_of_id[vector_ids[valid]], scores[valid])
+
+    def rows_to_results(self, rows: np.ndarray, scores: np.ndarray) -> List[Dict]:
+        # Gather each column once: listings can materialize thousands of rows
+        rows = np.asarray(rows, dtype=np.int64)
+        prices = self.price[rows].tolist()
+        item_ids = self.item_ids[rows].tolist()
+        names = self.names[rows].tolist()
+        categories = [self.category_vocab[c] or None for c in self.category_codes[rows].tolist()]
+        subcategories = [self.subcategory_vocab[c] or None for c in self.subcategory_codes[rows].tolist()]
+        groups = [self.group_vocab[c] or None for c in self.group_codes[rows].tolist()]
+
+        results = []
+        for i, score in enumerate(scores.tolist()):
+            price = prices[i]
+            results.append({
+                "item_id": item_ids[i],
+                "name": names[i],
+                "price": None if price != price else (int(price) if price.is_integer() else price),
+                "categoryId": categories[i],
+                "subCategoryId": subcategories[i],
+                "groupId": groups[i],
+                "score": float(score),
+            })
+        return results
+
+
+class MetadataColumnWriter:
+    """
+    Streams records into the column set MenuMetadataStore.from_columns
+    reads, without holding them: each chunk is appended to per-column spill
+    files, and close() turns those into the .npy files. Label columns are
+    dictionary-encoded in order of first appearance; only the (small) label
+    vocabularies live in the heap.
+    """
+
+    def __init__(self, columns_dir: Path):
+        self.columns_dir = columns_dir
+        self.spill_dir = columns_dir / "spill"
+        self.spill_dir.mkdir(parents=True)
+        self.num_rows = 0
+
+        self.numeric = {name: open(self.spill_dir / name, "wb") for name in NUMERIC_COLUMNS}
+        # One JSON string per line; the fixed width is known only at the end
+        self.strings = {
+            name: open(self.spill_dir / name, "w", encoding="utf-8") for name in STRING_COLUMNS
+        }
+        self.widths = {name: 1 for name in STRING_COLUMNS}
+
+        self.codes: Dict[str, Dict[str, int]] = {prefix: {} for prefix, _, _ in LABEL_COLUMNS}
+        self.label_names: Dict[str, List[str]] = {prefix: [] for prefix, _, _ in LABEL_COLUMNS}
+
+    def add(self, records: List[Dict]):
+        columns = row_columns(records)
+        for prefix, id_key, name_key in LABEL_COLUMNS:
+            codes = self.codes[prefix]
+            for r in records:
+                value = r.get(id_key) or ""
+                if value not in codes:
+                    codes[value] = len(codes)
+                    self.label_names[prefix].append(r.get(name_key) or "")
+            columns[f"{prefix}_codes"] = np.fromiter(
+                (codes[r.get(id_key) or ""] for r in records), dtype=np.int32, count=len(records)
+            )
+
+        for name, f in self.numeric.items():
+            f.write(np.ascontiguousarray(columns[name], dtype=COLUMN_DTYPES[name]).tobytes())
+        for name, f in self.strings.items():
+            values = columns[name]
+            if len(values):
+                self.widths[name] = max(self.widths[name], values.dtype.itemsize // 4)
+            f.writelines(json.dumps(v, ensure_ascii=False) + "\n" for v in values.tolist())
+        self.num_rows += len(records)
+
+    def close(self) -> int:
+        """Write the .npy files and vocab.json; returns the row count."""
+        for f in list(self.numeric.values()) + list(self.strings.values()):
+            f.close()
+        n = self.num_rows
+
+        for name in NUMERIC_COLUMNS:
+            spill_to_npy(self.spill_dir / name, self.columns_dir / f"{name}.npy", COLUMN_DTYPES[name], n)
+
+        for name in STRING_COLUMNS:
+            path = self.columns_dir / f"{name}.npy"
+            dtype = np.dtype(f"<U{self.widths[name]}")
+            if not n:
+                np.save(path, np.zeros(0, dtype=dtype))
+                continue
+            out = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(n,))
+            with open(self.spill_dir / name, "r", encoding="utf-8") as f:
+                start = 0
+                chunk: List[str] = []
+                for line in f:
+                    chunk.append(json.loads(line))
+                    if len(chunk) == COPY_CHUNK:
+                        out[start:start + len(chunk)] = chunk
+                        start += len(chunk)
+                        chunk = []
+                out[start:start + len(chunk)] = chunk
+            out.flush()
+            del out
+
+        vocab: Dict[str, List[str]] = {}
+        for prefix, _, _ in LABEL_COLUMNS:
+            vocab[prefix] = list(self.codes[prefix])
+            vocab[f"{prefix}_names"] = self.label_names[prefix]
+        # vocab.json is written last: its presence marks a complete column set
+        with open(self.columns_dir / "vocab.json", "w", encoding="utf-8") as f:
+            json.dump(vocab, f, ensure_ascii=False)
+
+        shutil.rmtree(self.spill_dir)
+        return n
+
+    def abort(self):
+        for f in list(self.numeric.values()) + list(self.strings.values()):
+            f.close()
+        shutil.rmtree(self.columns_dir, ignore_errors=True)
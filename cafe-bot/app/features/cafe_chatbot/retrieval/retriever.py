@@ -1,74 +1,253 @@
 # app/features/cafe_chatbot/retrieval/retriever.py
 
+import os
 import json
-import faiss
-import numpy as np
+import time
+import threading
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional, Tuple, Union
+
+import numpy as np
 
+from ..loading import load_in_parallel
+from .ann import load_index
 from .embedder import QueryEmbedder
+from .bundle import (
+    FILTER_KEYS,
+    STRUCTURED_FILTER_KEYS,
+    RetrievalBundle,
+    bundle_signature,
+    resolve_bundle_dir,
+)
+from .metadata_store import MenuMetadataStore
+from .speculation import SpeculativeCandidates
+
+
+# Query run against a freshly loaded bundle before it is swapped in
+RELOAD_WARM_UP_QUERY = "coffee"
+
+# Candidates kept by speculate(): large enough that typical filters still
+# leave top_k of them
+SPECULATIVE_POOL_SIZE = 200
 
 
 class CafeRAGRetriever:
     """
     Read-only RAG retriever.
     Loads FAISS index + metadata from disk and performs semantic retrieval.
+
+    All on-disk state lives in one RetrievalBundle. reload() loads a new
+    bundle in the background and swaps it in with a single assignment, so
+    in-flight searches finish on the generation they started with.
     """
 
-    def __init__(self, storage_dir: str):
+    FILTER_KEYS = FILTER_KEYS
+
+    def __init__(self, storage_dir: str, mmap: bool = False):
+        """
+        mmap=True opens index.faiss and the binary metadata columns as
+        read-only memory maps, so pre-forked workers share the pages.
+        """
         self.storage_dir = Path(storage_dir)
+        self.mmap = mmap
 
-        self.index = None
-        self.metadata = []
-        self.id_to_meta = {}
-        self.embedder = None
-        self.dimension = None
+        self.generation = 0
+        self.last_reload: Optional[Dict] = None
+        self._reload_lock = threading.Lock()
+        self._failed_signature = None
+        self._watcher_pid = None
 
-        self._load_storage()
+        self._bundle: RetrievalBundle = self._load_bundle(resolve_bundle_dir(self.storage_dir))
+        self.load_timings: Dict[str, float] = dict(self._bundle.load_timings)
+
+    # -----------------------------
+    # Current generation
+    # -----------------------------
+
+    @property
+    def index(self):
+        return self._bundle.index
+
+    @property
+    def store(self) -> MenuMetadataStore:
+        return self._bundle.store
+
+    @property
+    def lexical(self):
+        return self._bundle.lexical
+
+    @property
+    def router(self):
+        return self._bundle.router
+
+    @property
+    def embedder(self) -> QueryEmbedder:
+        return self._bundle.embedder
+
+    @property
+    def dimension(self) -> int:
+        return self._bundle.dimension
+
+    @property
+    def menu_version(self):
+        return self._bundle.menu_version
+
+    @property
+    def bundle_version(self) -> Tuple[int, Any]:
+        """(generation, menu_version) of the serving bundle, read together."""
+        bundle = self._bundle
+        return bundle.generation, bundle.menu_version
 
     # -----------------------------
     # Storage loading
     # -----------------------------
 
-    def _load_storage(self):
-        index_path = self.storage_dir / "index.faiss"
-        metadata_path = self.storage_dir / "metadata.jsonl"
-        config_path = self.storage_dir / "config.json"
+    def _load_bundle(self, bundle_dir: Path, previous: Optional[RetrievalBundle] = None) -> RetrievalBundle:
+        config = RetrievalBundle.read_config(bundle_dir)
 
-        if not index_path.exists():
-            raise RuntimeError("FAISS index not found")
+        tasks = {
+            "index": lambda: load_index(bundle_dir, config, self.mmap),
+            # Metadata lives in columns (filters run as NumPy masks)
+            "metadata": lambda: MenuMetadataStore.load(bundle_dir, mmap=self.mmap),
+        }
 
-        if not metadata_path.exists():
-            raise RuntimeError("metadata.jsonl not found")
+        # Keep the loaded model (and its query cache) when the new bundle was
+        # built with the same embedder; otherwise load the new one alongside
+        embedder = None
+        if previous is not None and self._embedder_key(previous.config) == self._embedder_key(config):
+            embedder = previous.embedder
+        else:
+            tasks["embedder"] = lambda: self._build_embedder(config)
 
-        if not config_path.exists():
-            raise RuntimeError("config.json not found")
+        # Model, index and metadata are independent: load them concurrently
+        loaded, timings = load_in_parallel(tasks)
 
-        # Load config
-        with open(config_path, "r", encoding="utf-8") as f:
-            config = json.load(f)
+        bundle = RetrievalBundle(
+            bundle_dir,
+            config,
+            index=loaded["index"],
+            store=loaded["metadata"],
+            embedder=loaded.get("embedder", embedder),
+            generation=self.generation,
+        )
+        bundle.load_timings = {**timings, **bundle.load_timings}
+        return bundle
 
-        self.dimension = config["dimension"]
-        embedding_model = config["embedding_model"]
+    @staticmethod
+    def _embedder_key(config: Dict) -> str:
+        return json.dumps([
+            config["embedding_model"],
+            config.get("embedding_backend", "sentence-transformers"),
+            config.get("onnx", {}),
+            config.get("query_cache", {}),
+            config.get("query_batching", {}),
+        ], sort_keys=True)
 
-        # Load embedder
-        self.embedder = QueryEmbedder(embedding_model)
+    def _build_embedder(self, config: Dict) -> QueryEmbedder:
+        """
+        Optional config blocks:
+          "embedding_backend": "sentence-transformers" (default) | "onnx" | "hash"
+          "onnx": {"model_dir", "model_file", ...} (model_dir relative to storage)
+          "query_cache" / "query_batching": vector cache and micro-batching
+        """
+        backend = config.get("embedding_backend", "sentence-transformers")
+        backend_options = dict(config.get("onnx", {}))
+        if "model_dir" in backend_options:
+            backend_options["model_dir"] = str(self.storage_dir / backend_options["model_dir"])
+        if backend == "hash":
+            backend_options = {"dimension": config["dimension"]}
+        cache_cfg = config.get("query_cache", {})
+        batch_cfg = config.get("query_batching", {})
+        return QueryEmbedder(
+            config["embedding_model"],
+            backend=backend,
+            backend_options=backend_options,
+            cache_max_entries=cache_cfg.get("max_entries", 2048),
+            cache_max_bytes=cache_cfg.get("max_bytes", 16 * 1024 * 1024),
+            cache_ttl_seconds=cache_cfg.get("ttl_seconds", 3600),
+            batching=batch_cfg.get("enabled", True),
+            batch_max_size=batch_cfg.get("max_batch_size", 32),
+            batch_max_wait_ms=batch_cfg.get("max_wait_ms", 3.0),
+        )
 
-        # Load FAISS index
-        self.index = faiss.read_index(str(index_path))
+    # -----------------------------
+    # Hot reload
+    # -----------------------------
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Load the current bundle (CURRENT pointer, or the flat storage dir) if
+        it changed since the last load, validate and warm it, then swap it in.
+        Returns True if a new generation is now serving. On any error the old
+        generation keeps serving and the error is re-raised.
+        """
+        with self._reload_lock:
+            old = self._bundle
+            bundle_dir = resolve_bundle_dir(self.storage_dir)
+            signature = bundle_signature(bundle_dir)
+            # A rejected bundle is not retried until it changes (or force=True)
+            if not force and signature in (old.signature, self._failed_signature):
+                return False
 
-        if self.index.d != self.dimension:
-            raise RuntimeError("Embedding dimension mismatch")
+            start = time.perf_counter()
+            try:
+                self.generation += 1
+                new = self._load_bundle(bundle_dir, previous=old)
+                # Pay lazy page-in / model init before the swap, not on traffic
+                vec = new.embedder.embed(RELOAD_WARM_UP_QUERY)
+                new.index.search(vec, min(5, new.index.ntotal))
+            except Exception as e:
+                self.generation -= 1
+                self._failed_signature = signature
+                self.last_reload = {"ok": False, "error": repr(e), "bundle_dir": str(bundle_dir)}
+                print(f"❌ [Retriever] Reload of {bundle_dir} failed, keeping generation {old.generation}: {e!r}")
+                raise
 
-        # Load metadata
-        with open(metadata_path, "r", encoding="utf-8") as f:
-            for line in f:
-                record = json.loads(line)
-                self.metadata.append(record)
-                self.id_to_meta[record["vector_id"]] = record
+            # Single reference assignment: searches already running keep `old`
+            self._bundle = new
+            self.last_reload = {
+                "ok": True,
+                "generation": new.generation,
+                "menu_version": new.menu_version,
+                "bundle_dir": str(bundle_dir),
+                "seconds": round(time.perf_counter() - start, 3),
+            }
+            print(
+                f"🔁 [Retriever] Generation {new.generation} live "
+                f"(menu_version={new.menu_version}, {new.index.ntotal} items, "
+                f"{self.last_reload['seconds']}s)"
+            )
+            return True
+
+    def start_watching(self, poll_seconds: float = 5.0):
+        """
+        Poll for a new bundle and hot-reload it. Safe to call more than once;
+        each (pre-forked) process gets its own watcher thread.
+        """
+        if self._watcher_pid == os.getpid():
+            return
+        self._watcher_pid = os.getpid()
 
-        if self.index.ntotal != len(self.metadata):
-            raise RuntimeError("Index / metadata size mismatch")
+        def watch():
+            while True:
+                time.sleep(poll_seconds)
+                try:
+                    self.reload()
+                except Exception:
+                    # Already reported; retry on the next change
+                    pass
+
+        threading.Thread(target=watch, name="bundle-watcher", daemon=True).start()
+
+    def status(self) -> Dict:
+        bundle = self._bundle
+        return {
+            "generation": bundle.generation,
+            "menu_version": bundle.menu_version,
+            "bundle_dir": str(bundle.bundle_dir),
+            "num_items": bundle.index.ntotal,
+            "last_reload": self.last_reload,
+        }
 
     # -----------------------------
     # Public retrieval API
@@ -80,56 +259,145 @@ class CafeRAGRetriever:
         top_k: int = 50,
         max_price: Optional[int] = None,
         require_in_stock: bool = True,
-        diet: Optional[List[str]] = None, # <--- 1. Add this parameter  
+        diet: Optional[List[str]] = None, # <--- 1. Add this parameter
         category_ids: Optional[List[str]] = None,
         subcategory_ids: Optional[List[str]] = None,
         group_ids: Optional[List[str]] = None,
+        min_price: Optional[int] = None,
+        temperature: Optional[List[str]] = None,
+        milk: Optional[str] = None,
+        route: bool = False,
     ) -> List[Dict]:
         """
-        Perform hybrid semantic retrieval with optional filtering.
+        Perform hybrid (dense + BM25) retrieval with optional filtering.
+        Filters are pushed into FAISS as an ID selector, so the result holds
+        up to top_k items that all satisfy the filters. An exact item-name
+        query is answered from the inverted index without embedding.
+
+        With route=True (the query is a category hint) only the closest
+        category/group shard(s) are searched, when the bundle has shards.
         """
+        # One generation for the whole call, even if a reload swaps mid-way
+        bundle = self._bundle
+
+        k, mask, params = bundle.search_params(top_k, dict(
+            max_price=max_price,
+            require_in_stock=require_in_stock,
+            diet=diet,
+            category_ids=category_ids,
+            subcategory_ids=subcategory_ids,
+            group_ids=group_ids,
+            min_price=min_price,
+            temperature=temperature,
+            milk=milk,
+        ))
+
+        if k <= 0:
+            return []
+
+        exact = bundle.exact_match(query, mask, k)
+        if exact is not None:
+            return exact
 
         # Embed query
-        query_vec = self.embedder.embed(query)
-
-        # FAISS search
-        scores, indices = self.index.search(query_vec, top_k)
-
-        results = []
-        for vector_id, score in zip(indices[0], scores[0]):
-            if vector_id == -1: continue
-
-            item = self.id_to_meta.get(vector_id)
-            if not item: continue
-
-            # ---- EXISTING FILTERS ----
-            if require_in_stock and not item.get("inStock", False): continue
-            price = item.get("price")
-            # Filter out if price is missing OR if it's too high
-            if max_price is not None:
-                if price is None or price > max_price:
-                    continue
-
-            # ---- NEW: DIET FILTER (The Logic Fix) ----
-            if diet and "vegan" in diet:
-                # We inspect the groupId string stored in metadata
-                gid = item.get("groupId", "").lower()
-                
-                # Rule: Keep item ONLY if groupId suggests it is vegan
-                # (looks for "nonmilk", "tea", "black", "manual", "brew")
-                is_vegan_group = any(x in gid for x in ["nonmilk", "tea", "black", "manual"])
-                
-                if not is_vegan_group:
-                    continue
-
-            results.append({
-                "item_id": item["item_id"],
-                "name": item["name"],
-                "price": item["price"],
-                "categoryId": item["categoryId"],
-                "subCategoryId": item["subCategoryId"],
-                "groupId": item["groupId"],
-                "score": float(score),
-            })
+        query_vec = bundle.embedder.embed(query)
+
+        if route:
+            routed = bundle.routed_search(query, query_vec, k, mask)
+            if routed is not None:
+                return routed
+
+        # FAISS search (only ids passing the mask are scored)
+        scores, indices = bundle.index.search(query_vec, k, params=params)
+
+        return bundle.fuse(query, indices[0], scores[0], mask, k)
+
+    def speculate(self, query: str, pool_size: int = SPECULATIVE_POOL_SIZE) -> SpeculativeCandidates:
+        """
+        Filter-free retrieval to run while constraints are being extracted.
+        Call .resolve(top_k, **filters) on the result once they are known.
+        """
+        return SpeculativeCandidates(self._bundle, query, pool_size)
+
+    def list_items(self, limit: Optional[int] = None, **filters) -> List[Dict]:
+        """
+        Structured mode: every item matching the filters (max_price,
+        min_price, diet, temperature, milk, require_in_stock, category /
+        subcategory / group ids), cheapest first. No embedding, no top_k cap
+        unless `limit` is given; results have score 1.0.
+        """
+        unknown = set(filters) - STRUCTURED_FILTER_KEYS
+        if unknown:
+            raise ValueError(f"Unknown list filters: {sorted(unknown)}")
+        return self._bundle.structured.search(limit=limit, **filters)
+
+    def items_by_id(self, item_ids: List[str]) -> List[Dict]:
+        """Current records of these items, in the given order (ids no longer on the menu are skipped)."""
+        store = self._bundle.store
+        rows = store.rows_of_item_ids(item_ids)
+        rows = rows[rows >= 0]
+        return store.rows_to_results(rows, np.ones(len(rows), dtype=np.float32))
+
+    def search_many(
+        self,
+        queries: List[str],
+        filters: Optional[Union[Dict, List[Dict]]] = None,
+        top_k: int = 50,
+    ) -> List[List[Dict]]:
+        """
+        Batched retrieval for many queries at once.
+
+        `filters` is either one dict of `search` keyword filters shared by all
+        queries, or a list with one dict per query. All queries are embedded
+        in a single encode call; queries sharing a filter set are answered
+        by a single index.search over their stacked vectors.
+        """
+        if not queries:
+            return []
+
+        bundle = self._bundle
+
+        if filters is None or isinstance(filters, dict):
+            per_query = [filters or {}] * len(queries)
+        else:
+            if len(filters) != len(queries):
+                raise ValueError("filters must have one entry per query")
+            per_query = [f or {} for f in filters]
+
+        # Group queries by identical filter set -> one mask + one search each
+        groups: Dict[str, List[int]] = {}
+        for i, f in enumerate(per_query):
+            groups.setdefault(json.dumps(f, sort_keys=True), []).append(i)
+
+        results: List[List[Dict]] = [[] for _ in queries]
+        pending = []
+        for rows in groups.values():
+            k, mask, params = bundle.search_params(top_k, per_query[rows[0]])
+            if k <= 0:
+                continue
+
+            dense_rows = []
+            for row in rows:
+                exact = bundle.exact_match(queries[row], mask, k)
+                if exact is not None:
+                    results[row] = exact
+                else:
+                    dense_rows.append(row)
+            if dense_rows:
+                pending.append((dense_rows, k, mask, params))
+
+        if not pending:
+            return results
+
+        # One encode call for every query that still needs a vector
+        need = [row for dense_rows, *_ in pending for row in dense_rows]
+        query_vecs = bundle.embedder.embed_many([queries[row] for row in need])
+        vec_of = {row: i for i, row in enumerate(need)}
+
+        for dense_rows, k, mask, params in pending:
+            batch = query_vecs[[vec_of[row] for row in dense_rows]]
+            scores, indices = bundle.index.search(batch, k, params=params)
+            for j, row in enumerate(dense_rows):
+                results[row] = bundle.fuse(queries[row], indices[j], scores[j], mask, k)
 
         return results
@@ -0,0 +1,67 @@
+# app/features/cafe_chatbot/retrieval/shard_router.py
+
+import json
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+class ShardRouter:
+    """
+    Routes a category hint to per-category / per-group shards.
+
+    The builder writes, next to index.faiss:
+      - shards.json   : [{"key", "level", "id", "label", "num_items"}, ...]
+      - centroids.npy : one normalized embedding of each shard's label (same order)
+
+    A shard is not a separate index: its rows are the items whose categoryId
+    / groupId matches, read from the metadata columns, and a routed search
+    runs on the main index with those rows as the ID selector. Shards cost
+    one centroid each, whatever the index type or catalog size.
+
+    A hint is compared with every centroid; the best shard (plus a runner-up
+    within `margin`) is searched instead of the whole index.
+    """
+
+    # shards.json level -> MenuMetadataStore.build_mask filter
+    LEVEL_FILTERS = {"category": "category_ids", "group": "group_ids"}
+
+    def __init__(
+        self,
+        storage_dir: Path,
+        max_shards: int = 2,
+        min_score: float = 0.3,
+        margin: float = 0.05,
+    ):
+        with open(storage_dir / "shards.json", "r", encoding="utf-8") as f:
+            self.shards: List[Dict] = json.load(f)
+
+        self.centroids = np.load(storage_dir / "centroids.npy").astype(np.float32)
+        if len(self.centroids) != len(self.shards):
+            raise RuntimeError("shards.json / centroids.npy size mismatch")
+
+        self.max_shards = max_shards
+        self.min_score = min_score
+        self.margin = margin
+
+    @classmethod
+    def load(cls, storage_dir: Path, options: Optional[Dict] = None) -> Optional["ShardRouter"]:
+        """Returns None for bundles built without shards."""
+        if not (storage_dir / "shards.json").exists():
+            return None
+        return cls(storage_dir, **(options or {}))
+
+    def route(self, query_vec: np.ndarray) -> List[int]:
+        """Shard positions to search, best first (empty = use the full index)."""
+        sims = self.centroids @ query_vec[0]
+        order = np.argsort(-sims)[: self.max_shards]
+
+        best = sims[order[0]]
+        if best < self.min_score:
+            return []
+        return [int(i) for i in order if sims[i] >= best - self.margin]
+
+    def shard_filter(self, shard_id: int) -> Dict:
+        """build_mask keyword arguments selecting the shard's rows."""
+        shard = self.shards[shard_id]
+        return {self.LEVEL_FILTERS[shard["level"]]: [shard["id"]]}
@@ -0,0 +1,91 @@
+# app/features/cafe_chatbot/retrieval/speculation.py
+
+import numpy as np
+from typing import Dict, List, Optional
+
+from .bundle import FILTER_KEYS, RetrievalBundle
+from .lexical_index import reciprocal_rank_fusion
+
+
+class SpeculativeCandidates:
+    """
+    Retrieval for the raw user message, started before its constraints are
+    known (in parallel with the extractor call).
+
+    Holds the in-stock dense and BM25 rankings for a large pool. Once the
+    constraints arrive, resolve() filters both rankings and fuses them
+    again. That is the same result a filtered search would return, as long
+    as the pool still holds k candidates that pass, or held every candidate
+    in the first place. Otherwise resolve() returns None and the caller
+    runs the filtered search.
+    """
+
+    def __init__(self, bundle: RetrievalBundle, query: str, pool_size: int):
+        self.bundle = bundle
+        self.query = query
+        store = bundle.store
+
+        # Every search filters on stock by default; the pool does the same
+        k, self.base_mask, params = bundle.search_params(pool_size, {})
+        self.pool_size = k
+        candidates = len(store) if self.base_mask is None else int(self.base_mask.sum())
+
+        self.exact_rows = bundle.lexical.exact_rows(query) if bundle.lexical is not None else None
+
+        self.dense_rows = np.zeros(0, dtype=np.int64)
+        self.dense_scores = np.zeros(0, dtype=np.float32)
+        self.lexical_rows = np.zeros(0, dtype=np.int64)
+        self.dense_complete = self.lexical_complete = True
+        if k <= 0:
+            return
+
+        query_vec = bundle.embedder.embed(query)
+        scores, ids = bundle.index.search(query_vec, k, params=params)
+        valid = ids[0] >= 0
+        self.dense_rows = store.row_of_id[ids[0][valid]]
+        self.dense_scores = scores[0][valid]
+        self.dense_complete = k >= candidates
+
+        if bundle.lexical is not None:
+            self.lexical_rows, _ = bundle.lexical.search(query, k, self.base_mask)
+            # Fewer hits than asked for: every positive BM25 row is in the pool
+            self.lexical_complete = len(self.lexical_rows) < k
+
+    def resolve(self, top_k: int = 50, **filters) -> Optional[List[Dict]]:
+        """Re-filter and re-rank the pool; None if it cannot answer exactly."""
+        unknown = set(filters) - FILTER_KEYS
+        if unknown:
+            raise ValueError(f"Unknown search filters: {sorted(unknown)}")
+        if not filters.get("require_in_stock", True):
+            # The pool only holds in-stock items
+            return None
+
+        bundle = self.bundle
+        store = bundle.store
+        mask = store.build_mask(**filters)
+        passing = len(store) if mask is None else int(mask.sum())
+        k = min(top_k, bundle.index.ntotal, passing)
+        if k <= 0:
+            return []
+
+        # Same order as search(): an exact item-name hit wins
+        if self.exact_rows is not None:
+            rows = self.exact_rows if mask is None else self.exact_rows[mask[self.exact_rows]]
+            if len(rows):
+                rows = rows[:k]
+                return store.rows_to_results(rows, np.ones(len(rows), dtype=np.float32))
+
+        keep = np.ones(len(self.dense_rows), dtype=bool) if mask is None else mask[self.dense_rows]
+        dense_rows = self.dense_rows[keep]
+        if len(dense_rows) < k and not self.dense_complete:
+            return None
+
+        if bundle.lexical is None:
+            return store.rows_to_results(dense_rows[:k], self.dense_scores[keep][:k])
+
+        lexical_rows = self.lexical_rows if mask is None else self.lexical_rows[mask[self.lexical_rows]]
+        if len(lexical_rows) < k and not self.lexical_complete:
+            return None
+
+        rows, fused = reciprocal_rank_fusion([dense_rows[:k], lexical_rows[:k]], k, bundle.rrf_k)
+        return store.rows_to_results(rows, fused)
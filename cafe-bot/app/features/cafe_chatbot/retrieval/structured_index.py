@@ -0,0 +1,135 @@
+# app/features/cafe_chatbot/retrieval/structured_index.py
+
+import numpy as np
+from typing import Dict, List, Optional
+
+from .metadata_store import MenuMetadataStore
+
+
+class StructuredIndex:
+    """
+    Exact attribute / price-range listing without embeddings.
+
+    Rows are grouped into cells of identical (category, subcategory, group,
+    in-stock) and sorted by price inside each cell. Every attribute filter
+    (diet, hot/cold, milk, category ids, stock) is a property of the cell,
+    so a query picks the matching cells from small per-cell bitmaps and then
+    binary-searches the price range in each: O(cells * log n + k) for k hits,
+    independent of how many items fail the filters.
+    """
+
+    def __init__(self, store: MenuMetadataStore):
+        self.store = store
+        n = len(store)
+
+        # One packed int64 key per row: (category, subcategory, group, in_stock)
+        sizes = [len(store.category_vocab), len(store.subcategory_vocab), len(store.group_vocab), 2]
+        key = np.zeros(n, dtype=np.int64)
+        for codes, size in zip(
+            (store.category_codes, store.subcategory_codes, store.group_codes, store.in_stock), sizes
+        ):
+            key = key * size + np.asarray(codes, dtype=np.int64)
+        cells, cell_of_row = np.unique(key, return_inverse=True)
+
+        # Cell-major, then ascending price (NaN last); stable by row for ties
+        price = np.asarray(store.price, dtype=np.float64)
+        self.order = np.lexsort((price, cell_of_row)).astype(np.int64)
+        self.sorted_price = price[self.order]
+        self.cell_bounds = np.searchsorted(cell_of_row[self.order], np.arange(len(cells) + 1))
+
+        # Unpack the cell keys into per-cell attribute columns
+        self.cell_in_stock = (cells % 2).astype(bool)
+        cells = cells // 2
+        self.cell_group = cells % max(sizes[2], 1)
+        cells = cells // max(sizes[2], 1)
+        self.cell_subcategory = cells % max(sizes[1], 1)
+        self.cell_category = cells // max(sizes[1], 1)
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def _cell_mask(
+        self,
+        require_in_stock: bool,
+        diet: Optional[List[str]],
+        temperature: Optional[List[str]],
+        milk: Optional[str],
+        category_ids: Optional[List[str]],
+        subcategory_ids: Optional[List[str]],
+        group_ids: Optional[List[str]],
+    ) -> np.ndarray:
+        store = self.store
+        flags = store.group_flags
+        mask = np.ones(len(self.cell_group), dtype=bool)
+
+        if require_in_stock:
+            mask &= self.cell_in_stock
+        for d in diet or []:
+            if d in flags:
+                mask &= flags[d][self.cell_group]
+        # Several temperatures mean "any of them"
+        wanted = [t for t in temperature or [] if t in flags]
+        if wanted:
+            mask &= np.logical_or.reduce([flags[t][self.cell_group] for t in wanted])
+        if milk in flags:
+            mask &= flags[milk][self.cell_group]
+        if category_ids:
+            mask &= np.isin(self.cell_category, store._codes_for(store.category_vocab, category_ids))
+        if subcategory_ids:
+            mask &= np.isin(self.cell_subcategory, store._codes_for(store.subcategory_vocab, subcategory_ids))
+        if group_ids:
+            mask &= np.isin(self.cell_group, store._codes_for(store.group_vocab, group_ids))
+        return mask
+
+    def rows(
+        self,
+        max_price: Optional[float] = None,
+        min_price: Optional[float] = None,
+        require_in_stock: bool = True,
+        diet: Optional[List[str]] = None,
+        temperature: Optional[List[str]] = None,
+        milk: Optional[str] = None,
+        category_ids: Optional[List[str]] = None,
+        subcategory_ids: Optional[List[str]] = None,
+        group_ids: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+    ) -> np.ndarray:
+        """
+        Every row matching all filters, cheapest first (unpriced items only
+        when no price bound is given). limit=None returns the complete set.
+        """
+        cells = np.flatnonzero(self._cell_mask(
+            require_in_stock, diet, temperature, milk,
+            category_ids, subcategory_ids, group_ids,
+        ))
+
+        bounded = min_price is not None or max_price is not None
+        low = -np.inf if min_price is None else min_price
+        high = np.inf if max_price is None else max_price
+
+        slices = []
+        for cell in cells.tolist():
+            start, end = int(self.cell_bounds[cell]), int(self.cell_bounds[cell + 1])
+            lo, hi = start, end
+            if bounded:
+                # NaN sorts after +inf, so any price bound drops unpriced rows
+                prices = self.sorted_price[start:end]
+                lo = start + int(np.searchsorted(prices, low, side="left"))
+                hi = start + int(np.searchsorted(prices, high, side="right"))
+            if hi > lo:
+                slices.append((lo, hi))
+
+        if not slices:
+            return np.zeros(0, dtype=np.int64)
+
+        positions = np.concatenate([np.arange(lo, hi) for lo, hi in slices])
+        if len(slices) > 1:
+            # Merge the per-cell runs by price (stable: ties keep cell order)
+            positions = positions[np.argsort(self.sorted_price[positions], kind="stable")]
+        if limit is not None:
+            positions = positions[:limit]
+        return self.order[positions]
+
+    def search(self, limit: Optional[int] = None, **filters) -> List[Dict]:
+        rows = self.rows(limit=limit, **filters)
+        return self.store.rows_to_results(rows, np.ones(len(rows), dtype=np.float32))
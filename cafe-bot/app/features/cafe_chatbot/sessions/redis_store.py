@@ -0,0 +1,206 @@
+# app/features/cafe_chatbot/sessions/redis_store.py
+
+import ssl
+import json
+import asyncio
+from urllib.parse import unquote, urlparse
+from typing import Any, Dict, List, Optional, Sequence
+
+from .store import DEFAULT_MAX_MESSAGES, SessionStore, SessionStoreError
+
+
+class RedisError(SessionStoreError):
+    """An error reply (-ERR ...) from the server."""
+
+
+def encode_command(args: Sequence) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode("utf-8")
+        elif not isinstance(arg, bytes):
+            arg = str(arg).encode("ascii")
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader) -> Any:
+    line = await reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("Connection closed by the server")
+
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload.decode("utf-8")
+    if kind == b"-":
+        # Returned, not raised: the other replies of the pipeline still
+        # have to be read to keep the connection in sync
+        return RedisError(payload.decode("utf-8"))
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        length = int(payload)
+        if length < 0:
+            return None
+        return (await reader.readexactly(length + 2))[:-2]
+    if kind == b"*":
+        length = int(payload)
+        if length < 0:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise SessionStoreError(f"Unexpected reply: {line[:80]!r}")
+
+
+class RedisClient:
+    """
+    Minimal asyncio client for the Redis protocol (RESP2): a small pool of
+    connections, and pipeline() sends a batch of commands in one write and
+    reads all their replies (one round trip).
+
+    URL: redis://[user:password@]host:port/db, or rediss:// for TLS.
+    """
+
+    def __init__(self, url: str, pool_size: int = 32, timeout: float = 2.0):
+        parsed = urlparse(url)
+        if parsed.scheme not in ("redis", "rediss"):
+            raise ValueError(f"Unsupported Redis URL scheme: {parsed.scheme!r}")
+
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.ssl = ssl.create_default_context() if parsed.scheme == "rediss" else None
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+
+        self._pool_size = pool_size
+        self._idle: List = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.round_trips = 0
+        self.errors = 0
+
+    async def _connect(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+        handshake = []
+        if self.password:
+            handshake.append(("AUTH", self.username, self.password) if self.username else ("AUTH", self.password))
+        if self.db:
+            handshake.append(("SELECT", self.db))
+        if handshake:
+            writer.write(b"".join(encode_command(c) for c in handshake))
+            for _ in handshake:
+                reply = await read_reply(reader)
+                if isinstance(reply, RedisError):
+                    writer.close()
+                    raise reply
+        return reader, writer
+
+    async def pipeline(self, commands: List[Sequence]) -> List[Any]:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._pool_size)
+
+        async with self._slots:
+            for attempt in range(2):
+                reused = bool(self._idle)
+                conn = self._idle.pop() if reused else None
+                try:
+                    if conn is None:
+                        conn = await asyncio.wait_for(self._connect(), self.timeout)
+                    reader, writer = conn
+                    writer.write(b"".join(encode_command(c) for c in commands))
+                    replies = await asyncio.wait_for(self._read_replies(reader, len(commands)), self.timeout)
+                    break
+                except (OSError, EOFError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                    if conn is not None:
+                        conn[1].close()
+                    if reused and attempt == 0 and isinstance(e, (ConnectionError, asyncio.IncompleteReadError)):
+                        # Pooled connection closed by the server while idle
+                        continue
+                    self.errors += 1
+                    raise SessionStoreError(f"Redis {self.host}:{self.port} unavailable: {e!r}") from e
+                except BaseException:
+                    # Cancelled mid-reply: the connection's state is unknown
+                    if conn is not None:
+                        conn[1].close()
+                    raise
+
+            self._idle.append(conn)
+            self.round_trips += 1
+
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                self.errors += 1
+                raise reply
+        return replies
+
+    @staticmethod
+    async def _read_replies(reader: asyncio.StreamReader, count: int) -> List[Any]:
+        return [await read_reply(reader) for _ in range(count)]
+
+    async def execute(self, *command) -> Any:
+        return (await self.pipeline([command]))[0]
+
+    async def close(self):
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+
+class RedisSessionStore(SessionStore):
+    """
+    One Redis list per session (one JSON message per element). load() is
+    LRANGE + EXPIRE (reading a session keeps it alive), append() is RPUSH +
+    LTRIM + EXPIRE; each is a single pipelined round trip. Memory across
+    sessions is bounded by the TTL and the server's maxmemory policy.
+    """
+
+    name = "redis"
+
+    def __init__(
+        self,
+        url: str = "redis://localhost:6379/0",
+        ttl_seconds: Optional[float] = 2 * 3600,
+        max_messages: int = DEFAULT_MAX_MESSAGES,
+        key_prefix: str = "cafe:session:",
+        pool_size: int = 32,
+        timeout: float = 2.0,
+    ):
+        super().__init__(max_messages)
+        self.client = RedisClient(url, pool_size=pool_size, timeout=timeout)
+        self.ttl_seconds = int(ttl_seconds) if ttl_seconds else None
+        self.key_prefix = key_prefix
+
+    def _key(self, session_id: str) -> str:
+        return self.key_prefix + session_id
+
+    def _expire(self, key: str) -> List[tuple]:
+        return [("EXPIRE", key, self.ttl_seconds)] if self.ttl_seconds else []
+
+    async def load(self, session_id: str) -> List[Dict]:
+        key = self._key(session_id)
+        replies = await self.client.pipeline([("LRANGE", key, -self.max_messages, -1)] + self._expire(key))
+        return [json.loads(raw) for raw in replies[0] or []]
+
+    async def append(self, session_id: str, messages: List[Dict]):
+        if not messages:
+            return
+        key = self._key(session_id)
+        encoded = [json.dumps(msg, ensure_ascii=False) for msg in messages]
+        await self.client.pipeline(
+            [("RPUSH", key, *encoded), ("LTRIM", key, -self.max_messages, -1)] + self._expire(key)
+        )
+
+    async def clear(self, session_id: str):
+        await self.client.execute("DEL", self._key(session_id))
+
+    def stats(self) -> Dict:
+        return {
+            **super().stats(),
+            "server": f"{self.client.host}:{self.client.port}/{self.client.db}",
+            "ttl_seconds": self.ttl_seconds,
+            "round_trips": self.client.round_trips,
+            "errors": self.client.errors,
+        }
+
+    async def close(self):
+        await self.client.close()
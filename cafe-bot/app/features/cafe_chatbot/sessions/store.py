@@ -0,0 +1,131 @@
+# app/features/cafe_chatbot/sessions/store.py
+
+"""
+Chat history per session_id.
+
+A store hands out a copy of the trimmed history for one turn (load) and
+takes that turn's new messages back in a single write (append), so the
+external backend costs one round trip per read and one per turn.
+
+"memory" keeps histories in this process (bounded by session count, bytes
+and an idle TTL; not shared between pre-fork workers). "redis" keeps them
+in Redis (or anything speaking its protocol, see scripts/local_redis.py)
+so every worker and node sees the same sessions.
+"""
+
+import os
+import json
+import threading
+from typing import Dict, List, Optional
+
+from ..cache import LRUTTLCache
+
+
+DEFAULT_MAX_MESSAGES = 20
+
+
+class SessionStoreError(RuntimeError):
+    """The backend could not be reached or answered with an error."""
+
+
+class SessionStore:
+    name = "base"
+
+    def __init__(self, max_messages: int = DEFAULT_MAX_MESSAGES):
+        self.max_messages = max_messages
+
+    async def load(self, session_id: str) -> List[Dict]:
+        """The session's last max_messages messages (a list the caller may mutate)."""
+        raise NotImplementedError
+
+    async def append(self, session_id: str, messages: List[Dict]):
+        """Add one turn's messages and trim to max_messages, in one write."""
+        raise NotImplementedError
+
+    async def clear(self, session_id: str):
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        return {"backend": self.name, "max_messages": self.max_messages}
+
+    async def close(self):
+        pass
+
+
+def history_bytes(messages) -> int:
+    return len(json.dumps(list(messages), ensure_ascii=False).encode("utf-8"))
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    LRU over sessions with a session count cap, a byte cap and an idle TTL
+    (a session expires ttl_seconds after its last turn). Histories are kept
+    as tuples and replaced on every turn, so the byte accounting stays exact.
+    """
+
+    name = "memory"
+
+    def __init__(
+        self,
+        max_sessions: int = 10000,
+        max_bytes: Optional[int] = 64 * 1024 * 1024,
+        ttl_seconds: Optional[float] = 2 * 3600,
+        max_messages: int = DEFAULT_MAX_MESSAGES,
+    ):
+        super().__init__(max_messages)
+        self.sessions = LRUTTLCache(
+            max_entries=max_sessions,
+            max_bytes=max_bytes,
+            ttl_seconds=ttl_seconds,
+            sizeof=history_bytes,
+        )
+        # Read-modify-write of one history must not lose a concurrent turn
+        self._lock = threading.Lock()
+
+    async def load(self, session_id: str) -> List[Dict]:
+        history = self.sessions.get(session_id) or ()
+        return [dict(msg) for msg in history]
+
+    async def append(self, session_id: str, messages: List[Dict]):
+        if not messages:
+            return
+        with self._lock:
+            history = self.sessions.get(session_id) or ()
+            history = (history + tuple(dict(msg) for msg in messages))[-self.max_messages:]
+            self.sessions.put(session_id, history)
+
+    async def clear(self, session_id: str):
+        self.sessions.pop(session_id)
+
+    def stats(self) -> Dict:
+        return {**super().stats(), **self.sessions.stats()}
+
+
+def create_session_store(backend: Optional[str] = None) -> SessionStore:
+    """
+    Store selected by CAFE_SESSION_STORE ("memory" by default, or "redis"
+    with REDIS_URL). Nothing connects until the first request.
+    """
+    backend = backend or os.environ.get("CAFE_SESSION_STORE", InMemorySessionStore.name)
+    max_messages = int(os.environ.get("CAFE_SESSION_MAX_MESSAGES", DEFAULT_MAX_MESSAGES))
+    ttl_seconds = float(os.environ.get("CAFE_SESSION_TTL_SECONDS", 2 * 3600))
+
+    if backend == InMemorySessionStore.name:
+        return InMemorySessionStore(
+            max_sessions=int(os.environ.get("CAFE_SESSION_MAX_SESSIONS", 10000)),
+            max_bytes=int(os.environ.get("CAFE_SESSION_MAX_BYTES", 64 * 1024 * 1024)),
+            ttl_seconds=ttl_seconds,
+            max_messages=max_messages,
+        )
+
+    if backend == "redis":
+        from .redis_store import RedisSessionStore
+
+        return RedisSessionStore(
+            url=os.environ.get("REDIS_URL", "redis://localhost:6379/0"),
+            ttl_seconds=ttl_seconds,
+            max_messages=max_messages,
+            pool_size=int(os.environ.get("CAFE_REDIS_POOL_SIZE", 32)),
+        )
+
+    raise RuntimeError(f"Unknown session store: {backend}")
@@ -0,0 +1,146 @@
+# app/features/cafe_chatbot/sessions/turns.py
+
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Deque, Dict, Optional
+
+
+# Turns of one session allowed to wait behind the running one
+MAX_QUEUED_TURNS = int(os.environ.get("CAFE_SESSION_MAX_QUEUED_TURNS", 4))
+# How long a queued turn waits for the previous ones before giving up
+TURN_WAIT_TIMEOUT_SECONDS = float(os.environ.get("CAFE_SESSION_TURN_TIMEOUT_SECONDS", 60))
+# Recent waits kept for the percentiles in stats()
+WAIT_SAMPLES = 1024
+
+
+class SessionBusyError(RuntimeError):
+    """The session already has max_queued turns waiting."""
+
+
+class TurnWaitTimeout(RuntimeError):
+    """The earlier turns of the session did not finish in time."""
+
+
+class _SessionLane:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        # asyncio.Lock wakes waiters in FIFO order: turns run as they arrived
+        self.lock = asyncio.Lock()
+        # Running + queued turns; the lane is dropped when this reaches 0
+        self.users = 0
+
+
+def _abandon(acquiring: asyncio.Future, lock: asyncio.Lock):
+    """Cancel a lock acquire nobody waits for; release the lock if it still wins."""
+    def release_if_acquired(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is None:
+            lock.release()
+
+    acquiring.cancel()
+    acquiring.add_done_callback(release_if_acquired)
+
+
+class SessionTurnQueue:
+    """
+    Runs the turns of one session one at a time, in arrival order; turns of
+    different sessions never wait on each other. A turn holds its session's
+    lane from loading the history until its answer is saved, so the next
+    turn sees it.
+
+    Per process: with pre-fork workers, turns of one session reaching two
+    workers are not serialized against each other.
+    """
+
+    def __init__(
+        self,
+        max_queued: int = MAX_QUEUED_TURNS,
+        timeout_seconds: Optional[float] = TURN_WAIT_TIMEOUT_SECONDS,
+    ):
+        self.max_queued = max_queued
+        self.timeout_seconds = timeout_seconds
+        self._lanes: Dict[str, _SessionLane] = {}
+
+        self.turns = 0
+        self.queued_turns = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.max_wait_seconds = 0.0
+        self._total_wait_seconds = 0.0
+        self._recent_waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+
+    async def acquire(self, session_id: str) -> float:
+        """
+        Wait for the session's earlier turns. Returns the seconds waited;
+        raises SessionBusyError or TurnWaitTimeout (nothing to release then).
+        """
+        lane = self._lanes.get(session_id)
+        if lane is None:
+            lane = self._lanes[session_id] = _SessionLane()
+        elif lane.users > self.max_queued:
+            self.rejected += 1
+            raise SessionBusyError(f"{lane.users - 1} turns already queued for this session")
+
+        lane.users += 1
+        start = time.perf_counter()
+        # Not asyncio.wait_for: before Python 3.12 it can time out (or be
+        # cancelled) after the acquire already succeeded, leaving the lane
+        # locked with nobody to release it
+        acquiring = asyncio.ensure_future(lane.lock.acquire())
+        try:
+            await asyncio.wait((acquiring,), timeout=self.timeout_seconds)
+        except BaseException:
+            _abandon(acquiring, lane.lock)
+            self._leave(session_id, lane)
+            raise
+        if not acquiring.done():
+            _abandon(acquiring, lane.lock)
+            self.timeouts += 1
+            self._leave(session_id, lane)
+            raise TurnWaitTimeout(f"Previous turn still running after {self.timeout_seconds}s")
+
+        waited = time.perf_counter() - start
+        self._record(waited)
+        return waited
+
+    def release(self, session_id: str):
+        lane = self._lanes[session_id]
+        lane.lock.release()
+        self._leave(session_id, lane)
+
+    def _leave(self, session_id: str, lane: _SessionLane):
+        lane.users -= 1
+        if lane.users == 0:
+            del self._lanes[session_id]
+
+    def _record(self, waited: float):
+        self.turns += 1
+        if waited > 0.001:
+            self.queued_turns += 1
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        self._total_wait_seconds += waited
+        self._recent_waits.append(waited)
+
+    def stats(self) -> Dict:
+        recent = sorted(self._recent_waits)
+
+        def pct(p: float) -> float:
+            return round(recent[min(int(p * len(recent)), len(recent) - 1)] * 1000, 2) if recent else 0.0
+
+        return {
+            "turns": self.turns,
+            "queued_turns": self.queued_turns,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "active_sessions": len(self._lanes),
+            "waiting_turns": sum(lane.users - lane.lock.locked() for lane in self._lanes.values()),
+            "queue_wait_ms": {
+                "avg": round(self._total_wait_seconds / self.turns * 1000, 2) if self.turns else 0.0,
+                "p50": pct(0.50),
+                "p95": pct(0.95),
+                "p99": pct(0.99),
+                "max": round(self.max_wait_seconds * 1000, 2),
+            },
+        }
@@ -1,28 +1,100 @@
 # CHANGED BELOW FOR GEMINI-3-FLASH-PREVIEW, USING SELF.HISTORY IN CHATBOT.PY
 print("✅ main.py imported")
 
+import os
+import time
+import asyncio
 import uvicorn
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
 from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 # Import our Stateless Bot
 from app.features.cafe_chatbot.chatbot import CafeChatbot
+from app.features.cafe_chatbot.sessions.store import SessionStoreError, create_session_store
+from app.features.cafe_chatbot.sessions.turns import SessionBusyError, SessionTurnQueue, TurnWaitTimeout
+from app.prefork import process_memory, run_prefork
 
 # 1. Global State
 bot = None
-user_sessions: Dict[str, List[Dict]] = {} # Memory Store (Use Redis in Prod)
+# Chat history per session_id: bounded in-process LRU, or Redis
+# (CAFE_SESSION_STORE=redis) to share sessions across workers / nodes
+session_store = create_session_store()
+# Turns of one session run one at a time, in order (sessions in parallel)
+turn_queue = SessionTurnQueue()
+
+class StartupState:
+    """
+    Tracks the staged startup so /health can separate liveness from readiness.
+    Phases: load (model, index, metadata, Gemini clients in parallel) -> warm_up.
+    """
+    def __init__(self):
+        self.phase = "starting"
+        self.ready = False
+        self.error: Optional[str] = None
+        self.phase_seconds: Dict[str, float] = {}
+        self.started_at = time.perf_counter()
+
+    def to_dict(self) -> Dict:
+        return {
+            "phase": self.phase,
+            "ready": self.ready,
+            "error": self.error,
+            "phase_seconds": self.phase_seconds,
+        }
+
+startup = StartupState()
+
+# Hot reload: poll the bundle pointer / config.json every N seconds (0 = off)
+RELOAD_POLL_SECONDS = float(os.environ.get("CAFE_RELOAD_POLL_SECONDS", 5))
 
 # 2. Lifespan Manager
-import os
-from contextlib import asynccontextmanager
+def _load_bot(storage_dir: str = "storage/cafe_faiss", mmap: bool = False) -> CafeChatbot:
+    print("🚀 Creating CafeChatbot...")
+    startup.phase = "loading"
+    instance = CafeChatbot(storage_dir=storage_dir, mmap=mmap)
+    startup.phase_seconds.update(instance.load_timings)
+    print("✅ CafeChatbot created")
+
+    startup.phase = "warming_up"
+    startup.phase_seconds["warm_up"] = instance.warm_up()
+    print("🔥 Warm-up done")
+    return instance
+
+def _watch_bundle(instance: CafeChatbot):
+    if RELOAD_POLL_SECONDS > 0:
+        instance.retriever.start_watching(RELOAD_POLL_SECONDS)
+
+def _publish(instance: CafeChatbot):
+    global bot
+    startup.phase_seconds["total"] = round(time.perf_counter() - startup.started_at, 3)
+    # Only publish the bot once it is warm: requests before this get 503
+    bot = instance
+    startup.phase = "ready"
+    startup.ready = True
+
+def preload_bot(storage_dir: str = "storage/cafe_faiss"):
+    """Synchronous load used by the pre-fork master (index + metadata mmap'd)."""
+    _publish(_load_bot(storage_dir, mmap=True))
+
+async def _startup_in_background():
+    try:
+        instance = await asyncio.to_thread(_load_bot)
+    except Exception as e:
+        print("❌ ERROR while loading bot:", repr(e))
+        startup.phase = "failed"
+        startup.error = repr(e)
+        return
+
+    _publish(instance)
+    _watch_bundle(instance)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global bot
     print("🔄 Lifespan starting")
 
     print("📂 CWD:", os.getcwd())
@@ -33,16 +105,24 @@ async def lifespan(app: FastAPI):
     else:
         print("❌ storage folder missing")
 
-    try:
-        print("🚀 Creating CafeChatbot...")
-        bot = CafeChatbot(storage_dir="storage/cafe_faiss")
-        print("✅ CafeChatbot created")
-    except Exception as e:
-        print("❌ ERROR while loading bot:", repr(e))
-        raise e
+    # Pre-forked workers inherit a warm bot from the master (the watcher
+    # thread does not survive fork, so each worker starts its own)
+    if bot is not None:
+        _watch_bundle(bot)
+        yield
+        await session_store.close()
+        return
+
+    # Load in the background so the process answers liveness probes while
+    # the model and index are still coming up.
+    loader = asyncio.create_task(_startup_in_background())
 
     yield
 
+    if not loader.done():
+        loader.cancel()
+    await session_store.close()
+
 app = FastAPI(title="Cafe RAG API", lifespan=lifespan)
 
 # Allow CORS for your ExpressJS/Frontend
@@ -57,85 +137,207 @@ class ChatRequest(BaseModel):
     message: str
     session_id: str = "default_user"
 
-# @app.post("/chat/stream")
-# async def stream_chat(request: ChatRequest):
-#     if not bot:
-#         raise HTTPException(status_code=503, detail="Bot starting up...")
+class SearchFilters(BaseModel):
+    max_price: Optional[int] = None
+    require_in_stock: bool = True
+    diet: Optional[List[str]] = None
+    category_ids: Optional[List[str]] = None
+    subcategory_ids: Optional[List[str]] = None
+    group_ids: Optional[List[str]] = None
 
-#     # A. Retrieve or Initialize User History
-#     if request.session_id not in user_sessions:
-#         user_sessions[request.session_id] = []
-    
-#     # We pass this list to the bot. 
-#     # Because lists are mutable, the bot updates this list IN-PLACE.
-#     history = user_sessions[request.session_id]
-
-#     async def response_generator():
-#         try:
-#             # The bot will generate text AND update 'history' automatically
-#             for chunk in bot.chat_stream(request.message, chat_history=history):
-#                 yield chunk
-                
-#         except Exception as e:
-#             yield f"[Error: {str(e)}]"
-#             return
-
-#         # Optimization: Trim history if it gets too long (keep last 10 turns)
-#         if len(history) > 20: 
-#             # Slice in-place to keep the object reference valid
-#             history[:] = history[-20:]
-
-#     return StreamingResponse(response_generator(), media_type="text/plain")
-from fastapi.concurrency import iterate_in_threadpool
-from fastapi.responses import StreamingResponse
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    top_k: int = 10
+    # Either one filter set for every query, or one per query (same order)
+    filters: Optional[SearchFilters] = None
+    per_query_filters: Optional[List[SearchFilters]] = None
+
+MAX_BATCH_QUERIES = 1000
+
+# "async" (default): the whole pipeline runs on the event loop (client.aio),
+# an open stream holds no thread. "threadpool": the old sync pipeline, one
+# anyio worker thread per stream (kept for comparison / rollback).
+CHAT_PIPELINE = os.environ.get("CAFE_CHAT_PIPELINE", "async")
+
+STREAM_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+    "Connection": "keep-alive",
+}
+
+class TurnStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that awaits on_close() once the body is done with,
+    also when the client went away before the first chunk (the body
+    generator never started then, so its own finally never runs).
+    """
+
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+            await asyncio.shield(self.on_close())
 
 @app.post("/chat/stream")
 async def stream_chat(request: ChatRequest):
     if not bot:
         raise HTTPException(status_code=503, detail="Bot starting up...")
 
-    # Session history
-    history = user_sessions.setdefault(request.session_id, [])
+    # Wait for this session's earlier turns (their records are in history)
+    try:
+        await turn_queue.acquire(request.session_id)
+    except (SessionBusyError, TurnWaitTimeout) as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+    # Session history: one read now, one write with this turn's record
+    try:
+        history = await session_store.load(request.session_id)
+    except SessionStoreError as e:
+        turn_queue.release(request.session_id)
+        raise HTTPException(status_code=503, detail=f"Session store unavailable: {e}")
+    turn_start = len(history)
+
+    if CHAT_PIPELINE == "threadpool":
+        # IMPORTANT: run the blocking generator in a threadpool
+        sync_chunks = bot.chat_stream(request.message, chat_history=history)
+        chunks = iterate_in_threadpool(sync_chunks)
+    else:
+        sync_chunks = None
+        chunks = bot.chat_stream_async(request.message, chat_history=history)
+
+    async def finish_turn():
+        try:
+            await session_store.append(request.session_id, history[turn_start:])
+        except SessionStoreError as e:
+            print(f"[Session Store Error] {e}")
+        finally:
+            turn_queue.release(request.session_id)
 
-    # IMPORTANT: run the blocking generator in a threadpool
-    def sync_generator():
+    async def response_generator():
         try:
-            for chunk in bot.chat_stream(request.message, chat_history=history):
+            async for chunk in chunks:
                 # 🔥 newline forces browser flush
                 yield chunk + "\n"
         except Exception as e:
             yield f"[Error: {str(e)}]\n"
+        finally:
+            # Closing the bot's generator fills in the assistant message, so
+            # a partial turn is kept too if the client went away
+            await chunks.aclose()
+            if sync_chunks is not None:
+                sync_chunks.close()
 
-        # Trim history safely
-        if len(history) > 20:
-            history[:] = history[-20:]
-
-    return StreamingResponse(
-        iterate_in_threadpool(sync_generator()),
+    return TurnStreamingResponse(
+        response_generator(),
+        on_close=finish_turn,
         media_type="text/plain",
-        headers={
-            "Cache-Control": "no-cache",
-            "X-Accel-Buffering": "no",
-            "Connection": "keep-alive",
-        }
+        headers=STREAM_HEADERS,
     )
 
 @app.post("/chat/clear")
 async def clear_history(request: ChatRequest):
-    if request.session_id in user_sessions:
-        user_sessions[request.session_id] = []
+    try:
+        await session_store.clear(request.session_id)
+    except SessionStoreError as e:
+        raise HTTPException(status_code=503, detail=f"Session store unavailable: {e}")
     return {"status": "memory_cleared"}
 
+@app.post("/search/batch")
+async def search_batch(request: BatchSearchRequest):
+    """Retrieval-only endpoint for kiosk / analytics jobs (no LLM calls)."""
+    if not bot:
+        raise HTTPException(status_code=503, detail="Bot starting up...")
+
+    if len(request.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_QUERIES} queries per request")
+
+    if request.per_query_filters is not None:
+        if len(request.per_query_filters) != len(request.queries):
+            raise HTTPException(status_code=422, detail="per_query_filters must match queries length")
+        filters = [f.model_dump(exclude_none=True) for f in request.per_query_filters]
+    elif request.filters is not None:
+        filters = request.filters.model_dump(exclude_none=True)
+    else:
+        filters = None
+
+    # Embedding + FAISS are CPU-bound: keep them off the event loop
+    results = await run_in_threadpool(
+        bot.retriever.search_many, request.queries, filters, request.top_k
+    )
+
+    return {
+        "results": [
+            {"query": q, "items": items}
+            for q, items in zip(request.queries, results)
+        ]
+    }
+
+@app.post("/admin/reload")
+async def admin_reload(x_admin_token: Optional[str] = Header(default=None)):
+    """Load the current FAISS bundle now and swap it in (ADMIN_TOKEN required)."""
+    admin_token = os.environ.get("ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=404, detail="Not found")
+    if x_admin_token != admin_token:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    if not bot:
+        raise HTTPException(status_code=503, detail="Bot starting up...")
+
+    try:
+        swapped = await run_in_threadpool(bot.retriever.reload, True)
+    except Exception as e:
+        raise HTTPException(status_code=409, detail=f"Reload failed, old bundle still serving: {e!r}")
+
+    return {"reloaded": swapped, **bot.retriever.status()}
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint for Render monitoring"""
     return {
-        "status": "healthy",
+        "status": "healthy" if startup.ready else startup.phase,
         "bot_loaded": bot is not None,
-        "service": "cafe-bot"
+        "service": "cafe-bot",
+        "startup": startup.to_dict(),
+        "bundle": bot.retriever.status() if bot else None,
+        "extractor": bot.extractor.stats() if bot else None,
+        "retrieval_paths": dict(bot.retrieval_paths) if bot else None,
+        "generation": bot.generator.stats() if bot else None,
+        "response_cache": bot.response_cache.stats() if bot else None,
+        "semantic_cache": bot.semantic_cache.stats() if bot else None,
+        "sessions": session_store.stats(),
+        "session_turns": turn_queue.stats(),
     }
 
+@app.get("/health/live")
+async def liveness():
+    """Process is up. Only fails if startup itself crashed (restart the pod)."""
+    if startup.error:
+        raise HTTPException(status_code=503, detail=startup.to_dict())
+    return {"status": "alive", "phase": startup.phase}
+
+@app.get("/health/ready")
+async def readiness():
+    """Bot is loaded and warmed up: safe to route traffic here."""
+    if not startup.ready:
+        raise HTTPException(status_code=503, detail=startup.to_dict())
+    return {"status": "ready", "phase_seconds": startup.phase_seconds}
+
+@app.get("/health/memory")
+async def memory_usage():
+    """RSS / PSS / unique (USS) memory of the worker serving this request."""
+    return {"pid": os.getpid(), **process_memory()}
+
 if __name__ == "__main__":
     # Get port from environment (Render sets this automatically)
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run("app.main:app", host="0.0.0.0", port=port, reload=False)
\ No newline at end of file
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    if workers > 1:
+        # Load once, fork N workers sharing the model / mmap'd index pages
+        run_prefork("0.0.0.0", port, workers)
+    else:
+        uvicorn.run("app.main:app", host="0.0.0.0", port=port, reload=False)
\ No newline at end of file
@@ -0,0 +1,183 @@
+# app/prefork.py
+"""
+Pre-fork multi-worker server.
+
+The master process loads the embedder, the FAISS index (mmap) and the binary
+metadata columns (mmap) once, freezes the GC, then forks N uvicorn workers
+that share those pages copy-on-write instead of each loading its own copy.
+
+    WEB_CONCURRENCY=4 python -m app.main
+
+Send SIGUSR1 to the master to print a per-worker memory report
+(RSS / PSS / USS = unique set size, i.e. pages private to that worker).
+
+Sessions: workers accept from one shared socket, so consecutive turns of a
+session land on arbitrary workers. The default in-memory session store and
+the per-session turn queue live in each worker, which would lose history
+between turns. Pre-forking therefore requires CAFE_SESSION_STORE=redis
+(REDIS_URL), and refuses to start otherwise. CAFE_PREFORK_LOCAL_SESSIONS=1
+overrides this for deployments that do not use /chat (e.g. /search only).
+Even with Redis, turns are only serialized per worker: two turns of one
+session sent at once may run concurrently on different workers, so
+clients should wait for an answer before sending the next message.
+"""
+
+import gc
+import os
+import sys
+import signal
+import socket
+from pathlib import Path
+from typing import Dict, List
+
+import uvicorn
+
+
+def process_memory(pid="self") -> Dict[str, int]:
+    """RSS / PSS / USS in kB from /proc/<pid>/smaps_rollup (Linux only)."""
+    values: Dict[str, int] = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":"):
+                    values[parts[0][:-1]] = int(parts[1])
+    except (OSError, ValueError):
+        return {}
+
+    return {
+        "rss_kb": values.get("Rss", 0),
+        "pss_kb": values.get("Pss", 0),
+        "uss_kb": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0),
+        "shared_kb": values.get("Shared_Clean", 0) + values.get("Shared_Dirty", 0),
+    }
+
+
+def memory_report(master_pid: int, worker_pids: List[int]) -> str:
+    lines = [f"{'role':<8}{'pid':>8}{'rss MB':>10}{'pss MB':>10}{'uss MB':>10}"]
+    for role, pid in [("master", master_pid)] + [("worker", p) for p in worker_pids]:
+        mem = process_memory(pid)
+        if not mem:
+            continue
+        lines.append(
+            f"{role:<8}{pid:>8}"
+            f"{mem['rss_kb'] / 1024:>10.1f}{mem['pss_kb'] / 1024:>10.1f}{mem['uss_kb'] / 1024:>10.1f}"
+        )
+    return "\n".join(lines)
+
+
+def ensure_metadata_columns(storage_dir: str):
+    """Older bundles only have metadata.jsonl: derive the mmap-able columns once."""
+    from app.features.cafe_chatbot.retrieval.bundle import resolve_bundle_dir
+    from app.features.cafe_chatbot.retrieval.metadata_store import (
+        COLUMNS_DIR,
+        MenuMetadataStore,
+    )
+
+    storage = resolve_bundle_dir(Path(storage_dir))
+    if (storage / COLUMNS_DIR / "vocab.json").exists():
+        return
+    print("📦 Writing binary metadata columns for mmap")
+    MenuMetadataStore.from_jsonl(storage / "metadata.jsonl").save_columns(storage / COLUMNS_DIR)
+
+
+def check_session_store():
+    """Refuse to fork workers that would each keep their own chat history."""
+    backend = os.environ.get("CAFE_SESSION_STORE", "memory")
+    if backend == "redis":
+        return
+    message = (
+        f"WEB_CONCURRENCY>1 with CAFE_SESSION_STORE={backend}: every worker would keep "
+        f"its own chat history and turn order. Set CAFE_SESSION_STORE=redis."
+    )
+    if os.environ.get("CAFE_PREFORK_LOCAL_SESSIONS") == "1":
+        print(f"⚠️  {message} (continuing: CAFE_PREFORK_LOCAL_SESSIONS=1)", file=sys.stderr)
+        return
+    print(f"\n[FATAL] {message}\n", file=sys.stderr)
+    sys.exit(1)
+
+
+def _serve_worker(sock: socket.socket):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+
+    from app import main
+
+    config = uvicorn.Config(main.app, lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def run_prefork(host: str, port: int, workers: int, storage_dir: str = "storage/cafe_faiss"):
+    check_session_store()
+
+    # One embedding thread per worker; must be set before torch/ORT load
+    os.environ.setdefault("CAFE_EMBED_THREADS", "1")
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+
+    ensure_metadata_columns(storage_dir)
+
+    from app import main
+
+    main.preload_bot(storage_dir)
+
+    # Keep everything loaded so far out of GC passes: touching object headers
+    # in a worker would otherwise copy the shared pages.
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    master_pid = os.getpid()
+    children: Dict[int, int] = {}
+    stopping = False
+
+    def spawn(slot: int):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _serve_worker(sock)
+            finally:
+                os._exit(0)
+        children[pid] = slot
+        print(f"👷 Worker {slot} started (pid {pid})")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def report(signum, frame):
+        print(memory_report(master_pid, list(children)), flush=True)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGUSR1, report)
+    # First report once workers have had time to serve warm traffic
+    signal.signal(signal.SIGALRM, report)
+    signal.alarm(10)
+
+    for slot in range(workers):
+        spawn(slot)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+
+        slot = children.pop(pid, None)
+        if slot is not None and not stopping:
+            print(f"⚠️ Worker {slot} (pid {pid}) exited with {status}, restarting")
+            spawn(slot)
+
+    sock.close()
+    sys.exit(0)
@@ -0,0 +1,517 @@
+#!/usr/bin/env python3
+"""
+benchmark_retrieval.py
+
+Retrieval micro-benchmark over synthetic menus of growing size.
+
+For every size, a synthetic menu with the same schema as metadata.jsonl is
+generated from the current bundle's items (names, prices, category / group
+ids re-used and varied), written as a normal bundle (index per ann.py auto
+selection or --index-type, metadata columns, config.json) and loaded by
+CafeRAGRetriever in a fresh process. Measured per size:
+
+  - build:   generate / embed / index build seconds, index file size
+  - load:    retriever load timings, RSS / USS growth of the process
+  - embed:   one query through the embedding backend
+  - search:  index.search, unfiltered
+  - filter:  mask + selector construction, and filtered index.search
+  - e2e:     CafeRAGRetriever.search p50 / p95 / p99 (unfiltered, filtered)
+  - list:    CafeRAGRetriever.list_items (structured listing, no embedding)
+
+Runs fully offline: item and query vectors come from the "hash" embedding
+backend (token hashing, no model download, no Gemini key). --embedder config
+embeds the queries with the backend of the current bundle instead; items
+are always hash-embedded, so scores are not meaningful, only timings.
+
+Results are written as JSON (one file per run, tagged with the git commit;
+benchmarks/ by default, which git ignores)
+so two commits can be compared with --compare.
+
+Usage:
+  python -m scripts.benchmark_retrieval [--sizes 100,1000,10000,100000,1000000]
+      [--queries 200] [--index-type auto|TYPE] [--memory-budget-mb MB]
+      [--embedder hash|config] [--batching] [--mmap]
+      [--output results.json] [--compare baseline.json]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import datetime
+import platform
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Dict, List, Optional
+
+import numpy as np
+from pathlib import Path
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.features.cafe_chatbot.retrieval.ann import (
+    INDEX_TYPES,
+    build_index,
+    choose_index_type,
+    index_file,
+    write_index,
+)
+from app.features.cafe_chatbot.retrieval.backends import HashingEmbeddingBackend
+from app.features.cafe_chatbot.retrieval.bundle import resolve_bundle_dir
+from app.features.cafe_chatbot.retrieval.metadata_store import COLUMNS_DIR, MenuMetadataStore
+
+
+# -----------------------------
+# Configuration
+# -----------------------------
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+STORAGE_DIR = BASE_DIR / "storage" / "cafe_faiss"
+RESULTS_DIR = BASE_DIR / "benchmarks"
+
+DEFAULT_SIZES = "100,1000,10000,100000,1000000"
+DEFAULT_QUERIES = 200
+DEFAULT_MEMORY_BUDGET_MB = 1024
+WARM_UP_QUERIES = 20
+TOP_K = 50
+EMBED_CHUNK = 8192
+RANDOM_SEED = 0
+
+# Name variations used once the seed menu's names are exhausted
+NAME_PREFIXES = (
+    "Classic", "Double", "Hazelnut", "Vanilla", "Caramel", "Mocha", "Honey",
+    "Salted", "Spiced", "Smoked", "Coconut", "Almond", "Irish", "Maple",
+)
+
+# Free-text queries; item names are mixed in to exercise the exact-match path
+FREE_TEXT_QUERIES = (
+    "cold coffee", "something sweet", "strong black coffee", "hazelnut latte",
+    "iced tea", "chocolate shake", "vegan drink", "snack with coffee",
+    "hot milk coffee", "cheap cold brew", "caramel frappe", "light breakfast",
+)
+
+# (label, search() keyword filters)
+FILTER_SETS = (
+    ("price", {"max_price": 200}),
+    ("vegan", {"diet": ["vegan"]}),
+    ("category", {"category_ids": None}),   # filled from the menu
+)
+
+# Metrics shown by --compare (the JSON holds everything)
+COMPARED_SUFFIXES = ("p50_ms", "p99_ms", "_s", "_mb")
+
+
+def fatal(msg: str):
+    print(f"\n❌ ERROR: {msg}\n")
+    sys.exit(1)
+
+
+def percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    values = np.asarray(samples_ms, dtype=np.float64)
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 4),
+        "p95_ms": round(float(np.percentile(values, 95)), 4),
+        "p99_ms": round(float(np.percentile(values, 99)), 4),
+        "mean_ms": round(float(values.mean()), 4),
+    }
+
+
+def timed_ms(fn, inputs: List) -> List[float]:
+    samples = []
+    for value in inputs:
+        start = time.perf_counter()
+        fn(value)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def git_commit() -> Dict:
+    def git(*cmd):
+        return subprocess.run(
+            ["git", *cmd], cwd=BASE_DIR, capture_output=True, text=True
+        ).stdout.strip()
+
+    try:
+        return {"commit": git("rev-parse", "--short", "HEAD") or None, "dirty": bool(git("status", "--porcelain"))}
+    except OSError:
+        return {"commit": None, "dirty": None}
+
+
+# -----------------------------
+# Synthetic menu
+# -----------------------------
+
+def load_seed_menu() -> List[Dict]:
+    bundle_dir = resolve_bundle_dir(STORAGE_DIR)
+    metadata_path = bundle_dir / "metadata.jsonl"
+    if not metadata_path.exists():
+        fatal(f"metadata.jsonl not found in {bundle_dir} (needed as the synthetic menu seed)")
+
+    with open(metadata_path, "r", encoding="utf-8") as f:
+        seed = [json.loads(line) for line in f if line.strip()]
+    if not seed:
+        fatal(f"{metadata_path} is empty")
+    return seed
+
+
+def synthetic_menu(seed: List[Dict], n: int) -> List[Dict]:
+    """
+    n metadata.jsonl records: the seed items first, then prefixed / numbered
+    variants with jittered prices and ~10% out of stock.
+    """
+    rng = np.random.default_rng(RANDOM_SEED)
+    jitter = rng.integers(-40, 41, size=n) // 10 * 10
+    in_stock = rng.random(n) >= 0.1
+
+    records = []
+    for i in range(n):
+        base = seed[i % len(seed)]
+        round_no = i // len(seed)
+
+        name = base["name"]
+        if round_no:
+            prefix = NAME_PREFIXES[(round_no - 1) % len(NAME_PREFIXES)]
+            name = f"{prefix} {name}"
+            if round_no > len(NAME_PREFIXES):
+                name = f"{name} {(round_no - 1) // len(NAME_PREFIXES)}"
+
+        price = base.get("price")
+        if round_no and price is not None:
+            price = max(10, int(price) + int(jitter[i]))
+        records.append({
+            "vector_id": i,
+            "item_id": f"{base['item_id']}_{round_no}" if round_no else base["item_id"],
+            "name": name,
+            "price": price,
+            "inStock": bool(in_stock[i]) if round_no else base.get("inStock", True),
+            "categoryId": base.get("categoryId"),
+            "subCategoryId": base.get("subCategoryId"),
+            "groupId": base.get("groupId"),
+        })
+    return records
+
+
+def item_text(record: Dict) -> str:
+    # Same layout as serialize_menu_item; labels come from the ids
+    def label(value: Optional[str]) -> str:
+        return (value or "").split("_", 1)[-1].replace("_", " ")
+
+    availability = "In stock" if record["inStock"] else "Out of stock"
+    return (
+        f"Item: {record['name']}\n"
+        f"Category: {label(record['categoryId'])}\n"
+        f"Subcategory: {label(record['subCategoryId'])}\n"
+        f"Section: {label(record['groupId'])}\n"
+        f"Price: {record['price']} INR\n"
+        f"Availability: {availability}"
+    )
+
+
+def write_synthetic_bundle(bundle_dir: Path, records: List[Dict], args, dimension: int) -> Dict:
+    stats: Dict = {}
+    backend = HashingEmbeddingBackend(dimension)
+
+    start = time.perf_counter()
+    vectors = np.zeros((len(records), dimension), dtype=np.float32)
+    for offset in range(0, len(records), EMBED_CHUNK):
+        chunk = records[offset:offset + EMBED_CHUNK]
+        vectors[offset:offset + len(chunk)] = backend.encode([item_text(r) for r in chunk])
+    stats["embed_items_s"] = round(time.perf_counter() - start, 3)
+
+    kind = args.index_type
+    if kind == "auto":
+        kind = choose_index_type(len(records), dimension, args.memory_budget_mb * 1024 * 1024)
+
+    start = time.perf_counter()
+    ids = np.arange(len(records), dtype=np.int64)
+    index = build_index(kind, vectors, ids)
+    write_index(index, bundle_dir)
+    stats["index_build_s"] = round(time.perf_counter() - start, 3)
+    stats["index_type"] = kind
+    stats["index_file_mb"] = round((bundle_dir / index_file(kind)).stat().st_size / 1024 / 1024, 3)
+    del index, vectors
+
+    start = time.perf_counter()
+    with open(bundle_dir / "metadata.jsonl", "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    MenuMetadataStore.from_records(records).save_columns(bundle_dir / COLUMNS_DIR)
+    stats["metadata_write_s"] = round(time.perf_counter() - start, 3)
+
+    config = {
+        "embedding_model": "hash",
+        "embedding_backend": "hash",
+        "dimension": dimension,
+        "index_type": kind,
+        "menu_version": "benchmark",
+        "created_at": datetime.datetime.utcnow().isoformat() + "Z",
+        "num_items": len(records),
+        # Every measured query is a cache miss; batching only adds its wait
+        # window to a single-threaded caller unless --batching is given
+        "query_cache": {"max_entries": 0},
+        "query_batching": {"enabled": args.batching},
+    }
+    if args.embedder == "config":
+        seed_config = json.loads((resolve_bundle_dir(STORAGE_DIR) / "config.json").read_text(encoding="utf-8"))
+        config["embedding_model"] = seed_config["embedding_model"]
+        config["embedding_backend"] = seed_config.get("embedding_backend", "sentence-transformers")
+        if "onnx" in seed_config:
+            onnx_cfg = dict(seed_config["onnx"])
+            # model_dir is relative to the storage root; make it absolute
+            onnx_cfg["model_dir"] = str(STORAGE_DIR / onnx_cfg["model_dir"])
+            config["onnx"] = onnx_cfg
+
+    with open(bundle_dir / "config.json", "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    return stats
+
+
+# -----------------------------
+# Measurement (runs in a fresh process)
+# -----------------------------
+
+def benchmark_queries(records: List[Dict], count: int) -> List[str]:
+    rng = np.random.default_rng(RANDOM_SEED + 1)
+    queries = []
+    for i in range(count):
+        if i % 5 == 0:
+            queries.append(records[int(rng.integers(len(records)))]["name"])
+        else:
+            queries.append(f"{FREE_TEXT_QUERIES[int(rng.integers(len(FREE_TEXT_QUERIES)))]} {i}")
+    return queries
+
+
+def measure_bundle(storage_dir: str, queries: List[str], filter_sets: List, mmap: bool) -> Dict:
+    from app.prefork import process_memory
+    from app.features.cafe_chatbot.retrieval.retriever import CafeRAGRetriever
+
+    def mb(kb: int) -> float:
+        return round(kb / 1024, 2)
+
+    before = process_memory()
+    start = time.perf_counter()
+    retriever = CafeRAGRetriever(storage_dir, mmap=mmap)
+    load_s = round(time.perf_counter() - start, 3)
+    after = process_memory()
+
+    bundle = retriever._bundle
+    index = bundle.index
+    k = min(TOP_K, index.ntotal)
+    warm, measured = queries[:WARM_UP_QUERIES], queries[WARM_UP_QUERIES:] or queries
+
+    for q in warm:
+        retriever.search(q, top_k=TOP_K)
+
+    encode = bundle.embedder._encode
+    vectors = {q: np.ascontiguousarray(encode([q]), dtype=np.float32) for q in measured}
+    _, _, unfiltered_params = bundle.search_params(TOP_K, {})
+
+    result = {
+        "load_s": load_s,
+        "load_timings": retriever.load_timings,
+        "memory": {
+            "rss_mb": mb(after.get("rss_kb", 0)),
+            "rss_growth_mb": mb(after.get("rss_kb", 0) - before.get("rss_kb", 0)),
+            "uss_growth_mb": mb(after.get("uss_kb", 0) - before.get("uss_kb", 0)),
+        },
+        "embed": percentiles(timed_ms(lambda q: encode([q]), measured)),
+        "search": percentiles(timed_ms(
+            lambda q: index.search(vectors[q], k, params=unfiltered_params), measured
+        )),
+        "e2e": percentiles(timed_ms(lambda q: retriever.search(q, top_k=TOP_K), measured)),
+        # Complete "vegan under 200" listing from the price/attribute index
+        "list": percentiles(timed_ms(
+            lambda q: retriever.list_items(max_price=200, diet=["vegan"]), measured
+        )),
+        "filters": {},
+    }
+
+    for label, filters in filter_sets:
+        mask_ms = timed_ms(lambda q: bundle.search_params(TOP_K, filters), measured)
+        fk, mask, params = bundle.search_params(TOP_K, filters)
+        entry = {
+            "selectivity": round(float(mask.mean()) if mask is not None else 1.0, 4),
+            "mask": percentiles(mask_ms),
+            "e2e": percentiles(timed_ms(lambda q: retriever.search(q, top_k=TOP_K, **filters), measured)),
+        }
+        if fk > 0:
+            entry["search"] = percentiles(timed_ms(
+                lambda q: index.search(vectors[q], fk, params=params), measured
+            ))
+        result["filters"][label] = entry
+
+    return result
+
+
+# -----------------------------
+# Reporting
+# -----------------------------
+
+def flatten(result: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in result.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def print_summary(results: Dict):
+    print(f"\n{'items':>9} {'index':>9} {'load s':>8} {'rss+ MB':>9} "
+          f"{'embed p50':>10} {'search p50':>11} {'e2e p50':>9} {'e2e p95':>9} {'e2e p99':>9} {'filt p50':>9}")
+    for size, r in results.items():
+        filtered = r["filters"].get("price", {}).get("e2e", {}).get("p50_ms", float("nan"))
+        print(
+            f"{size:>9} {r['build']['index_type']:>9} {r['load_s']:>8.2f} {r['memory']['rss_growth_mb']:>9.1f} "
+            f"{r['embed']['p50_ms']:>10.3f} {r['search']['p50_ms']:>11.3f} "
+            f"{r['e2e']['p50_ms']:>9.3f} {r['e2e']['p95_ms']:>9.3f} {r['e2e']['p99_ms']:>9.3f} {filtered:>9.3f}"
+        )
+
+
+def print_comparison(baseline_path: str, current: Dict):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    print(f"\n📊 vs {baseline_path} (commit {baseline.get('git', {}).get('commit')})")
+    print(f"{'items':>9}  {'metric':<40}{'before':>12}{'after':>12}{'change':>9}")
+    for size, result in current["results"].items():
+        old = baseline.get("results", {}).get(size)
+        if old is None:
+            continue
+        before, after = flatten(old), flatten(result)
+        for name in sorted(set(before) & set(after)):
+            if not name.endswith(COMPARED_SUFFIXES) or name.startswith("load_timings"):
+                continue
+            if before[name] == 0:
+                continue
+            change = (after[name] - before[name]) / abs(before[name]) * 100
+            print(f"{size:>9}  {name:<40}{before[name]:>12.3f}{after[name]:>12.3f}{change:>8.1f}%")
+
+
+# -----------------------------
+# Main
+# -----------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval on synthetic menus")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated item counts")
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES, help="measured queries per size")
+    parser.add_argument("--index-type", default="auto", choices=("auto",) + INDEX_TYPES)
+    parser.add_argument("--memory-budget-mb", type=int, default=DEFAULT_MEMORY_BUDGET_MB,
+                        help="index memory budget for --index-type auto")
+    parser.add_argument("--dimension", type=int, default=384, help="vector dimension (hash embedder)")
+    parser.add_argument("--embedder", default="hash", choices=("hash", "config"),
+                        help="query embedder: offline hash backend, or the current bundle's backend")
+    parser.add_argument("--batching", action="store_true", help="keep query micro-batching enabled")
+    parser.add_argument("--mmap", action="store_true", help="load bundles with mmap=True")
+    parser.add_argument("--output", help="results JSON (default benchmarks/retrieval_<commit>.json)")
+    parser.add_argument("--compare", help="baseline results JSON to diff against")
+    parser.add_argument("--keep", help="keep the generated bundles in this directory")
+    args = parser.parse_args()
+
+    try:
+        sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    except ValueError:
+        fatal(f"Invalid --sizes: {args.sizes}")
+    if not sizes or min(sizes) <= 0:
+        fatal("--sizes must be positive item counts")
+
+    dimension = args.dimension
+    if args.embedder == "config":
+        seed_config = json.loads((resolve_bundle_dir(STORAGE_DIR) / "config.json").read_text(encoding="utf-8"))
+        dimension = seed_config["dimension"]
+
+    seed = load_seed_menu()
+    print(f"✔ Seed menu: {len(seed)} items")
+
+    work_dir = Path(args.keep) if args.keep else Path(tempfile.mkdtemp(prefix="cafe_bench_"))
+    work_dir.mkdir(parents=True, exist_ok=True)
+
+    git = git_commit()
+    run = {
+        "schema": 1,
+        "created_at": datetime.datetime.utcnow().isoformat() + "Z",
+        "git": git,
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+        },
+        "settings": {
+            "sizes": sizes,
+            "queries": args.queries,
+            "top_k": TOP_K,
+            "index_type": args.index_type,
+            "memory_budget_mb": args.memory_budget_mb,
+            "dimension": dimension,
+            "embedder": args.embedder,
+            "batching": args.batching,
+            "mmap": args.mmap,
+        },
+        "results": {},
+    }
+
+    # A fresh interpreter per size: clean memory numbers, no warm caches
+    # carried over between sizes
+    pool = ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn"))
+    try:
+        for n in sizes:
+            print(f"\n🔧 {n} items")
+            storage_dir = work_dir / f"menu_{n}"
+            if storage_dir.exists():
+                shutil.rmtree(storage_dir)
+            storage_dir.mkdir(parents=True)
+
+            start = time.perf_counter()
+            records = synthetic_menu(seed, n)
+            generate_s = round(time.perf_counter() - start, 3)
+
+            build = write_synthetic_bundle(storage_dir, records, args, dimension)
+            build["generate_s"] = generate_s
+            print(f"✔ Built {build['index_type']} bundle ({build['index_file_mb']} MB index, "
+                  f"{build['embed_items_s'] + build['index_build_s']:.1f}s)")
+
+            category = records[0]["categoryId"]
+            filter_sets = [
+                (label, {"category_ids": [category]} if label == "category" else filters)
+                for label, filters in FILTER_SETS
+            ]
+            queries = benchmark_queries(records, args.queries + WARM_UP_QUERIES)
+            del records
+
+            result = pool.submit(
+                measure_bundle, str(storage_dir), queries, filter_sets, args.mmap
+            ).result()
+            result["build"] = build
+            run["results"][str(n)] = result
+            print(f"✔ e2e p50={result['e2e']['p50_ms']}ms p99={result['e2e']['p99_ms']}ms, "
+                  f"+{result['memory']['rss_growth_mb']} MB RSS")
+
+            if not args.keep:
+                shutil.rmtree(storage_dir, ignore_errors=True)
+    finally:
+        pool.shutdown()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_summary(run["results"])
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"retrieval_{git['commit'] or 'nogit'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2)
+    print(f"\n📁 Results written to {output}")
+
+    if args.compare:
+        print_comparison(args.compare, run)
+
+
+if __name__ == "__main__":
+    main()
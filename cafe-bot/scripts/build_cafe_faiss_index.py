@@ -3,26 +3,88 @@
 build_cafe_faiss_index.py
 
 Builds a persistent FAISS index from MongoDB menu items.
-Outputs:
-  - storage/cafe_faiss/index.faiss
-  - storage/cafe_faiss/metadata.jsonl
-  - storage/cafe_faiss/config.json
-
-Run manually or in CI/CD when menu changes.
+Outputs (one immutable bundle per build):
+  - storage/cafe_faiss/versions/<UTC timestamp>/index.faiss  (vectors.npy for index_type numpy)
+  - storage/cafe_faiss/versions/<UTC timestamp>/metadata.jsonl
+  - storage/cafe_faiss/versions/<UTC timestamp>/config.json
+  - storage/cafe_faiss/CURRENT  (pointer, flipped atomically once the bundle is complete)
+
+Run manually or in CI/CD when menu changes. Running servers pick up the new
+bundle without a restart (see CafeRAGRetriever.reload).
+
+Builds are incremental: every item's serialized text is hashed (sha256) and
+its vector kept in storage/cafe_faiss/embedding_cache/, and vector_ids are
+stable per item_id. Only new or changed items are embedded;
+if nothing changed, no new bundle is published.
+
+Items are streamed: a batched Mongo cursor feeds serialization, cache misses
+go to a pool of encoder processes (one model copy each), and finished
+batches are appended to the vector file as they arrive. At most
+--in-flight batches of documents / texts / vectors are held at once; the
+index is built from the memory-mapped vector file. Category / group shards
+are routing metadata only (see ShardBuilder).
+
+The vector index type (numpy, flat, sq_fp16, sq_int8, hnsw, ivf_flat,
+ivf_pq; see app/features/cafe_chatbot/retrieval/ann.py) is picked from the
+item count and --memory-budget-mb unless --index-type is given. Every build
+prints recall@10 against exact search and p50/p99 single-query latency;
+--compare does that for every index type.
+
+Usage:
+  python -m scripts.build_cafe_faiss_index [--no-cache] [--workers N]
+      [--batch-size N] [--fixture menu.json]
+      [--index-type auto|TYPE] [--memory-budget-mb MB] [--compare]
+
+--fixture reads the four collections from a JSON file
+({"menuitems": [...], "menucategories": [...], ...}) instead of MongoDB.
 """
 
 import os
 import json
 import sys
+import time
+import shutil
+import hashlib
+import argparse
 import datetime
-from typing import Dict, List
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
 import faiss
 import numpy as np
+from pathlib import Path
 from pymongo import MongoClient
-from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
 
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.features.cafe_chatbot.retrieval.ann import (
+    DEFAULT_SEARCH_PARAMS,
+    INDEX_TYPES,
+    build_index,
+    bytes_per_vector,
+    can_build,
+    choose_index_type,
+    index_file,
+    index_kind,
+    min_train_vectors,
+    search_parameters,
+    write_index,
+)
+from app.features.cafe_chatbot.retrieval.bundle import (
+    VERSIONS_DIR,
+    publish_bundle,
+    resolve_bundle_dir,
+)
+from app.features.cafe_chatbot.retrieval.metadata_store import (
+    COLUMNS_DIR,
+    MenuMetadataStore,
+    MetadataColumnWriter,
+    spill_to_npy,
+)
+
 # -----------------------------
 # Configuration (edit if needed)
 # -----------------------------
@@ -39,7 +101,35 @@ STORAGE_DIR = "storage/cafe_faiss"
 
 EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 VECTOR_DIMENSION = 384
-FAISS_INDEX_TYPE = "IndexFlatIP"
+
+# Index auto-selection budget: vectors (+ graph / ids) of the main index,
+# plus the shard centroids
+DEFAULT_MEMORY_BUDGET_MB = 1024
+
+# Recall / latency report
+EVAL_QUERIES = 200
+EVAL_TOP_K = 10
+
+# sha256(text) -> vector, shared by all bundle versions (one dir per model)
+EMBEDDING_CACHE_DIR = "embedding_cache"
+# Per-bundle content hash of every row (S64, aligned with the metadata
+# columns), diffed by the next build. Older bundles have an item_id -> hash
+# JSON dict instead
+ITEM_HASHES_FILE = "item_hashes.npy"
+LEGACY_ITEM_HASHES_FILE = "item_hashes.json"
+HASH_DTYPE = np.dtype("S64")
+
+# Serving-side settings in config.json that a rebuild must not drop
+RUNTIME_CONFIG_KEYS = ("embedding_backend", "onnx", "query_cache", "query_batching")
+
+# Old bundles kept on disk (for rollback: point CURRENT back at one)
+KEEP_VERSIONS = 3
+
+# Streaming pipeline
+BATCH_SIZE = 512          # documents per cursor batch / encode task
+MAX_IN_FLIGHT = 4         # batches buffered between cursor and index
+# Fewer misses than this are encoded in-process (not worth spawning a pool)
+MIN_POOL_TEXTS = 256
 
 # -----------------------------
 # Helpers
@@ -52,7 +142,329 @@ def fatal(msg: str):
 
 
 def ensure_storage_dir():
-    os.makedirs(STORAGE_DIR, exist_ok=True)
+    os.makedirs(os.path.join(STORAGE_DIR, VERSIONS_DIR), exist_ok=True)
+
+
+def new_bundle_dir() -> Path:
+    """Fresh directory for this build; readers never see it until CURRENT flips."""
+    version_id = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%S%fZ")
+    bundle_dir = Path(STORAGE_DIR) / VERSIONS_DIR / version_id
+    bundle_dir.mkdir(parents=True)
+    return bundle_dir
+
+
+def prune_old_bundles(current: Path):
+    """
+    Keep the newest KEEP_VERSIONS bundles. Workers still serving an older
+    generation keep their mmap'd files alive after the unlink.
+    """
+    versions = sorted(
+        p for p in (Path(STORAGE_DIR) / VERSIONS_DIR).iterdir() if p.is_dir()
+    )
+    for old in versions[:-KEEP_VERSIONS]:
+        if old.resolve() != current.resolve():
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk content-hash -> normalized embedding cache for one model:
+      hashes.txt   one sha256 per line
+      vectors.f32  row-major float32 matrix, opened as a memmap
+    The hashes are held as a sorted S64 array (searched, not hashed into a
+    dict). Each build streams the vectors of the current menu into a fresh
+    copy (see CacheWriter).
+    """
+
+    def __init__(self, model_name: str, dimension: int, enabled: bool = True):
+        self.dir = Path(STORAGE_DIR) / EMBEDDING_CACHE_DIR / model_name.replace("/", "__")
+        self.dimension = dimension
+        self.order = np.zeros(0, dtype=np.int64)
+        self.sorted_hashes = np.zeros(0, dtype=HASH_DTYPE)
+        self.vectors: Optional[np.ndarray] = None
+
+        hashes_path = self.dir / "hashes.txt"
+        vectors_path = self.dir / "vectors.f32"
+        if enabled and hashes_path.exists() and vectors_path.exists():
+            # Fixed 65-byte lines: 64 hex digits + newline
+            raw = np.fromfile(hashes_path, dtype=np.uint8)
+            n = len(raw) // 65
+            if n and len(raw) == n * 65 and vectors_path.stat().st_size == n * dimension * 4:
+                hashes = np.ascontiguousarray(raw.reshape(n, 65)[:, :64]).view(HASH_DTYPE).ravel()
+                self.order = np.argsort(hashes, kind="stable")
+                self.sorted_hashes = hashes[self.order]
+                self.vectors = np.memmap(
+                    vectors_path, dtype=np.float32, mode="r", shape=(n, dimension)
+                )
+
+    def rows_of(self, hashes: List[str]) -> np.ndarray:
+        """Cache row of each hash, -1 for misses."""
+        if not len(self.order) or not hashes:
+            return np.full(len(hashes), -1, dtype=np.int64)
+        wanted = np.array(hashes, dtype=HASH_DTYPE)
+        pos = np.minimum(np.searchsorted(self.sorted_hashes, wanted), len(self.order) - 1)
+        return np.where(self.sorted_hashes[pos] == wanted, self.order[pos], -1)
+
+    def writer(self) -> "CacheWriter":
+        return CacheWriter(self.dir)
+
+
+class CacheWriter:
+    """Appends (hash, vector) rows to a temp copy; commit() swaps it in."""
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = cache_dir
+        self.tmp_dir = cache_dir.with_name(cache_dir.name + ".tmp")
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        self.tmp_dir.mkdir(parents=True)
+        self.hashes = open(self.tmp_dir / "hashes.txt", "w", encoding="ascii")
+        self.vectors = open(self.tmp_dir / "vectors.f32", "wb")
+
+    def add(self, hashes: List[str], vectors: np.ndarray):
+        self.hashes.writelines(h + "\n" for h in hashes)
+        self.vectors.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+
+    def vectors_view(self, n: int, dimension: int) -> np.ndarray:
+        """Read-only memmap of the first n rows written so far."""
+        self.vectors.flush()
+        return np.memmap(
+            self.tmp_dir / "vectors.f32", dtype=np.float32, mode="r", shape=(n, dimension)
+        )
+
+    def commit(self):
+        self.hashes.close()
+        self.vectors.close()
+        old_dir = self.cache_dir.with_name(self.cache_dir.name + ".old")
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if self.cache_dir.exists():
+            os.replace(self.cache_dir, old_dir)
+        os.replace(self.tmp_dir, self.cache_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    def abort(self):
+        self.hashes.close()
+        self.vectors.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+# -----------------------------
+# Parallel encoding
+# -----------------------------
+
+# Model of an encoder worker process (set by _init_encode_worker)
+_worker_model = None
+
+
+def _init_encode_worker(model_name: str, threads: int):
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name)
+
+
+def _encode_in_worker(texts: List[str]) -> np.ndarray:
+    return _worker_model.encode(
+        texts,
+        batch_size=64,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+    ).astype(np.float32)
+
+
+class ParallelEncoder:
+    """
+    Encodes text batches on a process pool (spawned, so every worker loads
+    its own model and torch threads). Small workloads are encoded in the
+    calling process instead; the pool is only started once a batch with
+    at least MIN_POOL_TEXTS misses shows up.
+    """
+
+    def __init__(self, model_name: str, workers: int):
+        self.model_name = model_name
+        self.workers = max(1, workers)
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.model = None
+        self.encoded = 0
+
+    def submit(self, texts: List[str]) -> List[Future]:
+        """Futures whose results, concatenated, are the rows for `texts`."""
+        self.encoded += len(texts)
+
+        if self.pool is None and self.workers > 1 and len(texts) >= MIN_POOL_TEXTS:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            print(f"✔ Starting {self.workers} encoder processes ({threads} threads each)")
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=get_context("spawn"),
+                initializer=_init_encode_worker,
+                initargs=(self.model_name, threads),
+            )
+
+        if self.pool is not None:
+            # Split so every worker gets a share of the batch
+            step = max(1, -(-len(texts) // self.workers))
+            return [
+                self.pool.submit(_encode_in_worker, texts[i:i + step])
+                for i in range(0, len(texts), step)
+            ]
+
+        if self.model is None:
+            # Imported on first miss: a build served from the cache needs no torch
+            from sentence_transformers import SentenceTransformer
+            print(f"✔ Loading embedding model: {self.model_name}")
+            self.model = SentenceTransformer(self.model_name)
+        future: Future = Future()
+        future.set_result(
+            self.model.encode(
+                texts, convert_to_numpy=True, normalize_embeddings=True
+            ).astype(np.float32)
+        )
+        return [future]
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+# -----------------------------
+# Menu source
+# -----------------------------
+
+
+class JsonFixtureCollection:
+    def __init__(self, docs: List[Dict]):
+        self.docs = docs
+
+    def find(self, filter: Optional[Dict] = None, batch_size: int = 0, **kwargs) -> Iterator[Dict]:
+        return iter(self.docs)
+
+    def estimated_document_count(self) -> int:
+        return len(self.docs)
+
+
+class JsonFixtureDatabase:
+    """Local stand-in for the Mongo database (tests / offline builds)."""
+
+    def __init__(self, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            self.collections = json.load(f)
+
+    def __getitem__(self, name: str) -> JsonFixtureCollection:
+        return JsonFixtureCollection(self.collections.get(name, []))
+
+
+def open_database(fixture: Optional[str]):
+    if fixture:
+        print(f"✔ Reading menu from fixture {fixture}")
+        return JsonFixtureDatabase(fixture)
+    try:
+        client = MongoClient(MONGO_URI)
+        return client[DB_NAME]
+    except Exception as e:
+        fatal(f"Failed to connect to MongoDB: {e}")
+
+
+def iter_batches(cursor, size: int) -> Iterator[List[Dict]]:
+    batch: List[Dict] = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# -----------------------------
+# Previous bundle (diff base)
+# -----------------------------
+
+
+def load_previous_bundle() -> Tuple[Optional[Path], Optional[MenuMetadataStore], np.ndarray, Dict]:
+    """
+    (bundle_dir, metadata store, content hash per store row, config) of the
+    bundle currently served, or empties on the first build. The store's
+    columns are memory-mapped; an empty hash ("") never matches, so items
+    of bundles without hashes count as changed.
+    """
+    bundle_dir = resolve_bundle_dir(Path(STORAGE_DIR))
+    if not (bundle_dir / "metadata.jsonl").exists():
+        return None, None, np.zeros(0, dtype=HASH_DTYPE), {}
+
+    store = MenuMetadataStore.load(bundle_dir, mmap=True)
+
+    if (bundle_dir / ITEM_HASHES_FILE).exists():
+        hashes = np.load(bundle_dir / ITEM_HASHES_FILE, mmap_mode="r")
+    else:
+        hashes = np.zeros(len(store), dtype=HASH_DTYPE)
+        if (bundle_dir / LEGACY_ITEM_HASHES_FILE).exists():
+            with open(bundle_dir / LEGACY_ITEM_HASHES_FILE, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+            rows = store.rows_of_item_ids(list(legacy))
+            found = rows >= 0
+            hashes[rows[found]] = np.array(list(legacy.values()), dtype=HASH_DTYPE)[found]
+
+    config = {}
+    if (bundle_dir / "config.json").exists():
+        with open(bundle_dir / "config.json", "r", encoding="utf-8") as f:
+            config = json.load(f)
+
+    return bundle_dir, store, hashes, config
+
+
+def file_digest(path: Path) -> Optional[str]:
+    if not path.exists():
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MenuDiff:
+    """Added / removed / changed counts, plus the first few items of each for the report."""
+
+    MARKS = {"added": "+", "removed": "-", "changed": "~"}
+
+    def __init__(self, limit: int = 10):
+        self.limit = limit
+        self.counts = {kind: 0 for kind in self.MARKS}
+        self.samples: Dict[str, List[Tuple[str, str]]] = {kind: [] for kind in self.MARKS}
+
+    def add(self, kind: str, item_id: str, name: str):
+        self.counts[kind] += 1
+        if len(self.samples[kind]) < self.limit:
+            self.samples[kind].append((item_id, name))
+
+    def any(self) -> bool:
+        return any(self.counts.values())
+
+    def report(self, unchanged: int):
+        print("\n📋 Menu diff vs. current bundle")
+        print(f"   + added:     {self.counts['added']}")
+        print(f"   - removed:   {self.counts['removed']}")
+        print(f"   ~ changed:   {self.counts['changed']}")
+        print(f"   = unchanged: {unchanged}")
+        for kind, mark in self.MARKS.items():
+            for item_id, name in self.samples[kind]:
+                print(f"     {mark} {name} ({item_id})")
+            if self.counts[kind] > self.limit:
+                print(f"     {mark} ... {self.counts[kind] - self.limit} more")
+
+
+def find_duplicate(item_ids: np.ndarray) -> Optional[str]:
+    """Some item_id that occurs more than once, if any (one sort, no set of strings)."""
+    if len(item_ids) < 2:
+        return None
+    ordered = np.sort(item_ids)
+    dup = np.flatnonzero(ordered[1:] == ordered[:-1])
+    return str(ordered[dup[0]]) if len(dup) else None
 
 
 def load_lookup_maps(db):
@@ -110,117 +522,414 @@ def serialize_menu_item(
     return text
 
 
+def evaluate_index(index, kind: str, vectors: np.ndarray, ids: np.ndarray) -> Dict:
+    """
+    recall@k of `index` against exact search, and single-query latency.
+    Queries are stored item vectors plus noise (as real queries land near,
+    not on, an item).
+    """
+    n, d = vectors.shape
+    rng = np.random.default_rng(0)
+    rows = np.sort(rng.choice(n, min(n, EVAL_QUERIES), replace=False))
+    queries = np.asarray(vectors[rows], dtype=np.float32)
+    queries = queries + rng.standard_normal(queries.shape).astype(np.float32) * np.float32(0.5 / np.sqrt(d))
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    k = min(EVAL_TOP_K, n)
+    _, exact_rows = faiss.knn(queries, np.ascontiguousarray(vectors), k, metric=faiss.METRIC_INNER_PRODUCT)
+    exact_ids = ids[exact_rows]
+
+    params = search_parameters(kind, DEFAULT_SEARCH_PARAMS.get(kind, {}))
+    latencies = []
+    hits = 0
+    for q, truth in zip(queries, exact_ids):
+        start = time.perf_counter()
+        _, found = index.search(q[None, :], k, params=params)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(set(found[0].tolist()) & set(truth.tolist()))
+
+    return {
+        "index_type": kind,
+        f"recall@{k}": round(hits / (len(queries) * k), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "est_memory_mb": round(n * bytes_per_vector(kind, d) / 2**20, 1),
+    }
+
+
+def print_index_report(reports: List[Dict]):
+    recall_key = next((k for r in reports for k in r if k.startswith("recall@")), "recall")
+    print(f"   {'index_type':<10}{recall_key:>11}{'p50 ms':>9}{'p99 ms':>9}{'mem MB':>9}")
+    for r in reports:
+        if "skipped" in r:
+            print(f"   {r['index_type']:<10}   skipped: {r['skipped']}")
+            continue
+        print(
+            f"   {r['index_type']:<10}{r[recall_key]:>11.4f}"
+            f"{r['p50_ms']:>9.3f}{r['p99_ms']:>9.3f}{r['est_memory_mb']:>9.1f}"
+        )
+
+
+class ShardBuilder:
+    """
+    Per-categoryId and per-groupId shards for query routing: shards.json
+    (label and size of each) and one centroid embedding per shard (of the
+    category / group name).
+
+    Shards hold no vectors: the server searches the main index with the
+    shard's rows (from the metadata columns) as the ID selector, so they
+    add one centroid each to the bundle, not a copy of the catalog.
+    """
+
+    LEVELS = (("category", "categoryId"), ("group", "groupId"))
+
+    def __init__(self, categories: Dict, groups: Dict):
+        self.names = {"category": categories, "group": groups}
+        self.categories = categories
+        # (level, shard_id) -> [label, num_items]; insertion order = shard order
+        self.shards: Dict[Tuple[str, str], List] = {}
+
+    def add(self, records: List[Dict]):
+        for level, key in self.LEVELS:
+            for record in records:
+                shard_id = record.get(key) or ""
+                shard = self.shards.get((level, shard_id))
+                if shard is not None:
+                    shard[1] += 1
+                    continue
+                label = self.names[level].get(shard_id) or shard_id
+                if level == "group":
+                    # "Robusta Cold Non-Milk" routes better with its category name
+                    category_name = self.categories.get(record.get("categoryId"), "")
+                    label = f"{category_name} {label}".strip()
+                self.shards[(level, shard_id)] = [label, 1]
+
+    def nbytes(self) -> int:
+        """Serving memory of the shards: their centroids."""
+        return len(self.shards) * VECTOR_DIMENSION * 4
+
+    def write(self, bundle_dir: Path, encode_labels: Callable[[List[str]], np.ndarray]) -> List[Dict]:
+        # Category shards first, then groups (shards.json order = centroid rows)
+        ordered = sorted(self.shards.items(), key=lambda kv: kv[0][0] != "category")
+        shards = [
+            {
+                "key": f"{level}__{shard_id}",
+                "level": level,
+                "id": shard_id,
+                "label": label,
+                "num_items": num_items,
+            }
+            for (level, shard_id), (label, num_items) in ordered
+        ]
+
+        centroids = encode_labels([s["label"] for s in shards])
+
+        np.save(bundle_dir / "centroids.npy", centroids)
+        with open(bundle_dir / "shards.json", "w", encoding="utf-8") as f:
+            json.dump(shards, f, indent=2, ensure_ascii=False)
+
+        return shards
+
+
 # -----------------------------
 # Main build routine
 # -----------------------------
 
 
 def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--no-cache", action="store_true", help="re-embed every item, ignoring the embedding cache")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="encoder processes")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="documents per cursor batch")
+    parser.add_argument("--in-flight", type=int, default=MAX_IN_FLIGHT, help="batches buffered at once")
+    parser.add_argument("--fixture", help="read collections from a JSON file instead of MongoDB")
+    parser.add_argument("--index-type", default="auto", choices=("auto",) + INDEX_TYPES)
+    parser.add_argument("--memory-budget-mb", type=int, default=DEFAULT_MEMORY_BUDGET_MB,
+                        help="budget used by --index-type auto")
+    parser.add_argument("--compare", action="store_true", help="build and report every index type")
+    args = parser.parse_args()
+
     print("🔧 Building Cafe FAISS Index...\n")
 
     ensure_storage_dir()
 
     # ---- MongoDB connection
-    try:
-        client = MongoClient(MONGO_URI)
-        db = client[DB_NAME]
-    except Exception as e:
-        fatal(f"Failed to connect to MongoDB: {e}")
+    db = open_database(args.fixture)
 
     # ---- Load lookup tables
     categories, subcategories, groups = load_lookup_maps(db)
 
-    # ---- Fetch menu items
-    menu_items = list(db[MENUITEMS_COLLECTION].find({}))
-    if not menu_items:
-        fatal("No menu items found in MongoDB.")
-
-    print(f"✔ Loaded {len(menu_items)} menu items")
-
-    # ---- Load embedding model
-    print(f"✔ Loading embedding model: {EMBEDDING_MODEL_NAME}")
-    model = SentenceTransformer(EMBEDDING_MODEL_NAME)
-
-    texts: List[str] = []
-    metadata: List[Dict] = []
+    # ---- Previous bundle: stable ids + content hashes to diff against
+    previous_dir, previous_store, previous_hashes, previous = load_previous_bundle()
+    if previous.get("embedding_model") not in (None, EMBEDDING_MODEL_NAME):
+        # Vectors from another model are not comparable: start a new id space
+        previous_store = None
+    num_previous = len(previous_store) if previous_store is not None else 0
+    if previous_dir is not None:
+        print(f"✔ Diffing against {previous_dir} ({num_previous} items)")
+
+    next_vector_id = max(
+        previous.get("next_vector_id", 0),
+        int(previous_store.vector_ids.max()) + 1 if num_previous else 0,
+    )
 
-    # ---- Serialize items
-    for idx, item in enumerate(menu_items):
-        text = serialize_menu_item(
-            item=item,
-            categories=categories,
-            subcategories=subcategories,
-            groups=groups,
-        )
-        texts.append(text)
+    cache = EmbeddingCache(EMBEDDING_MODEL_NAME, VECTOR_DIMENSION, enabled=not args.no_cache)
+    cache_writer = cache.writer()
+    encoder = ParallelEncoder(EMBEDDING_MODEL_NAME, args.workers)
+
+    shard_builder = ShardBuilder(categories, groups)
+
+    # ---- Stream into a new, not yet visible, bundle directory
+    bundle_dir = new_bundle_dir()
+    metadata_path = bundle_dir / "metadata.jsonl"
+    config_path = bundle_dir / "config.json"
+    hashes_spill = bundle_dir / (ITEM_HASHES_FILE + ".spill")
+
+    # Per-item state is columnar: metadata columns and content hashes are
+    # appended to disk batch by batch, previous rows are ticked off in a
+    # bool array, and the diff keeps counts plus a few names to print
+    columns = MetadataColumnWriter(bundle_dir / COLUMNS_DIR)
+    seen_previous = np.zeros(num_previous, dtype=bool)
+    diff = MenuDiff()
+    cache_hits = 0
+
+    def finish(batch):
+        """Wait for the batch's vectors, then add + write it."""
+        records, hashes, vectors, miss_rows, futures = batch
+        if futures:
+            encoded = np.concatenate([f.result() for f in futures])
+            if encoded.shape[1] != VECTOR_DIMENSION:
+                fatal(
+                    f"Embedding dimension mismatch: "
+                    f"expected {VECTOR_DIMENSION}, got {encoded.shape[1]}"
+                )
+            vectors[miss_rows] = encoded
+
+        # Vectors land in the cache file; the index is built from it afterwards
+        shard_builder.add(records)
+        cache_writer.add(hashes, vectors)
+        progress.update(len(records))
 
-        metadata.append(
-            {
-                "vector_id": idx,
-                "item_id": str(item["_id"]),
-                "name": item.get("name"),
-                "price": item.get("prices", [{}])[0].get("price"),
-                "inStock": item.get("inStock", False),
-                "categoryId": item.get("categoryId"),
-                "subCategoryId": item.get("subCategoryId"),
-                "groupId": item.get("groupId"),
-            }
+    try:
+        menu_items = db[MENUITEMS_COLLECTION]
+        progress = tqdm(total=menu_items.estimated_document_count(), unit="item", desc="Indexing")
+        pending: deque = deque()
+
+        with open(metadata_path, "w", encoding="utf-8") as metadata_file, \
+                open(hashes_spill, "wb") as hashes_file:
+            for docs in iter_batches(menu_items.find({}, batch_size=args.batch_size), args.batch_size):
+                records: List[Dict] = []
+                texts: List[str] = []
+                hashes: List[str] = []
+
+                item_ids = [str(item["_id"]) for item in docs]
+                previous_rows = (
+                    previous_store.rows_of_item_ids(item_ids) if num_previous
+                    else np.full(len(docs), -1, dtype=np.int64)
+                )
+
+                # ---- Serialize items
+                for item, item_id, previous_row in zip(docs, item_ids, previous_rows.tolist()):
+                    text = serialize_menu_item(
+                        item=item,
+                        categories=categories,
+                        subcategories=subcategories,
+                        groups=groups,
+                    )
+
+                    h = content_hash(text)
+
+                    # Keep the vector_id an item already has; new items get fresh ids
+                    if previous_row < 0:
+                        vector_id = next_vector_id
+                        next_vector_id += 1
+                        diff.add("added", item_id, item.get("name") or "")
+                    else:
+                        vector_id = int(previous_store.vector_ids[previous_row])
+                        seen_previous[previous_row] = True
+                        if previous_hashes[previous_row] != h.encode("ascii"):
+                            diff.add("changed", item_id, item.get("name") or "")
+
+                    record = {
+                        "vector_id": vector_id,
+                        "item_id": item_id,
+                        "name": item.get("name"),
+                        "price": item.get("prices", [{}])[0].get("price"),
+                        "inStock": item.get("inStock", False),
+                        "categoryId": item.get("categoryId"),
+                        "subCategoryId": item.get("subCategoryId"),
+                        "groupId": item.get("groupId"),
+                        # Human-readable labels for the lexical (BM25) index
+                        "categoryName": categories.get(item.get("categoryId"), ""),
+                        "subCategoryName": subcategories.get(item.get("subCategoryId"), ""),
+                        "groupName": groups.get(item.get("groupId"), ""),
+                    }
+                    records.append(record)
+                    texts.append(text)
+                    hashes.append(h)
+                    metadata_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+                columns.add(records)
+                hashes_file.write(np.array(hashes, dtype=HASH_DTYPE).tobytes())
+
+                # ---- Cached vectors now, misses to the encoder pool
+                vectors = np.empty((len(records), VECTOR_DIMENSION), dtype=np.float32)
+                cache_rows = cache.rows_of(hashes)
+                hit_rows = np.flatnonzero(cache_rows >= 0)
+                if len(hit_rows):
+                    vectors[hit_rows] = cache.vectors[cache_rows[hit_rows]]
+                miss_rows = np.flatnonzero(cache_rows < 0).tolist()
+                cache_hits += len(hit_rows)
+
+                futures = encoder.submit([texts[r] for r in miss_rows]) if miss_rows else []
+                pending.append((records, hashes, vectors, miss_rows, futures))
+
+                # Bounded buffering keeps memory flat as the catalog grows
+                while len(pending) >= args.in_flight:
+                    finish(pending.popleft())
+
+            while pending:
+                finish(pending.popleft())
+        progress.close()
+
+        num_items = columns.close()
+        if not num_items:
+            fatal("No menu items found in MongoDB.")
+        spill_to_npy(hashes_spill, bundle_dir / ITEM_HASHES_FILE, HASH_DTYPE, num_items)
+
+        store = MenuMetadataStore.from_columns(bundle_dir / COLUMNS_DIR, mmap=True)
+        duplicate = find_duplicate(store.item_ids)
+        if duplicate is not None:
+            fatal(f"Duplicate menu item _id: {duplicate}")
+        embedded = encoder.encoded
+        print(f"✔ Embedded {num_items} menu items ({embedded} embedded, {cache_hits} from cache)")
+
+        if args.index_type == "auto":
+            # The shard centroids share the budget with the main index
+            budget = args.memory_budget_mb * 2**20 - shard_builder.nbytes()
+            kind = choose_index_type(num_items, VECTOR_DIMENSION, budget)
+        else:
+            kind = args.index_type
+            if not can_build(kind, num_items):
+                fatal(
+                    f"--index-type {kind} needs at least {min_train_vectors(kind, num_items)} "
+                    f"items to train, the menu has {num_items}"
+                )
+
+        # ---- Diff
+        for row in np.flatnonzero(~seen_previous).tolist():
+            diff.add("removed", str(previous_store.item_ids[row]), str(previous_store.names[row]))
+        unchanged = num_items - diff.counts["added"] - diff.counts["changed"]
+        diff.report(unchanged)
+
+        unchanged_metadata = file_digest(metadata_path) == (
+            file_digest(previous_dir / "metadata.jsonl") if previous_dir else None
         )
-
-    # ---- Generate embeddings
-    print("✔ Generating embeddings")
-    embeddings = model.encode(
-        texts,
-        convert_to_numpy=True,
-        show_progress_bar=True,
-        normalize_embeddings=True,
-    )
-
-    if embeddings.shape[1] != VECTOR_DIMENSION:
-        fatal(
-            f"Embedding dimension mismatch: "
-            f"expected {VECTOR_DIMENSION}, got {embeddings.shape[1]}"
+        same_index_type = previous_dir is not None and index_kind(previous) == kind
+        if (
+            not diff.any() and unchanged_metadata and same_index_type
+            and not (args.no_cache or args.compare)
+        ):
+            shutil.rmtree(bundle_dir)
+            cache_writer.abort()
+            print("\n✅ Menu unchanged, current bundle is up to date (nothing published)")
+            return
+
+        # ---- Build the vector index from the streamed vectors
+        vectors = cache_writer.vectors_view(num_items, VECTOR_DIMENSION)
+        ids = store.vector_ids
+
+        if args.compare:
+            print("✔ Comparing index types")
+            print_index_report([
+                evaluate_index(build_index(t, vectors, ids), t, vectors, ids)
+                if can_build(t, num_items)
+                else {"index_type": t, "skipped": f"needs >= {min_train_vectors(t, num_items)} items to train"}
+                for t in INDEX_TYPES
+            ])
+
+        print(f"✔ Building {kind} index ({num_items} items)")
+        index = build_index(kind, vectors, ids)
+        if index.ntotal != num_items:
+            fatal("FAISS index count mismatch")
+
+        report = evaluate_index(index, kind, vectors, ids)
+        print_index_report([report])
+
+        # ---- Persist artifacts
+        print(f"✔ Writing {index_file(kind)} to {bundle_dir}")
+        write_index(index, bundle_dir)
+        del index
+
+        print("✔ Writing category/group shards")
+
+        def encode_labels(labels: List[str]) -> np.ndarray:
+            label_hashes = [content_hash(label) for label in labels]
+            out = np.empty((len(labels), VECTOR_DIMENSION), dtype=np.float32)
+            cache_rows = cache.rows_of(label_hashes)
+            hit = np.flatnonzero(cache_rows >= 0)
+            if len(hit):
+                out[hit] = cache.vectors[cache_rows[hit]]
+            miss = np.flatnonzero(cache_rows < 0).tolist()
+            if miss:
+                out[miss] = np.concatenate(
+                    [f.result() for f in encoder.submit([labels[i] for i in miss])]
+                )
+            # Shard labels stay cached for the next build
+            cache_writer.add(label_hashes, out)
+            return out
+
+        shards = shard_builder.write(bundle_dir, encode_labels)
+        print(f"   {len(shards)} shards")
+
+        print("✔ Writing config.json")
+        config = {
+            "embedding_model": EMBEDDING_MODEL_NAME,
+            "dimension": VECTOR_DIMENSION,
+            "index_type": kind,
+            "menu_version": datetime.date.today().isoformat(),
+            "created_at": datetime.datetime.utcnow().isoformat() + "Z",
+            "num_items": num_items,
+            # Ids of deleted items are never handed out again
+            "next_vector_id": next_vector_id,
+            "build": {
+                **diff.counts,
+                "embedded": embedded,
+                "cache_hits": cache_hits,
+            },
+            "index_report": report,
+        }
+        config.update({k: previous[k] for k in RUNTIME_CONFIG_KEYS if k in previous})
+        # Hand-tuned efSearch / nprobe survive rebuilds of the same index type
+        config["search_params"] = (
+            previous.get("search_params", {}) if same_index_type
+            else dict(DEFAULT_SEARCH_PARAMS.get(kind, {}))
         )
 
-    # ---- Build FAISS index
-    print("✔ Building FAISS index")
-    index = faiss.IndexFlatIP(VECTOR_DIMENSION)
-    index.add(embeddings)
-
-    if index.ntotal != len(metadata):
-        fatal("FAISS index count mismatch")
-
-    # ---- Persist artifacts
-    index_path = os.path.join(STORAGE_DIR, "index.faiss")
-    metadata_path = os.path.join(STORAGE_DIR, "metadata.jsonl")
-    config_path = os.path.join(STORAGE_DIR, "config.json")
-
-    print("✔ Writing FAISS index to disk")
-    faiss.write_index(index, index_path)
-
-    print("✔ Writing metadata.jsonl")
-    with open(metadata_path, "w", encoding="utf-8") as f:
-        for record in metadata:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
-
-    print("✔ Writing config.json")
-    config = {
-        "embedding_model": EMBEDDING_MODEL_NAME,
-        "dimension": VECTOR_DIMENSION,
-        "index_type": FAISS_INDEX_TYPE,
-        "menu_version": datetime.date.today().isoformat(),
-        "created_at": datetime.datetime.utcnow().isoformat() + "Z",
-        "num_items": len(metadata),
-    }
-
-    with open(config_path, "w", encoding="utf-8") as f:
-        json.dump(config, f, indent=2)
+        with open(config_path, "w", encoding="utf-8") as f:
+            json.dump(config, f, indent=2)
+    except BaseException:
+        # Never leave a half-written bundle behind
+        columns.abort()
+        shutil.rmtree(bundle_dir, ignore_errors=True)
+        cache_writer.abort()
+        raise
+    finally:
+        encoder.close()
+
+    # ---- Publish: one rename makes the whole bundle visible to servers
+    print("✔ Publishing bundle (CURRENT)")
+    publish_bundle(Path(STORAGE_DIR), bundle_dir)
+    prune_old_bundles(bundle_dir)
+    cache_writer.commit()
 
     print("\n✅ Cafe FAISS index build complete")
-    print(f"📁 Output directory: {STORAGE_DIR}")
-    print(f"   - index.faiss")
-    print(f"   - metadata.jsonl")
+    print(f"📁 Output directory: {bundle_dir}")
+    print(f"   - {index_file(kind)}")
+    print(f"   - metadata.jsonl, {ITEM_HASHES_FILE}")
     print(f"   - config.json")
+    print(f"   - shards.json, centroids.npy")
+    print(f"   - {COLUMNS_DIR}/")
 
 
 # -----------------------------
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+export_onnx_embedder.py
+
+Exports the query embedding model to ONNX (fp32 + int8 dynamic quantized),
+checks it against the sentence-transformers model and the existing FAISS
+index, and prints a latency comparison.
+
+Outputs:
+  - storage/cafe_faiss/onnx/<export id>/model.onnx
+  - storage/cafe_faiss/onnx/<export id>/model_int8.onnx
+  - storage/cafe_faiss/onnx/<export id>/tokenizer.json
+
+--activate publishes a new bundle version: the served one with config.json
+switched to the ONNX backend, then flips CURRENT to it. Published bundles
+(and exports they point at) are never rewritten, so running servers
+hot-reload onto the new version and a rollback still finds the old config.
+
+Export needs torch + transformers (run it on a build machine, not in the
+serving pod). Serving with "embedding_backend": "onnx" only needs
+onnxruntime + tokenizers.
+
+Usage:
+  python -m scripts.export_onnx_embedder [--activate] [--fp32]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import datetime
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.features.cafe_chatbot.retrieval.backends import (
+    OnnxEmbeddingBackend,
+    SentenceTransformerBackend,
+)
+from app.features.cafe_chatbot.retrieval.ann import load_index
+from app.features.cafe_chatbot.retrieval.bundle import (
+    CURRENT_POINTER,
+    VERSIONS_DIR,
+    publish_bundle,
+    resolve_bundle_dir,
+)
+
+# -----------------------------
+# Configuration (edit if needed)
+# -----------------------------
+
+STORAGE_DIR = "storage/cafe_faiss"
+ONNX_SUBDIR = "onnx"
+OPSET = 14
+
+PARITY_QUERIES = [
+    "vegan drinks",
+    "something cold under 200",
+    "Cranberry Tonic",
+    "Robusta Iced Espresso",
+    "I'm tired, need caffeine",
+    "refreshing non milk drink",
+    "hot coffee with milk",
+    "snacks",
+    "cheap food under 150",
+    "shakes",
+    "tea",
+    "best cold brew",
+]
+
+TOP_K = 10
+LATENCY_RUNS = 200
+
+# -----------------------------
+# Helpers
+# -----------------------------
+
+
+def fatal(msg: str):
+    print(f"\n[FATAL] {msg}\n", file=sys.stderr)
+    sys.exit(1)
+
+
+def bundle_path(name: str) -> str:
+    """File inside the bundle currently served (CURRENT pointer or flat dir)."""
+    return str(resolve_bundle_dir(Path(STORAGE_DIR)) / name)
+
+
+def load_config() -> Dict:
+    with open(bundle_path("config.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def version_id() -> str:
+    return datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%S%fZ")
+
+
+def link_or_copy(src: str, dst: str):
+    """Bundle files are immutable: share them by hard link, copy across filesystems."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def publish_with_config(config: Dict) -> Path:
+    """New bundle version = the served one with this config.json; CURRENT flips to it."""
+    storage_dir = Path(STORAGE_DIR)
+    if not (storage_dir / CURRENT_POINTER).exists():
+        fatal("--activate needs a versioned bundle; rebuild with build_cafe_faiss_index.py first")
+    source = resolve_bundle_dir(storage_dir)
+
+    bundle_dir = storage_dir / VERSIONS_DIR / version_id()
+    shutil.copytree(source, bundle_dir, copy_function=link_or_copy)
+    # Unlink first: writing through the hard link would edit the old bundle
+    config_path = bundle_dir / "config.json"
+    config_path.unlink()
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+
+    publish_bundle(storage_dir, bundle_dir)
+    return bundle_dir
+
+
+def export_onnx(model_name: str, out_dir: str) -> str:
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name)
+    model.eval()
+
+    # tokenizer.json is all the serving side needs
+    tokenizer.save_pretrained(out_dir)
+
+    sample = tokenizer(["warm up"], return_tensors="pt")
+    fp32_path = os.path.join(out_dir, "model.onnx")
+
+    dynamic = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": dynamic,
+                "attention_mask": dynamic,
+                "token_type_ids": dynamic,
+                "last_hidden_state": dynamic,
+            },
+            opset_version=OPSET,
+        )
+    return fp32_path
+
+
+def quantize_int8(fp32_path: str, out_dir: str) -> str:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    int8_path = os.path.join(out_dir, "model_int8.onnx")
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    return int8_path
+
+
+def parity_report(reference, candidate, index, label: str) -> Dict:
+    """
+    Compare query vectors and top-k neighbours against the existing index.
+    """
+    ref = reference.encode(PARITY_QUERIES)
+    cand = candidate.encode(PARITY_QUERIES)
+
+    cosines = (ref * cand).sum(axis=1)
+
+    k = min(TOP_K, index.ntotal)
+    _, ref_ids = index.search(np.ascontiguousarray(ref, dtype=np.float32), k)
+    _, cand_ids = index.search(np.ascontiguousarray(cand, dtype=np.float32), k)
+    overlaps = [
+        len(set(a.tolist()) & set(b.tolist())) / k
+        for a, b in zip(ref_ids, cand_ids)
+    ]
+    top1 = float(np.mean(ref_ids[:, 0] == cand_ids[:, 0]))
+
+    report = {
+        "backend": label,
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        f"mean_overlap@{k}": float(np.mean(overlaps)),
+        "top1_agreement": top1,
+    }
+    print(f"   {label:<8} cos(min/mean)={report['min_cosine']:.4f}/{report['mean_cosine']:.4f}"
+          f"  overlap@{k}={report[f'mean_overlap@{k}']:.3f}  top1={top1:.3f}")
+    return report
+
+
+def latency_report(backend, label: str) -> Dict:
+    """Single-query encode latency (the serving pattern)."""
+    backend.encode(PARITY_QUERIES[:1])  # warm-up
+
+    timings: List[float] = []
+    for i in range(LATENCY_RUNS):
+        query = PARITY_QUERIES[i % len(PARITY_QUERIES)]
+        start = time.perf_counter()
+        backend.encode([query])
+        timings.append((time.perf_counter() - start) * 1000)
+
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    print(f"   {label:<8} p50={p50:.2f}ms  p95={p95:.2f}ms  p99={p99:.2f}ms")
+    return {"backend": label, "p50_ms": p50, "p95_ms": p95, "p99_ms": p99}
+
+
+# -----------------------------
+# Main routine
+# -----------------------------
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--activate", action="store_true", help="publish a bundle version that uses the ONNX backend")
+    parser.add_argument("--fp32", action="store_true", help="activate the fp32 model instead of int8")
+    parser.add_argument("--min-cosine", type=float, default=0.97)
+    parser.add_argument("--min-overlap", type=float, default=0.8)
+    args = parser.parse_args()
+
+    config = load_config()
+    model_name = config["embedding_model"]
+    # One directory per export: a re-export never rewrites a served model
+    model_dir = os.path.join(ONNX_SUBDIR, version_id())
+    out_dir = os.path.join(STORAGE_DIR, model_dir)
+    os.makedirs(out_dir, exist_ok=True)
+
+    print(f"🔧 Exporting {model_name} to ONNX...\n")
+    fp32_path = export_onnx(model_name, out_dir)
+    print(f"✔ Wrote {fp32_path}")
+    int8_path = quantize_int8(fp32_path, out_dir)
+    print(f"✔ Wrote {int8_path}")
+
+    index = load_index(resolve_bundle_dir(Path(STORAGE_DIR)), config)
+    if index.d != config["dimension"]:
+        fatal("Index dimension does not match config.json")
+
+    reference = SentenceTransformerBackend(model_name)
+    backends = {
+        "fp32": OnnxEmbeddingBackend(out_dir, model_file="model.onnx"),
+        "int8": OnnxEmbeddingBackend(out_dir, model_file="model_int8.onnx"),
+    }
+
+    print("\n✔ Parity vs sentence-transformers (against the served index)")
+    parity = {label: parity_report(reference, b, index, label) for label, b in backends.items()}
+
+    print("\n✔ Single-query latency")
+    latency = [latency_report(reference, "torch")]
+    latency += [latency_report(b, label) for label, b in backends.items()]
+
+    chosen = "fp32" if args.fp32 else "int8"
+    overlap_key = f"mean_overlap@{min(TOP_K, index.ntotal)}"
+    if parity[chosen]["min_cosine"] < args.min_cosine or parity[chosen][overlap_key] < args.min_overlap:
+        fatal(f"{chosen} ONNX model failed parity check: {parity[chosen]}")
+
+    if args.activate:
+        config["embedding_backend"] = "onnx"
+        config["onnx"] = {
+            "model_dir": model_dir,
+            "model_file": os.path.basename(fp32_path if args.fp32 else int8_path),
+        }
+        bundle_dir = publish_with_config(config)
+        print(f"\n✔ Published {bundle_dir} with the {chosen} ONNX backend")
+
+    print("\n✅ ONNX export complete")
+
+
+# -----------------------------
+# Entrypoint
+# -----------------------------
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+load_test_chat.py
+
+Concurrent /chat/stream load test against a local fake Gemini server.
+
+Three processes:
+  - a fake Gemini endpoint (generateContent + streamGenerateContent SSE)
+    that answers the extractor after --extract-delay-ms and streams
+    --chunks response chunks, one every --chunk-delay-ms
+  - the app (app.main) in ONE uvicorn worker, on a synthetic menu bundle
+    (hash embedder, no model download) with GEMINI_BASE_URL pointing at
+    the fake server
+  - this process: --streams concurrent clients, all started at once, each
+    reading its stream to the end
+
+Every message leaves the rule fast path (so the extractor is called) and
+is unique (no cache hits), i.e. the worst case for the pipeline.
+
+Reported per pipeline (CAFE_CHAT_PIPELINE=async / threadpool):
+wall time, completed / failed streams, time to first byte (the flush
+token), time to the first Gemini chunk, total stream time (p50 / p99),
+peak concurrent streams seen by the fake server, peak server threads
+and RSS, and the CPU seconds each process spent.
+
+Usage:
+  python -m scripts.load_test_chat [--streams 2000] [--pipeline async|threadpool|both]
+      [--chunks 20] [--chunk-delay-ms 50] [--extract-delay-ms 200]
+      [--menu-size 1000] [--output results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import asyncio
+import argparse
+import tempfile
+from multiprocessing import get_context
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+from pathlib import Path
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from scripts.benchmark_retrieval import (
+    fatal,
+    load_seed_menu,
+    synthetic_menu,
+    write_synthetic_bundle,
+)
+
+
+# -----------------------------
+# Configuration
+# -----------------------------
+
+DEFAULT_STREAMS = 2000
+DEFAULT_CHUNKS = 20
+DEFAULT_CHUNK_DELAY_MS = 50
+DEFAULT_EXTRACT_DELAY_MS = 200
+DEFAULT_MENU_SIZE = 1000
+READY_TIMEOUT_S = 120
+SAMPLE_INTERVAL_S = 0.2
+BACKLOG = 8192
+
+# What the fake extractor "understood": a budget, so retrieval filters
+FAKE_CONSTRAINTS = {
+    "max_price": 300, "min_price": None, "diet": [],
+    "temperature": [], "milk": None, "category_hint": None,
+}
+
+# Not explainable by the rule parser -> every request calls the extractor
+MESSAGES = (
+    "something refreshing for a sunny afternoon",
+    "what goes well with a good book",
+    "surprise me with a dessert",
+    "a treat for my friend",
+)
+
+FLUSH_TOKEN = "…".encode("utf-8")
+FIRST_GEMINI_CHUNK = b"chunk 0 "
+ERROR_MARKERS = (b"[Connection Error", b"[Error")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentiles(samples_s: List[float]) -> Dict[str, Optional[float]]:
+    if not samples_s:
+        return {"p50_ms": None, "p99_ms": None, "max_ms": None}
+    values = np.asarray(samples_s, dtype=np.float64) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 1),
+        "p99_ms": round(float(np.percentile(values, 99)), 1),
+        "max_ms": round(float(values.max()), 1),
+    }
+
+
+def proc_status(pid: int) -> Dict:
+    """Threads, VmRSS (kB) and CPU seconds of a process, from /proc (Linux only)."""
+    status = {"threads": 0, "rss_kb": 0, "cpu_s": 0.0}
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("Threads:"):
+                    status["threads"] = int(line.split()[1])
+                elif line.startswith("VmRSS:"):
+                    status["rss_kb"] = int(line.split()[1])
+        with open(f"/proc/{pid}/stat", "r") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        # utime + stime, in clock ticks
+        status["cpu_s"] = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except OSError:
+        pass
+    return status
+
+
+# -----------------------------
+# Fake Gemini server (own process)
+# -----------------------------
+
+def serve_fake_gemini(port: int, chunks: int, chunk_delay_ms: int, extract_delay_ms: int):
+    import uvicorn
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse, StreamingResponse
+    from starlette.routing import Route
+
+    state = {"active": 0, "peak": 0, "streams": 0, "extracts": 0}
+
+    def candidate(text: str, finish: bool = False) -> Dict:
+        item = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+        if finish:
+            item["finishReason"] = "STOP"
+        return {"candidates": [item]}
+
+    async def models(request):
+        action = request.path_params["target"].rsplit(":", 1)[-1]
+        body = await request.body()
+
+        if action == "generateContent":
+            state["extracts"] += 1
+            await asyncio.sleep(extract_delay_ms / 1000)
+            return JSONResponse(candidate(json.dumps(FAKE_CONSTRAINTS), finish=True))
+
+        if action == "streamGenerateContent":
+            async def sse():
+                state["active"] += 1
+                state["streams"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+                try:
+                    for i in range(chunks):
+                        await asyncio.sleep(chunk_delay_ms / 1000)
+                        payload = candidate(f"chunk {i} ", finish=i == chunks - 1)
+                        if i == chunks - 1:
+                            # Rough counts, so the app records Gemini-reported usage
+                            payload["usageMetadata"] = {
+                                "promptTokenCount": len(body) // 4,
+                                "candidatesTokenCount": 2 * chunks,
+                            }
+                        yield f"data: {json.dumps(payload)}\r\n\r\n"
+                finally:
+                    state["active"] -= 1
+
+            return StreamingResponse(sse(), media_type="text/event-stream")
+
+        return JSONResponse({"error": {"code": 404, "message": action}}, status_code=404)
+
+    async def stats(request):
+        return JSONResponse(state)
+
+    async def reset(request):
+        state.update(active=0, peak=0, streams=0, extracts=0)
+        return JSONResponse(state)
+
+    app = Starlette(routes=[
+        Route("/{version}/models/{target:path}", models, methods=["POST"]),
+        Route("/stats", stats),
+        Route("/reset", reset, methods=["POST"]),
+    ])
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", backlog=BACKLOG)
+
+
+# -----------------------------
+# App server (own process, one worker)
+# -----------------------------
+
+def serve_app(port: int, storage_dir: str, pipeline: str, gemini_url: str):
+    os.environ.update({
+        "GEMINI_API_KEY": "load-test",
+        "GEMINI_BASE_URL": gemini_url,
+        "CAFE_CHAT_PIPELINE": pipeline,
+        "CAFE_RELOAD_POLL_SECONDS": "0",
+        # The same few messages repeat: measure Gemini streams, not replays
+        "CAFE_RESPONSE_CACHE_ENTRIES": "0",
+        "CAFE_SEMANTIC_CACHE_ENTRIES": "0",
+    })
+    # The pipeline's per-request debug prints would dominate the output
+    sys.stdout = open(os.devnull, "w")
+
+    import uvicorn
+    from app import main
+
+    main._publish(main._load_bot(storage_dir))
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning", backlog=BACKLOG)
+
+
+def wait_ready(url: str, process) -> None:
+    deadline = time.time() + READY_TIMEOUT_S
+    while time.time() < deadline:
+        if not process.is_alive():
+            fatal(f"Server process for {url} exited with code {process.exitcode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    fatal(f"{url} not ready after {READY_TIMEOUT_S}s")
+
+
+# -----------------------------
+# Clients
+# -----------------------------
+
+async def read_stream(host: str, port: int, body: bytes) -> Dict:
+    """
+    One /chat/stream request over a raw socket (Connection: close), so the
+    load generator stays cheap next to the server it measures.
+    """
+    request = (
+        f"POST /chat/stream HTTP/1.1\r\nHost: {host}:{port}\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+        f"Connection: close\r\n\r\n"
+    ).encode() + body
+
+    start = time.perf_counter()
+    record = {"ok": False, "ttfb": None, "first_chunk": None, "total": None}
+    writer = None
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(request)
+        head = await reader.readuntil(b"\r\n\r\n")
+        status = int(head.split(b" ", 2)[1])
+
+        received = b""
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            received += data
+            now = time.perf_counter() - start
+            if record["ttfb"] is None and FLUSH_TOKEN in received:
+                record["ttfb"] = now
+            if record["first_chunk"] is None and FIRST_GEMINI_CHUNK in received:
+                record["first_chunk"] = now
+        record["total"] = time.perf_counter() - start
+
+        errors = [m for m in ERROR_MARKERS if m in received]
+        if status != 200 or errors:
+            record["error"] = f"HTTP {status}: {received[-200:].decode('utf-8', 'replace')}"
+        else:
+            record["ok"] = record["first_chunk"] is not None
+    except Exception as e:
+        record["error"] = repr(e)[:200]
+    finally:
+        if writer is not None:
+            writer.close()
+    return record
+
+
+async def run_streams(host: str, port: int, streams: int, server_pid: int) -> Dict:
+    peak = {"threads": 0, "rss_kb": 0}
+    done = asyncio.Event()
+
+    async def sample():
+        while not done.is_set():
+            status = proc_status(server_pid)
+            peak["threads"] = max(peak["threads"], status["threads"])
+            peak["rss_kb"] = max(peak["rss_kb"], status["rss_kb"])
+            await asyncio.sleep(SAMPLE_INTERVAL_S)
+
+    bodies = [
+        json.dumps({"message": f"{MESSAGES[i % len(MESSAGES)]} {i}", "session_id": f"load_{i}"}).encode()
+        for i in range(streams)
+    ]
+
+    sampler = asyncio.create_task(sample())
+    start = time.perf_counter()
+    results = await asyncio.gather(*(read_stream(host, port, body) for body in bodies))
+    wall = time.perf_counter() - start
+    done.set()
+    await sampler
+
+    ok = [r for r in results if r["ok"]]
+    errors = [r["error"] for r in results if not r["ok"] and r.get("error")]
+    return {
+        "wall_s": round(wall, 2),
+        "completed": len(ok),
+        "failed": len(results) - len(ok),
+        "sample_errors": sorted(set(errors))[:5],
+        "ttfb": percentiles([r["ttfb"] for r in ok]),
+        "first_chunk": percentiles([r["first_chunk"] for r in ok]),
+        "total": percentiles([r["total"] for r in ok]),
+        "server_peak_threads": peak["threads"],
+        "server_peak_rss_mb": round(peak["rss_kb"] / 1024, 1),
+    }
+
+
+def run_pipeline(pipeline: str, storage_dir: Path, gemini_url: str, gemini_pid: int, streams: int) -> Dict:
+    ctx = get_context("spawn")
+    host, port = "127.0.0.1", free_port()
+    server = ctx.Process(target=serve_app, args=(port, str(storage_dir), pipeline, gemini_url), daemon=True)
+    server.start()
+    try:
+        wait_ready(f"http://{host}:{port}/health/ready", server)
+        idle = proc_status(server.pid)
+        gemini_before = proc_status(gemini_pid)
+        client_before = time.process_time()
+        httpx.post(f"{gemini_url}/reset")
+
+        result = asyncio.run(run_streams(host, port, streams, server.pid))
+
+        result["server_idle_threads"] = idle["threads"]
+        result["cpu_s"] = {
+            "server": round(proc_status(server.pid)["cpu_s"] - idle["cpu_s"], 2),
+            "fake_gemini": round(proc_status(gemini_pid)["cpu_s"] - gemini_before["cpu_s"], 2),
+            "clients": round(time.process_time() - client_before, 2),
+        }
+        result["fake_gemini"] = httpx.get(f"{gemini_url}/stats").json()
+        return result
+    finally:
+        server.terminate()
+        server.join(10)
+
+
+def print_result(pipeline: str, result: Dict):
+    gemini = result["fake_gemini"]
+    print(f"✔ {pipeline}: {result['completed']} ok / {result['failed']} failed in {result['wall_s']}s")
+    print(f"    ttfb        p50={result['ttfb']['p50_ms']}ms p99={result['ttfb']['p99_ms']}ms")
+    print(f"    first chunk p50={result['first_chunk']['p50_ms']}ms p99={result['first_chunk']['p99_ms']}ms")
+    print(f"    total       p50={result['total']['p50_ms']}ms p99={result['total']['p99_ms']}ms")
+    print(f"    peak concurrent Gemini streams={gemini['peak']}, "
+          f"server threads idle={result['server_idle_threads']} peak={result['server_peak_threads']}, "
+          f"peak RSS={result['server_peak_rss_mb']} MB")
+    cpu = result["cpu_s"]
+    print(f"    CPU seconds: server={cpu['server']} fake Gemini={cpu['fake_gemini']} clients={cpu['clients']}")
+    for error in result["sample_errors"]:
+        print(f"    ❌ {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /chat/stream against a fake Gemini server")
+    parser.add_argument("--streams", type=int, default=DEFAULT_STREAMS, help="concurrent chat streams")
+    parser.add_argument("--pipeline", default="both", choices=("async", "threadpool", "both"))
+    parser.add_argument("--chunks", type=int, default=DEFAULT_CHUNKS, help="Gemini chunks per response")
+    parser.add_argument("--chunk-delay-ms", type=int, default=DEFAULT_CHUNK_DELAY_MS)
+    parser.add_argument("--extract-delay-ms", type=int, default=DEFAULT_EXTRACT_DELAY_MS)
+    parser.add_argument("--menu-size", type=int, default=DEFAULT_MENU_SIZE, help="synthetic menu items")
+    parser.add_argument("--output", help="write the results JSON here")
+    args = parser.parse_args()
+
+    if args.streams <= 0 or args.chunks <= 0:
+        fatal("--streams and --chunks must be positive")
+
+    work_dir = Path(tempfile.mkdtemp(prefix="cafe_load_"))
+    storage_dir = work_dir / "cafe_faiss"
+    storage_dir.mkdir()
+
+    # Same synthetic bundle as the retrieval benchmark (hash embedder)
+    bundle_args = argparse.Namespace(index_type="auto", memory_budget_mb=1024, embedder="hash", batching=True)
+    write_synthetic_bundle(storage_dir, synthetic_menu(load_seed_menu(), args.menu_size), bundle_args, 384)
+    print(f"✔ Synthetic menu: {args.menu_size} items")
+
+    ctx = get_context("spawn")
+    gemini_port = free_port()
+    gemini_url = f"http://127.0.0.1:{gemini_port}"
+    gemini = ctx.Process(
+        target=serve_fake_gemini,
+        args=(gemini_port, args.chunks, args.chunk_delay_ms, args.extract_delay_ms),
+        daemon=True,
+    )
+    gemini.start()
+
+    pipelines = ("threadpool", "async") if args.pipeline == "both" else (args.pipeline,)
+    ideal_ms = args.extract_delay_ms + args.chunks * args.chunk_delay_ms
+    print(f"🔧 {args.streams} concurrent streams, ideal stream time ≈ {ideal_ms}ms")
+
+    results = {}
+    try:
+        wait_ready(f"{gemini_url}/stats", gemini)
+        for pipeline in pipelines:
+            print(f"\n🔁 Pipeline: {pipeline}")
+            results[pipeline] = run_pipeline(pipeline, storage_dir, gemini_url, gemini.pid, args.streams)
+            print_result(pipeline, results[pipeline])
+    finally:
+        gemini.terminate()
+        gemini.join(10)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        output = Path(args.output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+        print(f"\n📁 Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
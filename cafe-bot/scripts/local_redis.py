@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+local_redis.py
+
+In-memory stand-in for Redis, speaking its protocol (RESP2), for running
+the app with CAFE_SESSION_STORE=redis on a laptop or in CI without a Redis
+server. Implements only what the session store uses: PING, AUTH, SELECT,
+RPUSH, LRANGE, LTRIM, EXPIRE, TTL, DEL, DBSIZE, FLUSHALL. Keys expire
+lazily on access. Pipelined commands are answered in order.
+
+Not for production: single process, no persistence, no maxmemory.
+
+Usage:
+  python -m scripts.local_redis [--host 127.0.0.1] [--port 6379] [--password SECRET]
+
+  REDIS_URL=redis://127.0.0.1:6379/0 CAFE_SESSION_STORE=redis python -m app.main
+"""
+
+import sys
+import time
+import asyncio
+import argparse
+from typing import Dict, List, Optional
+
+
+def fatal(msg: str):
+    print(f"\n❌ ERROR: {msg}\n")
+    sys.exit(1)
+
+
+# -----------------------------
+# Protocol
+# -----------------------------
+
+def simple(text: str) -> bytes:
+    return b"+%s\r\n" % text.encode()
+
+
+def error(text: str) -> bytes:
+    return b"-%s\r\n" % text.encode()
+
+
+def integer(value: int) -> bytes:
+    return b":%d\r\n" % value
+
+
+def bulk_array(values: List[bytes]) -> bytes:
+    parts = [b"*%d\r\n" % len(values)]
+    for value in values:
+        parts.append(b"$%d\r\n%s\r\n" % (len(value), value))
+    return b"".join(parts)
+
+
+async def read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        # Inline command ("PING\r\n", e.g. from telnet / redis-cli --no-raw)
+        return line.strip().split()
+
+    args = []
+    for _ in range(int(line[1:-2])):
+        header = await reader.readline()
+        length = int(header[1:-2])
+        args.append((await reader.readexactly(length + 2))[:-2])
+    return args
+
+
+# -----------------------------
+# Keyspace
+# -----------------------------
+
+class Keyspace:
+    """Lists only (the session store's data type), per database, with TTLs."""
+
+    def __init__(self):
+        self.lists: Dict[int, Dict[bytes, List[bytes]]] = {}
+        self.expires: Dict[int, Dict[bytes, float]] = {}
+
+    def db(self, index: int) -> Dict[bytes, List[bytes]]:
+        return self.lists.setdefault(index, {})
+
+    def get(self, index: int, key: bytes) -> Optional[List[bytes]]:
+        expires_at = self.expires.get(index, {}).get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.delete(index, key)
+            return None
+        return self.db(index).get(key)
+
+    def delete(self, index: int, key: bytes) -> int:
+        self.expires.get(index, {}).pop(key, None)
+        return int(self.db(index).pop(key, None) is not None)
+
+
+def list_slice(values: List[bytes], start: int, stop: int) -> slice:
+    """Redis LRANGE/LTRIM bounds (inclusive stop, negatives from the end)."""
+    n = len(values)
+    start = max(start + n if start < 0 else start, 0)
+    stop = stop + n if stop < 0 else stop
+    return slice(start, max(min(stop, n - 1) + 1, start))
+
+
+class Connection:
+    def __init__(self, keyspace: Keyspace, password: Optional[str]):
+        self.keyspace = keyspace
+        self.password = password
+        self.authenticated = password is None
+        self.db = 0
+
+    def handle(self, args: List[bytes]) -> bytes:
+        if not args:
+            return error("ERR empty command")
+        name = args[0].upper().decode(errors="replace")
+        params = args[1:]
+        keyspace = self.keyspace
+
+        if name == "AUTH":
+            # AUTH password, or AUTH username password
+            self.authenticated = self.password is not None and params[-1].decode() == self.password
+            return simple("OK") if self.authenticated else error("WRONGPASS invalid password")
+        if not self.authenticated:
+            return error("NOAUTH Authentication required.")
+
+        try:
+            if name == "PING":
+                return simple("PONG")
+            if name == "SELECT":
+                self.db = int(params[0])
+                return simple("OK")
+            if name == "RPUSH":
+                values = keyspace.get(self.db, params[0])
+                if values is None:
+                    values = keyspace.db(self.db)[params[0]] = []
+                values.extend(params[1:])
+                return integer(len(values))
+            if name == "LRANGE":
+                values = keyspace.get(self.db, params[0]) or []
+                return bulk_array(values[list_slice(values, int(params[1]), int(params[2]))])
+            if name == "LTRIM":
+                values = keyspace.get(self.db, params[0])
+                if values is not None:
+                    values[:] = values[list_slice(values, int(params[1]), int(params[2]))]
+                    if not values:
+                        keyspace.delete(self.db, params[0])
+                return simple("OK")
+            if name == "EXPIRE":
+                if keyspace.get(self.db, params[0]) is None:
+                    return integer(0)
+                keyspace.expires.setdefault(self.db, {})[params[0]] = time.monotonic() + int(params[1])
+                return integer(1)
+            if name == "TTL":
+                if keyspace.get(self.db, params[0]) is None:
+                    return integer(-2)
+                expires_at = keyspace.expires.get(self.db, {}).get(params[0])
+                return integer(-1 if expires_at is None else int(expires_at - time.monotonic()))
+            if name == "DEL":
+                return integer(sum(keyspace.delete(self.db, key) for key in params))
+            if name == "DBSIZE":
+                return integer(len(keyspace.db(self.db)))
+            if name == "FLUSHALL":
+                keyspace.lists.clear()
+                keyspace.expires.clear()
+                return simple("OK")
+        except (IndexError, ValueError):
+            return error(f"ERR wrong arguments for '{name.lower()}' command")
+
+        return error(f"ERR unknown command '{name.lower()}'")
+
+
+async def serve(host: str, port: int, password: Optional[str]):
+    keyspace = Keyspace()
+
+    async def client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        conn = Connection(keyspace, password)
+        try:
+            while True:
+                args = await read_command(reader)
+                if args is None:
+                    break
+                writer.write(conn.handle(args))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(client, host, port)
+    print(f"✔ Redis stand-in listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-memory Redis-protocol stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--password", help="require AUTH with this password")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.password))
+    except OSError as e:
+        fatal(f"Cannot listen on {args.host}:{args.port}: {e}")
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
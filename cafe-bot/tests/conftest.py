@@ -0,0 +1,57 @@
+import sys
+import json
+import argparse
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+# The shipped 58-item menu, in the shape of the four Mongo collections
+FIXTURE_MENU = ROOT / "tests" / "fixtures" / "menu.json"
+
+
+def fixture_records() -> List[Dict]:
+    """metadata.jsonl-shaped records of the fixture menu (vector_id = row)."""
+    with open(FIXTURE_MENU, "r", encoding="utf-8") as f:
+        menu = json.load(f)
+    labels = {
+        doc["_id"]: doc["name"]
+        for name in ("menucategories", "menuSubCategories", "menugroups")
+        for doc in menu[name]
+    }
+    return [
+        {
+            "vector_id": row,
+            "item_id": item["_id"],
+            "name": item["name"],
+            "price": item["prices"][0]["price"],
+            "inStock": item["inStock"],
+            "categoryId": item["categoryId"],
+            "subCategoryId": item["subCategoryId"],
+            "groupId": item["groupId"],
+            "categoryName": labels[item["categoryId"]],
+            "subCategoryName": labels[item["subCategoryId"]],
+            "groupName": labels[item["groupId"]],
+        }
+        for row, item in enumerate(menu["menuitems"])
+    ]
+
+
+@pytest.fixture(scope="session")
+def menu_records() -> List[Dict]:
+    return fixture_records()
+
+
+@pytest.fixture(scope="session")
+def retriever(tmp_path_factory, menu_records):
+    """CafeRAGRetriever over the fixture menu, hash-embedded (offline)."""
+    from app.features.cafe_chatbot.retrieval.retriever import CafeRAGRetriever
+    from scripts.benchmark_retrieval import write_synthetic_bundle
+
+    storage_dir = tmp_path_factory.mktemp("cafe_faiss")
+    args = argparse.Namespace(index_type="flat", memory_budget_mb=64, embedder="hash", batching=False)
+    write_synthetic_bundle(storage_dir, menu_records, args, 384)
+    return CafeRAGRetriever(str(storage_dir))
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from app.features.cafe_chatbot.retrieval.ann import (
+    DEFAULT_SEARCH_PARAMS,
+    INDEX_TYPES,
+    build_index,
+    can_build,
+    choose_index_type,
+    search_parameters,
+)
+from app.features.cafe_chatbot.retrieval.backends import HashingEmbeddingBackend
+
+
+def item_vectors(records):
+    texts = [f"{r['name']} {r['categoryName']} {r['groupName']}" for r in records]
+    return HashingEmbeddingBackend(384).encode(texts)
+
+
+@pytest.mark.parametrize("kind", INDEX_TYPES)
+def test_every_index_type_on_the_small_menu(kind, menu_records):
+    vectors = item_vectors(menu_records)
+    ids = np.arange(100, 100 + len(menu_records), dtype=np.int64)
+
+    if not can_build(kind, len(menu_records)):
+        with pytest.raises(RuntimeError, match="to train"):
+            build_index(kind, vectors, ids)
+        return
+
+    index = build_index(kind, vectors, ids)
+    assert index.ntotal == len(menu_records)
+    params = search_parameters(kind, DEFAULT_SEARCH_PARAMS.get(kind, {}))
+    _, found = index.search(vectors[:3], 5, params=params)
+    assert set(found.ravel().tolist()) <= set(ids.tolist())
+    if kind in ("numpy", "flat", "sq_fp16", "hnsw"):
+        # Each item is its own nearest neighbour
+        assert found[:, 0].tolist() == ids[:3].tolist()
+
+
+def test_ivf_pq_needs_a_codebook_worth_of_vectors():
+    assert not can_build("ivf_pq", 58)
+    assert not can_build("ivf_pq", 255)
+    assert can_build("ivf_pq", 300)
+    assert not can_build("ivf_flat", 38)
+
+
+@pytest.mark.parametrize("n, budget_mb, expected", [
+    (58, 1024, "numpy"),
+    # Nothing fits: the smallest type that can be trained at this size
+    (58, 0, "sq_int8"),
+    (300, 0, "ivf_pq"),
+    (20_000, 8, "sq_int8"),
+    (1_000_000, 1, "ivf_pq"),
+])
+def test_auto_selection_only_picks_trainable_types(n, budget_mb, expected):
+    kind = choose_index_type(n, 384, budget_mb * 2**20)
+    assert kind == expected
+    assert can_build(kind, n)
@@ -0,0 +1,79 @@
+import numpy as np
+
+from app.features.cafe_chatbot.conversation import new_turn
+from app.features.cafe_chatbot.llm.response_cache import ResponseCache
+from app.features.cafe_chatbot.llm.semantic_cache import SemanticAnswerCache
+
+
+ITEMS = [{"item_id": "itm_a"}, {"item_id": "itm_b"}]
+CONSTRAINTS = {"max_price": 200, "diet": ["vegan"]}
+
+
+def unit(values):
+    vector = np.array([values], dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_exact_key_ignores_case_and_spacing_but_not_context():
+    key = ResponseCache.key("Vegan  drinks", CONSTRAINTS, ITEMS, "v1", [])
+
+    assert key == ResponseCache.key("vegan drinks", dict(reversed(CONSTRAINTS.items())), ITEMS, "v1", [])
+    assert key != ResponseCache.key("vegan drinks", CONSTRAINTS, ITEMS[::-1], "v1", [])
+    assert key != ResponseCache.key("vegan drinks", CONSTRAINTS, ITEMS, "v2", [])
+    context = [new_turn("hot coffee", None)]
+    assert key != ResponseCache.key("vegan drinks", CONSTRAINTS, ITEMS, "v1", context)
+
+
+def test_response_cache_drops_entries_of_an_older_generation():
+    cache = ResponseCache(max_entries=8)
+    key = ResponseCache.key("vegan drinks", CONSTRAINTS, ITEMS, "v1", [])
+
+    cache.put(key, 1, ["Green Tea (₹120)"])
+    assert cache.get(key, 1) == ("Green Tea (₹120)",)
+
+    # A lookup that started before the reload is not served or stored
+    assert cache.get(key, 2) is None
+    cache.put(key, 1, ["stale"])
+    assert cache.get(key, 2) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_semantic_cache_hits_only_within_scope_and_threshold():
+    cache = SemanticAnswerCache(max_entries=8, threshold=0.9, sample_rate=0.0)
+    key = ResponseCache.key("cheap vegan drinks", CONSTRAINTS, ITEMS, "v1", [])
+    scope = ResponseCache.scope(key)
+
+    cache.add("cheap vegan drinks", unit([1, 0.1, 0]), scope, ["itm_a", "itm_b"], 1, ["answer"])
+
+    assert cache.lookup("vegan drinks on a budget", unit([1, 0.2, 0]), scope, ["itm_a"], 1) == ("answer",)
+    # Same meaning under other constraints, or a different meaning
+    other_scope = ResponseCache.scope(ResponseCache.key("x", {"max_price": 100}, ITEMS, "v1", []))
+    assert cache.lookup("vegan drinks on a budget", unit([1, 0.2, 0]), other_scope, [], 1) is None
+    assert cache.lookup("hot coffee", unit([0, 1, 0]), scope, [], 1) is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    # Overlap of {a} with {a, b} is 0.5: not suspect
+    assert stats["suspect_hits"] == 0
+
+
+def test_semantic_cache_does_not_serve_suspect_hits():
+    cache = SemanticAnswerCache(max_entries=8, threshold=0.9, sample_rate=0.0)
+    cache.add("cheap vegan drinks", unit([1, 0.1, 0]), ("s",), ["itm_a", "itm_b"], 1, ["answer"])
+
+    # Similar query, but retrieval found other items: a miss, counted and sampled
+    assert cache.lookup("cheap vegan snacks", unit([1, 0.2, 0]), ("s",), ["itm_c"], 1) is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["suspect_hits"]) == (0, 1)
+    assert stats["samples"][0]["served"] is False
+    assert stats["samples"][0]["cached_query"] == "cheap vegan drinks"
+
+
+def test_semantic_cache_evicts_least_recently_used():
+    cache = SemanticAnswerCache(max_entries=1, threshold=0.9, sample_rate=0.0)
+    cache.add("first", unit([1, 0, 0]), ("s",), [], 1, ["one"])
+    cache.add("second", unit([0, 1, 0]), ("s",), [], 1, ["two"])
+
+    assert cache.lookup("first", unit([1, 0, 0]), ("s",), [], 1) is None
+    assert cache.lookup("second", unit([0, 1, 0]), ("s",), [], 1) == ("two",)
@@ -0,0 +1,141 @@
+import sys
+import json
+from concurrent.futures import Future
+from pathlib import Path
+
+import pytest
+
+import scripts.build_cafe_faiss_index as builder
+from app.features.cafe_chatbot.retrieval.backends import HashingEmbeddingBackend
+from app.features.cafe_chatbot.retrieval.bundle import resolve_bundle_dir
+from app.features.cafe_chatbot.retrieval.retriever import CafeRAGRetriever
+
+from conftest import FIXTURE_MENU
+
+
+class HashEncoder:
+    """ParallelEncoder stand-in: token hashing instead of the sentence-transformers model."""
+
+    def __init__(self, model_name: str, workers: int):
+        self.backend = HashingEmbeddingBackend(builder.VECTOR_DIMENSION)
+        self.encoded = 0
+
+    def submit(self, texts):
+        self.encoded += len(texts)
+        future = Future()
+        future.set_result(self.backend.encode(texts))
+        return [future]
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def build(tmp_path, monkeypatch):
+    storage_dir = tmp_path / "cafe_faiss"
+    monkeypatch.setattr(builder, "STORAGE_DIR", str(storage_dir))
+    monkeypatch.setattr(builder, "ParallelEncoder", HashEncoder)
+
+    def run(menu_path: Path = FIXTURE_MENU, *extra: str) -> Path:
+        monkeypatch.setattr(sys, "argv", ["build_cafe_faiss_index", "--fixture", str(menu_path), *extra])
+        builder.main()
+        return resolve_bundle_dir(storage_dir)
+
+    return run
+
+
+def read_bundle(bundle_dir: Path):
+    config = json.loads((bundle_dir / "config.json").read_text(encoding="utf-8"))
+    with open(bundle_dir / "metadata.jsonl", "r", encoding="utf-8") as f:
+        ids = {r["item_id"]: r["vector_id"] for r in map(json.loads, f)}
+    return config, ids
+
+
+def test_first_build_embeds_every_item(build):
+    bundle_dir = build()
+    config, ids = read_bundle(bundle_dir)
+
+    assert config["num_items"] == len(ids) == 58
+    assert config["build"]["embedded"] == 58
+    assert sorted(ids.values()) == list(range(58))
+    for name in ("shards.json", "centroids.npy", builder.ITEM_HASHES_FILE, "metadata_columns/vocab.json"):
+        assert (bundle_dir / name).exists()
+
+    # Shards are routing metadata only: sizes match the menu, no vectors
+    items = json.loads(FIXTURE_MENU.read_text(encoding="utf-8"))["menuitems"]
+    shards = json.loads((bundle_dir / "shards.json").read_text(encoding="utf-8"))
+    for shard in shards:
+        key = "categoryId" if shard["level"] == "category" else "groupId"
+        assert shard["num_items"] == sum(item[key] == shard["id"] for item in items)
+    assert sum(s["num_items"] for s in shards if s["level"] == "category") == 58
+    assert sum(s["num_items"] for s in shards if s["level"] == "group") == 58
+    assert not (bundle_dir / "shards").exists()
+
+
+def test_routed_search_stays_in_the_routed_shards(build):
+    bundle_dir = build()
+    config = json.loads((bundle_dir / "config.json").read_text(encoding="utf-8"))
+    config["embedding_backend"] = "hash"
+    (bundle_dir / "config.json").write_text(json.dumps(config), encoding="utf-8")
+    retriever = CafeRAGRetriever(str(bundle_dir.parents[1]))
+
+    hint = "robusta cold non-milk"
+    routed = [retriever.router.shards[i] for i in retriever.router.route(retriever.embedder.embed(hint))]
+    assert routed
+
+    results = retriever.search(hint, top_k=50, route=True)
+    assert results
+    for r in results:
+        assert any(r["categoryId" if s["level"] == "category" else "groupId"] == s["id"] for s in routed)
+
+
+def test_unchanged_menu_publishes_nothing(build, capsys):
+    first = build()
+    second = build()
+
+    assert second == first
+    assert "Menu unchanged" in capsys.readouterr().out
+
+
+def test_incremental_build_embeds_only_the_diff(build, tmp_path):
+    first = build()
+    _, first_ids = read_bundle(first)
+
+    menu = json.loads(FIXTURE_MENU.read_text(encoding="utf-8"))
+    items = menu["menuitems"]
+    removed = items.pop(0)
+    items[0]["prices"][0]["price"] += 10
+    changed = items[0]["_id"]
+    items.append(dict(items[1], _id="itm_new_cold_brew", name="Cold Brew"))
+    edited = tmp_path / "menu_edited.json"
+    edited.write_text(json.dumps(menu), encoding="utf-8")
+
+    second = build(edited)
+    config, ids = read_bundle(second)
+
+    assert second != first
+    assert config["build"] == {
+        "added": 1, "removed": 1, "changed": 1, "embedded": 2, "cache_hits": 56,
+    }
+    # Stable ids: kept for existing items, fresh (never reused) for new ones
+    assert removed["_id"] not in ids
+    assert ids[changed] == first_ids[changed]
+    assert all(ids[i] == first_ids[i] for i in ids if i in first_ids)
+    assert ids["itm_new_cold_brew"] == 58
+    assert config["next_vector_id"] == 59
+
+
+def test_compare_skips_types_that_cannot_be_trained(build, capsys):
+    bundle_dir = build(FIXTURE_MENU, "--compare", "--memory-budget-mb", "0")
+    config, _ = read_bundle(bundle_dir)
+    out = capsys.readouterr().out
+
+    assert config["index_type"] == "sq_int8"
+    skipped = [line.split()[0] for line in out.splitlines() if "skipped:" in line]
+    assert skipped == ["ivf_pq"]
+    assert "needs >= 256 items to train" in out
+
+
+def test_explicit_untrainable_index_type_fails_cleanly(build):
+    with pytest.raises(SystemExit):
+        build(FIXTURE_MENU, "--index-type", "ivf_pq")
@@ -0,0 +1,21 @@
+import json
+
+import scripts.export_onnx_embedder as exporter
+from app.features.cafe_chatbot.retrieval.bundle import publish_bundle, resolve_bundle_dir
+
+
+def test_activate_publishes_a_new_bundle_and_leaves_the_served_one_alone(tmp_path, monkeypatch):
+    monkeypatch.setattr(exporter, "STORAGE_DIR", str(tmp_path))
+    served = tmp_path / "versions" / "20260101T000000000000Z"
+    (served / "metadata_columns").mkdir(parents=True)
+    (served / "config.json").write_text(json.dumps({"embedding_backend": "sentence-transformers"}))
+    (served / "metadata_columns" / "vocab.json").write_text("{}")
+    publish_bundle(tmp_path, served)
+
+    config = dict(exporter.load_config(), embedding_backend="onnx")
+    published = exporter.publish_with_config(config)
+
+    assert resolve_bundle_dir(tmp_path) == published != served
+    assert json.loads((published / "config.json").read_text())["embedding_backend"] == "onnx"
+    assert json.loads((served / "config.json").read_text())["embedding_backend"] == "sentence-transformers"
+    assert (published / "metadata_columns" / "vocab.json").read_text() == "{}"
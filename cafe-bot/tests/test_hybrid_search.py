@@ -0,0 +1,60 @@
+import numpy as np
+
+from app.features.cafe_chatbot.retrieval.lexical_index import LexicalIndex, reciprocal_rank_fusion
+
+
+def test_rrf_ranks_rows_found_by_both_lists_first():
+    rows, scores = reciprocal_rank_fusion([np.array([5, 3, 9]), np.array([3, 7])], k=10, rrf_k=60)
+
+    assert rows.tolist() == [3, 5, 7, 9]
+    assert np.isclose(scores[0], 1 / 62 + 1 / 61)
+    assert np.all(np.diff(scores) <= 0)
+
+
+def test_rrf_breaks_ties_by_row_and_truncates_to_k():
+    rows, _ = reciprocal_rank_fusion([np.array([8, 2]), np.array([2, 8])], k=1)
+    assert rows.tolist() == [2]
+
+
+def test_rrf_of_empty_lists_is_empty():
+    rows, scores = reciprocal_rank_fusion([np.zeros(0, dtype=np.int64)], k=5)
+    assert len(rows) == 0 and len(scores) == 0
+
+
+def test_bm25_matches_names_and_labels(menu_records):
+    lexical = LexicalIndex(menu_records)
+
+    rows, scores = lexical.search("hazelnut", k=10)
+    assert len(rows) > 0
+    assert all("hazelnut" in menu_records[r]["name"].lower() for r in rows)
+    assert np.all(np.diff(scores) <= 0)
+
+    exact = lexical.exact_rows("cranberry tonic!")
+    assert {menu_records[r]["name"] for r in exact} == {"Cranberry Tonic"}
+
+
+def test_bm25_respects_mask(menu_records):
+    lexical = LexicalIndex(menu_records)
+    mask = np.array([r["price"] <= 150 for r in menu_records])
+
+    rows, _ = lexical.search("robusta", k=50, mask=mask)
+    assert len(rows) > 0
+    assert all(mask[rows])
+
+
+def test_exact_name_query_skips_the_vector_search(retriever):
+    results = retriever.search("Cranberry Tonic", top_k=5)
+
+    assert {r["name"] for r in results} == {"Cranberry Tonic"}
+    assert all(r["score"] == 1.0 for r in results)
+
+
+def test_fused_results_are_ordered_and_filtered(retriever):
+    results = retriever.search("iced hazelnut", top_k=10, max_price=250)
+
+    assert results
+    assert all(r["price"] <= 250 for r in results)
+    scores = [r["score"] for r in results]
+    assert scores == sorted(scores, reverse=True)
+    # Matched by both BM25 and the (token-hash) vectors: fused to the top
+    assert "hazelnut" in results[0]["name"].lower()
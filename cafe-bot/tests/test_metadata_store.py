@@ -0,0 +1,104 @@
+import faiss
+import numpy as np
+
+from app.features.cafe_chatbot.retrieval.metadata_store import MenuMetadataStore, MetadataColumnWriter
+
+
+RECORDS = [
+    {"vector_id": 10, "item_id": "itm_a", "name": "Iced Americano", "price": 160, "inStock": True,
+     "categoryId": "cat_robusta", "subCategoryId": "sub_cold", "groupId": "grp_robusta_cold_nonmilk"},
+    {"vector_id": 11, "item_id": "itm_b", "name": "Iced Latte", "price": 220, "inStock": True,
+     "categoryId": "cat_robusta", "subCategoryId": "sub_cold", "groupId": "grp_robusta_cold_milk"},
+    {"vector_id": 12, "item_id": "itm_c", "name": "Hot Mocha", "price": 200, "inStock": False,
+     "categoryId": "cat_blend", "subCategoryId": "sub_hot", "groupId": "grp_blend_hot_milk"},
+    {"vector_id": 14, "item_id": "itm_d", "name": "Green Tea", "price": None, "inStock": True,
+     "categoryId": "cat_noncoffee", "subCategoryId": "sub_tea", "groupId": "grp_tea"},
+    {"vector_id": 15, "item_id": "itm_e", "name": "Croissant", "price": 120, "inStock": True,
+     "categoryId": "cat_food", "subCategoryId": "sub_food", "groupId": "grp_food"},
+]
+
+
+def names(store, mask):
+    return sorted(store.names[mask].tolist())
+
+
+def test_no_filter_means_no_mask():
+    store = MenuMetadataStore.from_records(RECORDS)
+    assert store.build_mask(require_in_stock=False) is None
+
+
+def test_filters_are_combined():
+    store = MenuMetadataStore.from_records(RECORDS)
+
+    assert names(store, store.build_mask()) == ["Croissant", "Green Tea", "Iced Americano", "Iced Latte"]
+    # Missing prices never pass a price filter
+    assert names(store, store.build_mask(max_price=200)) == ["Croissant", "Iced Americano"]
+    assert names(store, store.build_mask(require_in_stock=False, max_price=200)) == [
+        "Croissant", "Hot Mocha", "Iced Americano",
+    ]
+    assert names(store, store.build_mask(diet=["vegan"])) == ["Green Tea", "Iced Americano"]
+    assert names(store, store.build_mask(category_ids=["cat_robusta"], max_price=200)) == ["Iced Americano"]
+    assert names(store, store.build_mask(group_ids=["grp_tea", "grp_food"])) == ["Croissant", "Green Tea"]
+    assert names(store, store.build_mask(category_ids=["cat_unknown"])) == []
+
+
+def test_id_selector_limits_faiss_search_to_the_mask():
+    store = MenuMetadataStore.from_records(RECORDS)
+    vectors = np.eye(len(RECORDS), 8, dtype=np.float32)
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(8))
+    index.add_with_ids(vectors, store.vector_ids)
+
+    mask = store.build_mask(max_price=200)
+    bitmap = store.id_bitmap(mask)
+    assert np.flatnonzero(bitmap).tolist() == [10, 15]
+
+    params = faiss.SearchParameters(sel=store.id_selector(mask))
+    _, ids = index.search(np.ones((1, 8), dtype=np.float32), 5, params=params)
+    assert sorted(i for i in ids[0].tolist() if i >= 0) == [10, 15]
+
+
+def test_results_are_materialized_from_vector_ids():
+    store = MenuMetadataStore.from_records(RECORDS)
+    results = store.to_results(np.array([14, -1, 11]), np.array([0.9, 0.0, 0.5], dtype=np.float32))
+
+    assert [r["item_id"] for r in results] == ["itm_d", "itm_b"]
+    assert results[0]["price"] is None
+    assert results[1]["price"] == 220 and results[1]["score"] == 0.5
+
+
+def test_decimal_prices_come_back_exact():
+    records = [dict(RECORDS[0], price=199.99), dict(RECORDS[1], price=220.5)]
+    store = MenuMetadataStore.from_records(records)
+
+    assert [r["price"] for r in store.to_results(np.array([10, 11]), np.zeros(2))] == [199.99, 220.5]
+    assert store.record(0)["price"] == 199.99
+    assert names(store, store.build_mask(max_price=199.99)) == ["Iced Americano"]
+
+
+def test_rows_of_item_ids():
+    store = MenuMetadataStore.from_records(RECORDS)
+    assert store.rows_of_item_ids(["itm_e", "itm_gone", "itm_a"]).tolist() == [4, -1, 0]
+    # Longer than the column width: never truncated into another item's id
+    assert store.rows_of_item_ids(["itm_a_v2", "itm_bb"]).tolist() == [-1, -1]
+
+
+def test_columns_round_trip_through_mmap(tmp_path):
+    MenuMetadataStore.from_records(RECORDS).save_columns(tmp_path)
+    store = MenuMetadataStore.from_columns(tmp_path, mmap=True)
+
+    assert names(store, store.build_mask(diet=["vegan"])) == ["Green Tea", "Iced Americano"]
+    assert store.record(2)["groupId"] == "grp_blend_hot_milk"
+
+
+def test_streamed_columns_match_from_records(tmp_path):
+    writer = MetadataColumnWriter(tmp_path / "columns")
+    for start in range(0, len(RECORDS), 2):
+        writer.add(RECORDS[start:start + 2])
+    assert writer.close() == len(RECORDS)
+
+    streamed = MenuMetadataStore.from_columns(tmp_path / "columns", mmap=True)
+    expected = MenuMetadataStore.from_records(RECORDS)
+
+    assert list(streamed.iter_records()) == list(expected.iter_records())
+    assert names(streamed, streamed.build_mask(category_ids=["cat_robusta"], diet=["vegan"])) == ["Iced Americano"]
+    assert not (tmp_path / "columns" / "spill").exists()
@@ -0,0 +1,20 @@
+import pytest
+
+from app.prefork import check_session_store
+
+
+def test_prefork_refuses_process_local_sessions(monkeypatch):
+    monkeypatch.delenv("CAFE_SESSION_STORE", raising=False)
+    monkeypatch.delenv("CAFE_PREFORK_LOCAL_SESSIONS", raising=False)
+    with pytest.raises(SystemExit):
+        check_session_store()
+
+
+def test_prefork_with_shared_or_overridden_sessions(monkeypatch, capsys):
+    monkeypatch.setenv("CAFE_SESSION_STORE", "redis")
+    check_session_store()
+
+    monkeypatch.setenv("CAFE_SESSION_STORE", "memory")
+    monkeypatch.setenv("CAFE_PREFORK_LOCAL_SESSIONS", "1")
+    check_session_store()
+    assert "CAFE_SESSION_STORE=memory" in capsys.readouterr().err
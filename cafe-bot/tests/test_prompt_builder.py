@@ -0,0 +1,46 @@
+from app.features.cafe_chatbot.llm.prompt_builder import SUGGESTION_MAX_ENTRIES, PromptBuilder, merge_variants
+
+
+def item(n, score, price=100):
+    return {"item_id": f"itm_{n}", "name": f"Drink {n}", "price": price, "score": score}
+
+
+def test_variants_merge_into_one_entry_at_the_best_rank():
+    entries = merge_variants([item(1, 0.03, 270), item(2, 0.02), item(1, 0.01, 250)])
+
+    assert [e["name"] for e in entries] == ["Drink 1", "Drink 2"]
+    assert entries[0]["prices"] == [250, 270]
+    assert entries[0]["item_ids"] == ["itm_1", "itm_1"]
+
+
+def test_suggestion_tail_is_cut_by_rank_not_score():
+    # An exact hit (1.0) ahead of fused RRF scores (~0.016): none is dropped
+    # for scoring far below the best one
+    items = [item(0, 1.0)] + [item(n, 1 / (60 + n)) for n in range(1, 10)]
+    usage = PromptBuilder(token_budget=100_000).build("drinks", items)["usage"]
+    assert (usage["entries"], usage["tail_dropped"]) == (10, 0)
+
+    items = [item(n, 1 / (60 + n)) for n in range(SUGGESTION_MAX_ENTRIES + 5)]
+    built = PromptBuilder(token_budget=100_000).build("drinks", items)
+    assert built["usage"]["tail_dropped"] == 5
+    assert f"Drink {SUGGESTION_MAX_ENTRIES - 1} —" in built["prompt"]
+    assert f"Drink {SUGGESTION_MAX_ENTRIES} —" not in built["prompt"]
+
+
+def test_listing_keeps_every_entry():
+    items = [item(n, 1.0) for n in range(SUGGESTION_MAX_ENTRIES + 5)]
+    usage = PromptBuilder(token_budget=100_000).build("drinks", items, scenario="listing")["usage"]
+    assert (usage["entries"], usage["tail_dropped"]) == (SUGGESTION_MAX_ENTRIES + 5, 0)
+
+
+def test_listing_trimmed_by_the_budget_says_what_is_missing():
+    items = [item(n, 1.0) for n in range(200)]
+    built = PromptBuilder(token_budget=1500).build("list all drinks", items, scenario="listing")
+    usage = built["usage"]
+
+    assert 0 < usage["budget_dropped"] < 200
+    assert f"{usage['budget_dropped']} more matching items not shown" in built["prompt"]
+    assert usage["estimated_prompt_tokens"] <= 1500
+
+    suggestion = PromptBuilder(token_budget=1500).build("drinks", items)
+    assert "not shown" not in suggestion["prompt"]
@@ -0,0 +1,99 @@
+import pytest
+
+from app.features.cafe_chatbot.conversation import new_turn
+from app.features.cafe_chatbot.query_understanding.rule_parser import RuleBasedConstraintParser, empty_constraints
+
+
+@pytest.fixture
+def parser():
+    return RuleBasedConstraintParser()
+
+
+def test_budget_and_diet_are_parsed_with_full_confidence(parser):
+    constraints, confidence = parser.parse("show me vegan options under ₹200")
+
+    assert confidence == 1.0
+    assert constraints["max_price"] == 200
+    assert constraints["diet"] == ["vegan"]
+
+
+def test_price_range(parser):
+    constraints, confidence = parser.parse("between 100 and 250 rs")
+    assert (constraints["min_price"], constraints["max_price"], confidence) == (100, 250, 1.0)
+
+
+def test_unexplained_words_drop_below_the_threshold(parser):
+    _, confidence = parser.parse("something refreshing for a sunny afternoon")
+    assert confidence < 0.5
+
+    # One category word is enough to hand the query to the LLM
+    _, confidence = parser.parse("vegan drinks under 200")
+    assert confidence < 0.5
+
+
+def test_contradictory_range_has_no_confidence(parser):
+    _, confidence = parser.parse("above 300 and under 100")
+    assert confidence == 0.0
+
+
+def test_follow_up_inherits_the_last_resolved_turn(parser):
+    earlier = dict(empty_constraints(), max_price=200, diet=["vegan"], category_hint="drinks")
+    history = [new_turn("vegan drinks under 200", earlier)]
+
+    constraints, confidence = parser.parse("what about cold ones", history)
+
+    assert confidence == 1.0
+    assert constraints["max_price"] == 200
+    assert constraints["diet"] == ["vegan"]
+    assert constraints["temperature"] == ["cold"]
+    assert constraints["category_hint"] == "drinks"
+
+
+def test_request_verbs_after_history_still_inherit(parser):
+    earlier = dict(empty_constraints(), max_price=200, temperature=["cold"], category_hint="coffee")
+    history = [new_turn("cold coffee under 200", earlier)]
+
+    constraints, confidence = parser.parse("show me vegan options", history)
+    assert (constraints["max_price"], constraints["diet"], constraints["temperature"]) == (200, ["vegan"], ["cold"])
+    assert constraints["category_hint"] == "coffee"
+    assert confidence == 1.0
+
+    constraints, _ = parser.parse("list everything", history)
+    assert constraints == earlier
+
+
+def test_explicit_reset_starts_a_new_request(parser):
+    earlier = dict(empty_constraints(), max_price=200, temperature=["cold"], category_hint="coffee")
+    history = [new_turn("cold coffee under 200", earlier)]
+
+    constraints, confidence = parser.parse("forget that, show me vegan options", history)
+    assert constraints == dict(empty_constraints(), diet=["vegan"])
+    assert confidence == 1.0
+
+    constraints, _ = parser.parse("new order: hot ones", history)
+    assert (constraints["max_price"], constraints["temperature"]) == (None, ["hot"])
+
+
+def test_follow_up_on_legacy_history_folds_user_messages(parser):
+    history = [
+        {"role": "user", "content": "under 150"},
+        {"role": "assistant", "content": "### Teas ..."},
+    ]
+    constraints, confidence = parser.parse("and hot", history)
+    assert (constraints["max_price"], constraints["temperature"], confidence) == (150, ["hot"], 1.0)
+
+
+def test_extractor_asks_the_llm_only_below_the_threshold(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    from app.features.cafe_chatbot.query_understanding.constraint_extractor import LLMConstraintExtractor
+
+    extractor = LLMConstraintExtractor(fast_path_min_confidence=0.9)
+
+    constraints, _ = extractor._extract_locally("cold drinks without milk below 180", None)
+    assert constraints is None
+    assert extractor.llm_calls == 1
+
+    constraints, _ = extractor._extract_locally("cold without milk below 180", None)
+    assert constraints["max_price"] == 180
+    assert constraints["milk"] == "non-milk"
+    assert extractor.fast_path_hits == 1
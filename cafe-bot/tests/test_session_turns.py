@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from app.features.cafe_chatbot.sessions.turns import SessionTurnQueue, TurnWaitTimeout, _abandon
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_turns_of_a_session_run_in_arrival_order():
+    async def scenario():
+        queue = SessionTurnQueue(timeout_seconds=1)
+        order = []
+
+        async def turn(n):
+            await queue.acquire("s1")
+            try:
+                await asyncio.sleep(0.01)
+                order.append(n)
+            finally:
+                queue.release("s1")
+
+        await asyncio.gather(*(turn(n) for n in range(3)))
+        return order, queue.stats()
+
+    order, stats = run(scenario())
+    assert order == [0, 1, 2]
+    assert stats["turns"] == 3 and stats["active_sessions"] == 0
+
+
+def test_timed_out_turn_leaves_the_lane_usable():
+    async def scenario():
+        queue = SessionTurnQueue(timeout_seconds=0.01)
+        await queue.acquire("s1")
+        with pytest.raises(TurnWaitTimeout):
+            await queue.acquire("s1")
+        queue.release("s1")
+
+        # Not left locked by the abandoned acquire
+        await queue.acquire("s1")
+        queue.release("s1")
+        return queue.stats()
+
+    stats = run(scenario())
+    assert stats["timeouts"] == 1 and stats["active_sessions"] == 0
+
+
+def test_abandoned_acquire_that_already_won_releases_the_lock():
+    async def scenario():
+        lock = asyncio.Lock()
+        acquiring = asyncio.ensure_future(lock.acquire())
+        await asyncio.sleep(0)
+        assert acquiring.done() and lock.locked()
+
+        # The race wait_for loses: the acquire succeeded, the caller gave up
+        _abandon(acquiring, lock)
+        await asyncio.sleep(0)
+        return lock.locked()
+
+    assert run(scenario()) is False
+
+
+def test_cancelled_waiter_does_not_keep_the_lock():
+    async def scenario():
+        queue = SessionTurnQueue(timeout_seconds=None)
+        await queue.acquire("s1")
+        waiter = asyncio.ensure_future(queue.acquire("s1"))
+        await asyncio.sleep(0)
+        queue.release("s1")
+        # Cancelled while its acquire is being granted
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0)
+
+        await asyncio.wait_for(queue.acquire("s1"), 1)
+        queue.release("s1")
+        return queue.stats()
+
+    assert run(scenario())["active_sessions"] == 0
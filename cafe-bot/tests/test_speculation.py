@@ -0,0 +1,48 @@
+import pytest
+
+from app.features.cafe_chatbot.chatbot import CafeChatbot, search_filters
+from app.features.cafe_chatbot.query_understanding.rule_parser import empty_constraints
+
+
+def constraints(**values):
+    return dict(empty_constraints(), **values)
+
+
+@pytest.mark.parametrize("message, values, plan", [
+    ("list everything vegan under 200", {"max_price": 200, "diet": ["vegan"]}, "structured"),
+    ("something refreshing", {}, "speculative"),
+    # The hint is in the message, but only a routed search stays in its shards
+    ("cold coffee please", {"category_hint": "coffee", "temperature": ["cold"]}, "hint_search"),
+    ("and cheaper ones", {"category_hint": "drinks", "max_price": 150}, "hint_search"),
+])
+def test_plan(message, values, plan):
+    assert CafeChatbot._plan(message, constraints(**values)) == plan
+
+
+# top_k stays within the items the hash embedding scores above zero: FAISS
+# orders exact-zero ties differently for different k
+@pytest.mark.parametrize("query, values", [
+    ("iced hazelnut", {}),
+    ("robusta iced hazelnut latte", {"max_price": 200}),
+    ("lemon iced tea black", {"diet": ["vegan"]}),
+    ("Cranberry Tonic", {"max_price": 260}),
+    ("hazelnut", {"temperature": ["cold"], "milk": "milk", "min_price": 150}),
+])
+def test_speculative_pool_resolves_like_the_filtered_search(retriever, query, values):
+    filters = search_filters(constraints(**values))
+
+    resolved = retriever.speculate(query).resolve(top_k=5, **filters)
+    searched = retriever.search(query, top_k=5, **filters)
+
+    assert resolved is not None
+    assert [r["item_id"] for r in resolved] == [r["item_id"] for r in searched]
+
+
+def test_temperature_and_milk_reach_the_hybrid_search(retriever):
+    filters = search_filters(constraints(temperature=["cold"], milk="non-milk"))
+    allowed = {r["item_id"] for r in retriever.list_items(**filters)}
+
+    results = retriever.search("coffee", top_k=50, **filters)
+
+    assert results
+    assert {r["item_id"] for r in results} <= allowed